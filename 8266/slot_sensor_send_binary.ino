@@ -0,0 +1,168 @@
+#include <ESP8266WiFi.h>
+#include <WiFiUdp.h>
+
+extern "C" {
+  #include "user_interface.h"  // 用于设置 WiFi 轻睡眠
+}
+
+// --- WiFi 配置 ---
+const char* ssid = "YourSSID";
+const char* password = "YourPassword";
+
+// --- UDP 配置 ---
+const char* udpServerIP = "yourServerIP";
+const int udpPort = 8888;
+
+WiFiUDP udp;
+
+// --- 传感器配置 ---
+#define SENSOR_PIN 14  // D5 = GPIO14
+
+// --- 二进制数据包格式 v1 (小端序，与 server-refactor/services/wire_format.py 一致) ---
+// 头部 16 字节: "SM" | version u8 | 事件数 u8 | 设备ID u32 | 序号 u32 | 发送时 millis u32
+// 事件 12 字节: 类型 u8 | 保留(3) | 事件时 millis u32 | 遮挡时长 us u32
+#define PACKET_VERSION 1
+#define EVENT_BLOCK 1
+#define EVENT_HEARTBEAT 2
+#define HEADER_SIZE 16
+#define EVENT_SIZE 12
+#define MAX_EVENTS 16  // 每个数据包最多缓存的事件数
+
+uint8_t packet[HEADER_SIZE + MAX_EVENTS * EVENT_SIZE];
+uint8_t eventCount = 0;
+uint32_t sequence = 0;
+uint32_t deviceId = 0;
+
+// --- 状态变量 ---
+bool isBlocking = false;
+unsigned long blockStartTime = 0;
+unsigned long lastSendTime = 0;
+const unsigned long sendInterval = 200;  // 心跳每200ms发送一次
+bool blockPending = false;  // 本轮循环记录了遮挡事件，需要立即发送
+
+void writeU32(uint8_t* buf, uint32_t value) {
+  buf[0] = value & 0xFF;
+  buf[1] = (value >> 8) & 0xFF;
+  buf[2] = (value >> 16) & 0xFF;
+  buf[3] = (value >> 24) & 0xFF;
+}
+
+void addEvent(uint8_t type, uint32_t eventMs, uint32_t durationUs) {
+  uint8_t* e = packet + HEADER_SIZE + eventCount * EVENT_SIZE;
+  e[0] = type;
+  e[1] = e[2] = e[3] = 0;
+  writeU32(e + 4, eventMs);
+  writeU32(e + 8, durationUs);
+  eventCount++;
+}
+
+void setup() {
+  Serial.begin(115200);
+  pinMode(SENSOR_PIN, INPUT);
+  pinMode(LED_BUILTIN, OUTPUT);
+  digitalWrite(LED_BUILTIN, HIGH);  // 熄灭LED（低电平点亮）
+
+  delay(200);
+
+  deviceId = ESP.getChipId();  // 使用芯片ID作为设备ID
+
+  Serial.println("[INFO] Booting...");
+  WiFi.begin(ssid, password);
+  Serial.print("[INFO] Connecting to WiFi");
+
+  int attempts = 0;
+  while (WiFi.status() != WL_CONNECTED && attempts < 20) {
+    delay(500);
+    Serial.print(".");
+    attempts++;
+  }
+  Serial.println();
+
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("[ERROR] WiFi not connected.");
+    return;
+  }
+
+  Serial.println("[INFO] WiFi connected.");
+  Serial.print("IP: "); Serial.println(WiFi.localIP());
+  Serial.printf("[INFO] Device ID: %u\n", deviceId);
+
+  // 开启轻休眠
+  wifi_set_sleep_type(LIGHT_SLEEP_T);
+
+  if (!udp.begin(udpPort)) {
+    Serial.println("[ERROR] UDP start failed.");
+  } else {
+    Serial.println("[INFO] UDP socket ready.");
+  }
+}
+
+void loop() {
+  int val = digitalRead(SENSOR_PIN);
+
+  // --- 遮挡检测 ---
+  if (val == HIGH && !isBlocking) {
+    isBlocking = true;
+    blockStartTime = micros();
+    digitalWrite(LED_BUILTIN, LOW);  // 点亮LED（遮挡时）
+  } else if (val == LOW && isBlocking) {
+    isBlocking = false;
+    unsigned long blockDuration = micros() - blockStartTime;
+
+    Serial.printf("[EVENT] 遮挡时间：%lu us\n", blockDuration);
+
+    digitalWrite(LED_BUILTIN, HIGH);  // 熄灭LED
+
+    // 缓存满时(WiFi断开期间)先发出旧事件，避免越界
+    if (eventCount >= MAX_EVENTS - 1) {
+      sendPacket();
+    }
+    addEvent(EVENT_BLOCK, millis(), blockDuration);
+    blockPending = true;
+  }
+
+  // --- UDP 发送: 遮挡事件在本轮循环立即发出，不等下一次心跳；到期的心跳合并进同一个数据包 ---
+  if (WiFi.status() == WL_CONNECTED) {
+    unsigned long now = millis();
+    bool heartbeatDue = now - lastSendTime >= sendInterval;
+    if (heartbeatDue) {
+      addEvent(EVENT_HEARTBEAT, now, 0);
+      lastSendTime = now;
+    }
+    if (heartbeatDue || blockPending) {
+      sendPacket();
+      blockPending = false;
+    }
+  } else {
+    Serial.println("[WARN] WiFi lost.");
+    delay(300);
+  }
+
+  // --- 低功耗延时控制 ---
+  if (!isBlocking) {
+    delay(5);  // 小延迟降低 CPU 活跃度
+  } else {
+    delayMicroseconds(200);  // 遮挡期间高频轮询
+  }
+}
+
+// --- 发送缓存的事件 ---
+void sendPacket() {
+  packet[0] = 'S';
+  packet[1] = 'M';
+  packet[2] = PACKET_VERSION;
+  packet[3] = eventCount;
+  writeU32(packet + 4, deviceId);
+  writeU32(packet + 8, sequence++);
+  writeU32(packet + 12, millis());
+
+  if (udp.beginPacket(udpServerIP, udpPort)) {
+    udp.write(packet, HEADER_SIZE + eventCount * EVENT_SIZE);
+    if (udp.endPacket() != 1) {
+      Serial.println("[UDP ERROR] endPacket() failed.");
+    }
+  } else {
+    Serial.println("[UDP ERROR] beginPacket() failed.");
+  }
+  eventCount = 0;
+}
@@ -81,7 +81,8 @@ void loop() {
 
     digitalWrite(LED_BUILTIN, HIGH);  // 熄灭LED
 
-    String msg = "遮挡时间: " + String(blockMs, 3) + " ms";
+    // 附带遮挡结束时的设备时间，服务器按设备时钟计算圈间隔
+    String msg = "遮挡时间: " + String(blockMs, 3) + " ms @ " + String(millis());
     sendUDP(msg);
   }
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+离线会话分析工具
+从圈速日志载入已记录的会话，用新的物理常数(默认取当前配置)重算速度和圈用时，
+输出各会话的稳定性、圈速分布和每个k的最快连续k圈对比；--apply 时把重算结果写回日志
+
+用法:
+    python analyze_sessions.py --latest 5
+    python analyze_sessions.py --session <会话ID> --radius-r1 0.036 --apply
+    python analyze_sessions.py --device 192.168.1.50:4210 --max-k 20 --json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from config import settings
+
+try:
+    import numpy as np
+    from services import session_analysis
+except ImportError:
+    print("❌ 需要安装NumPy: pip install numpy")
+    sys.exit(1)
+
+# 最快连续k圈的k上限: 每个k都要扫描一遍所有圈，k过大时耗时随会话长度平方增长
+MAX_K = 100
+
+
+def print_report(report: dict, recompute_info: dict):
+    """输出文本报告"""
+    print(f"📊 重算 {recompute_info['laps']} 圈，耗时 {recompute_info['elapsed_ms']:.1f}ms "
+          f"(载入 {recompute_info['load_ms']:.0f}ms)")
+    print(f"   圈用时与记录不一致: {recompute_info['lap_time_changed']} 圈，"
+          f"速度变化: {recompute_info['speed_ratio']:.4f} 倍")
+
+    for session in report['sessions']:
+        lap_time = session['lap_time']
+        consistency = session['consistency']
+        print(f"\n🏁 会话 {session['session']} ({session['device']})")
+        print(f"   圈数: {session['laps']}，总用时: {session['total_time']:.3f}s，"
+              f"平均速度: {session['speed']['mean']:.2f}m/s，最高速度: {session['speed']['max']:.2f}m/s")
+        print(f"   圈用时: 平均 {lap_time['mean']:.3f}s ± {lap_time['std']:.3f}，"
+              f"p10/p50/p90 {lap_time['p10']:.3f}/{lap_time['p50']:.3f}/{lap_time['p90']:.3f}s，"
+              f"最快 {lap_time['min']:.3f}s，最慢 {lap_time['max']:.3f}s")
+        print(f"   稳定性: 变异系数 {consistency['cv']}，四分位距/中位数 {consistency['iqr_ratio']}")
+        histogram = ' '.join(f"{share * 100:4.0f}%" for share in session['pace_histogram'])
+        print(f"   圈速分布: {histogram}")
+        windows = [w for w in session['best_windows'] if w]
+        print("   最快连续k圈: " + '，'.join(
+            f"k={w['k']} {w['total']:.3f}s(第{w['start_lap']}-{w['end_lap']}圈)" for w in windows))
+
+    edges = report['pace_edges']
+    print(f"\n📐 圈速分布分桶: {edges[0]:.3f}s - {edges[-1]:.3f}s，共 {len(edges) - 1} 桶")
+    if report['best_by_k']:
+        print("🏆 每个k的最快会话: " + '，'.join(
+            f"k={item['k']} {item['total']:.3f}s({item['session'][:8]})" for item in report['best_by_k']))
+    if report['consistency_ranking']:
+        print("🎯 稳定性排名: " + ' > '.join(session[:8] for session in report['consistency_ranking']))
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    try:
+        data = session_analysis.load_sessions(args.db, sessions=args.session, device=args.device,
+                                              latest=args.latest)
+    except Exception as e:
+        print(f"❌ 无法读取圈速日志 {args.db}: {e}")
+        sys.exit(1)
+    load_ms = (time.perf_counter() - start) * 1000
+    if not data.ids:
+        print("⚠️ 没有符合条件的会话")
+        return
+
+    start = time.perf_counter()
+    result = session_analysis.recompute(data, args.distance_l, args.radius_r1, args.radius_r2)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    recorded = data.speed[data.speed > 0]
+    recomputed = result['speed'][data.speed > 0]
+    recompute_info = {
+        'laps': int(len(data.lap_number)),
+        'load_ms': round(load_ms, 1),
+        'elapsed_ms': round(elapsed_ms, 3),
+        'lap_time_changed': int(np.count_nonzero(np.abs(result['lap_time'] - data.lap_time) > 1e-6)),
+        'speed_ratio': float(np.median(recomputed / recorded)) if len(recorded) else 1.0
+    }
+
+    report = session_analysis.analyze(data, result['lap_time'], result['speed'], max_k=args.max_k, bins=args.bins)
+
+    if args.json:
+        print(json.dumps({'recompute': recompute_info, **report}, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, recompute_info)
+
+    if args.apply:
+        updated = session_analysis.apply_recompute(args.db, data, result)
+        print(f"✅ 已写回 {updated} 圈", file=sys.stderr if args.json else sys.stdout)
+
+
+def _max_k(value: str) -> int:
+    k = int(value)
+    if not 1 <= k <= MAX_K:
+        raise argparse.ArgumentTypeError(f"取值范围为1-{MAX_K}: {value}")
+    return k
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="离线会话分析与重算")
+    parser.add_argument('--db', default=settings.lap_log_path, help="圈速日志数据库路径")
+    parser.add_argument('--session', action='append', help="会话ID，可重复指定")
+    parser.add_argument('--device', help="只分析该设备的会话")
+    parser.add_argument('--latest', type=int, help="只分析最近的N个会话")
+    parser.add_argument('--distance-l', type=float, default=settings.distance_l, help="遮挡距离(毫米)")
+    parser.add_argument('--radius-r1', type=float, default=settings.radius_r1, help="小半径(厘米)")
+    parser.add_argument('--radius-r2', type=float, default=settings.radius_r2, help="大半径(米)")
+    parser.add_argument('--max-k', type=_max_k, default=10, help=f"计算最快连续k圈的最大k(1-{MAX_K})")
+    parser.add_argument('--bins', type=int, default=10, help="圈速分布的分桶数")
+    parser.add_argument('--json', action='store_true', help="以JSON输出")
+    parser.add_argument('--apply', action='store_true', help="把重算的圈用时、累计时间和速度写回日志")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+圈速日志写入压测脚本
+模拟持续写入，测量事件循环侧的入队耗时和后台线程的落盘吞吐
+用法: python bench_lap_log.py [圈数] [fsync策略]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from services.lap_log import LapLog
+
+
+def run_benchmark(total_laps: int = 200_000, fsync: str = 'normal'):
+    """执行压测"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # 入队比落盘快得多，积压上限放宽到总圈数，测量的是不丢弃时的吞吐
+        lap_log = LapLog(os.path.join(tmp, 'bench.db'), flush_interval=0.05, fsync=fsync,
+                         max_pending=total_laps + 1)
+        lap_log.start()
+
+        print(f"🚀 写入 {total_laps} 圈 (fsync: {fsync})...")
+        lap_log.append_session('bench', 'bench-device', 0)
+        start = time.perf_counter()
+        for lap_number in range(1, total_laps + 1):
+            lap_log.append_lap('bench', 'bench-device', lap_number, 1.234, lap_number * 1.234,
+                               lap_number, 10.5, 1223.5, 12.34)
+        enqueue_elapsed = time.perf_counter() - start
+
+        # 等待后台线程写完
+        while lap_log.pending:
+            time.sleep(0.01)
+        lap_log.stop()
+        total_elapsed = time.perf_counter() - start
+
+        print(f"📊 入队耗时: {enqueue_elapsed * 1e9 / total_laps:.0f} ns/圈")
+        print(f"📊 落盘吞吐: {total_laps / total_elapsed:,.0f} 圈/秒 "
+              f"({lap_log.flushes} 批, {lap_log.errors} 次错误, {lap_log.dropped} 条丢弃)")
+
+
+if __name__ == "__main__":
+    laps = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    mode = sys.argv[2] if len(sys.argv) > 2 else 'normal'
+    run_benchmark(laps, mode)
@@ -7,9 +7,61 @@ class Settings(BaseSettings):
     port: int = 8000
     debug: bool = True
     
+    # 部署模式: single(单进程) / split(UDP采集进程 + 多个Web进程，见 ingest_main.py)
+    deployment_mode: str = "single"
+    ingest_socket_path: str = "data/ingest.sock"  # 采集进程与Web进程之间的Unix域套接字
+    ingest_metrics_port: int = 9101  # 分进程部署时采集进程的/metrics端口，0为不启用
+    
     # UDP服务器配置
     udp_host: str = "0.0.0.0"
     udp_port: int = 8888
+    ingest_queue_size: int = 1024  # 每个设备的接收队列长度，满时丢弃新数据包
+    ingest_batch_size: int = 64  # 每批处理的数据包数
+    
+    # WebSocket发送配置
+    ws_send_queue_size: int = 256  # 每个客户端的发送队列长度
+    ws_slow_client_policy: str = "drop_oldest"  # drop_oldest / conflate / disconnect
+    ws_replay_buffer_size: int = 4096  # 断线重连补发用的最近广播消息数，0为不补发(重连时总是发送快照)
+    
+    # 多设备配置
+    device_idle_timeout: float = 600.0  # 设备空闲回收超时(秒)
+    device_sweep_interval: float = 30.0  # 空闲设备检查间隔(秒)
+    
+    # 设备时钟同步（根据心跳估计设备时钟偏移和漂移，圈用时按设备时间计算）
+    clock_sync_enabled: bool = True
+    clock_sync_window: float = 300.0  # 参与估计的时间窗口(秒)
+    clock_sync_min_samples: int = 8  # 开始把设备时间换算为服务器时间前需要的样本数
+    
+    # 圈速历史配置
+    lap_history_capacity: int = 100000  # 每个设备内存中保留的最大圈数
+    
+    # 持久化日志配置
+    lap_log_enabled: bool = True
+    lap_log_path: str = "data/laps.db"
+    lap_log_flush_interval: float = 0.5  # 批量写入间隔(秒)
+    lap_log_fsync: str = "normal"  # off / normal / full
+    lap_log_max_pending: int = 100000  # 磁盘卡顿时最多积压的待写圈和事件数，超出后丢弃新记录
+    
+    # 静态资源配置（启动时载入内存并预压缩）
+    static_gzip_level: int = 9  # 预压缩只做一次，使用最高压缩级别
+    static_brotli_quality: int = 11  # 需要安装brotli包
+    static_check_interval: float = 2.0  # 检查文件变化的间隔(秒)，0为只在启动时加载
+    
+    # 会话导出配置
+    export_batch_size: int = 1000  # CSV/NDJSON每批读取的圈数
+    export_gzip_level: int = 6  # 客户端支持gzip时的压缩级别(1-9)
+    
+    # 检查点配置（需要启用持久化日志）
+    checkpoint_enabled: bool = True  # 重启时从检查点恢复设备状态
+    checkpoint_interval: float = 5.0  # 有新圈的设备保存检查点的间隔(秒)
+    checkpoint_max_gap: float = 30.0  # 停机超过该秒数时，恢复后的下一个数据包重新作为首次数据
+    
+    # 日志配置
+    log_level: str = "INFO"
+    log_format: str = "text"  # text / json(结构化)
+    log_file: str = ""  # 日志文件路径，为空时只输出到控制台
+    log_rate_limit: float = 20.0  # 每条日志模板每秒最多输出的条数，0为不限频
+    log_queue_size: int = 10000  # 日志队列长度，满时丢弃
     
     # 物理常量
     distance_l: float = 3.0  # milimeters
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+UDP采集进程 - 分进程部署模式
+独占UDP服务器和设备数据处理器，通过Unix域套接字把广播消息发布给uvicorn Web进程，
+并执行Web进程转发回来的控制命令。Web进程需设置 DEPLOYMENT_MODE=split
+
+用法:
+    python ingest_main.py
+    DEPLOYMENT_MODE=split uvicorn main:app --workers 4 --host 0.0.0.0 --port 8000
+或使用 python start.py --split 4 同时启动
+"""
+
+import asyncio
+import logging
+import signal
+
+from config import settings
+from services import metrics
+from services.ingest_channel import IngestPublisher
+from services.ingest_pipeline import IngestPipeline
+from services.logging_setup import setup_logging
+
+logger = logging.getLogger("ingest")
+
+
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """最简HTTP服务，任意请求都返回Prometheus格式的采集进程指标"""
+    try:
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        body = metrics.render().encode('utf-8')
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     + f"Content-Type: {metrics.CONTENT_TYPE}\r\n".encode()
+                     + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                     + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_ingest():
+    """运行采集进程直到收到退出信号"""
+    publisher = IngestPublisher(settings.ingest_socket_path)
+    pipeline = IngestPipeline(publisher)
+    publisher.on_command = pipeline.command_handler.handle
+    publisher.on_request = pipeline.command_handler.handle_request
+
+    await publisher.start()
+    await pipeline.start()
+    metrics_server = None
+    if settings.ingest_metrics_port:
+        metrics_server = await asyncio.start_server(serve_metrics, settings.host, settings.ingest_metrics_port)
+        logger.info("采集进程指标: http://%s:%d/metrics", settings.host, settings.ingest_metrics_port)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    await stop_event.wait()
+
+    logger.info("关闭采集进程...")
+    if metrics_server:
+        metrics_server.close()
+    await pipeline.stop()
+    await publisher.stop()
+
+
+if __name__ == "__main__":
+    log_pipeline = setup_logging(
+        level=settings.log_level,
+        log_format=settings.log_format,
+        log_file=settings.log_file,
+        rate_limit=settings.log_rate_limit,
+        queue_size=settings.log_queue_size
+    )
+    metrics.LOGS_DROPPED.set_function(lambda: log_pipeline.queue_handler.dropped)
+    metrics.LOGS_SUPPRESSED.set_function(lambda: log_pipeline.stats()['suppressed'])
+    try:
+        asyncio.run(run_ingest())
+    finally:
+        log_pipeline.stop()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+多设备UDP压测脚本
+模拟N个传感器按设定频率发送遮挡事件和心跳（支持抖动、突发和丢包），
+同时作为WebSocket客户端接收lap_data，按设备和遮挡时长匹配回发送时刻，
+统计吞吐、丢失率以及从UDP发送到WebSocket接收的p50/p99/p999延迟
+
+用法: python load_test.py --devices 50 --lap-rate 5 --duration 30
+需要服务器已启动 (python main.py)
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+from typing import Dict, List, Tuple
+
+import websockets
+
+from services import wire_format
+
+# 遮挡时长(微秒)编码事件序号，用于把lap_data匹配回发送时刻
+BLOCK_BASE_US = 9000
+BLOCK_SPAN_US = 3000
+
+
+class LoadStats:
+    """压测统计"""
+
+    def __init__(self):
+        self.pending: Dict[Tuple[str, int], float] = {}  # (设备, 遮挡时长us) -> 发送时刻
+        self.latencies: List[float] = []  # 毫秒
+        self.packets_sent = 0
+        self.packets_lost = 0  # 模拟丢弃、未发送的数据包
+        self.events_sent = 0
+        self.events_lost = 0
+        self.first_events = 0  # 每个设备的首个事件只做初始化，不产生圈
+        self.laps_received = 0
+        self.unmatched = 0
+
+
+class SimulatedDevice:
+    """模拟的传感器设备"""
+
+    def __init__(self, sensor_id: int, args, stats: LoadStats):
+        self.sensor_id = sensor_id
+        self.args = args
+        self.stats = stats
+        self.binary = args.format == 'binary'
+        self.seq = 0
+        self.event_index = 0
+        self.started = time.perf_counter()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.connect((args.host, args.udp_port))
+        # 文本格式按UDP来源地址区分设备
+        if self.binary:
+            self.device_id = f"sensor-{sensor_id}"
+        else:
+            host, port = self.socket.getsockname()
+            self.device_id = f"{host}:{port}"
+
+    def device_ms(self) -> int:
+        """模拟的设备时间(millis)"""
+        return int((time.perf_counter() - self.started) * 1000)
+
+    def next_duration_us(self) -> int:
+        """生成下一个遮挡时长，同时作为事件标识"""
+        duration_us = BLOCK_BASE_US + self.event_index % BLOCK_SPAN_US
+        self.event_index += 1
+        return duration_us
+
+    def send(self, payload: bytes, durations: List[int]):
+        """发送数据包（按丢包率模拟丢弃）并记录其中遮挡事件的发送时刻"""
+        self.stats.events_sent += len(durations)
+        if random.random() < self.args.loss:
+            self.stats.packets_lost += 1
+            self.stats.events_lost += len(durations)
+            return
+
+        sent_at = time.perf_counter()
+        for duration_us in durations:
+            self.stats.pending[(self.device_id, duration_us)] = sent_at
+        try:
+            self.socket.send(payload)
+        except (BlockingIOError, ConnectionRefusedError):
+            self.stats.packets_lost += 1
+            self.stats.events_lost += len(durations)
+            return
+        self.stats.packets_sent += 1
+
+    def send_blocks(self, count: int):
+        """发送count个遮挡事件，二进制格式合并为一个数据包"""
+        durations = [self.next_duration_us() for _ in range(count)]
+        if self.binary:
+            now_ms = self.device_ms()
+            events = [(wire_format.EVENT_BLOCK, now_ms, duration_us) for duration_us in durations]
+            self.send(wire_format.pack(self.sensor_id, self.seq, now_ms, events), durations)
+            self.seq += 1
+        else:
+            for duration_us in durations:
+                self.send(f"{duration_us / 1000}".encode('utf-8'), [duration_us])
+
+    def send_heartbeat(self):
+        """发送心跳"""
+        now_ms = self.device_ms()
+        if self.binary:
+            events = [(wire_format.EVENT_HEARTBEAT, now_ms, 0)]
+            self.send(wire_format.pack(self.sensor_id, self.seq, now_ms, events), [])
+            self.seq += 1
+        else:
+            self.send(f"Time: {now_ms} ms".encode('utf-8'), [])
+
+    async def run_events(self, deadline: float):
+        """按设定频率发送遮挡事件，带抖动和突发"""
+        interval = 1 / self.args.lap_rate
+        # 错开各设备的起始时刻
+        await asyncio.sleep(random.uniform(0, interval))
+        while time.perf_counter() < deadline:
+            burst = self.args.burst_size if random.random() < self.args.burst_prob else 1
+            self.send_blocks(burst)
+            jitter = random.uniform(-self.args.jitter, self.args.jitter) / 1000
+            await asyncio.sleep(max(interval * burst + jitter, 0.001))
+
+    async def run_heartbeats(self, deadline: float):
+        """按固定间隔发送心跳"""
+        interval = self.args.heartbeat_interval / 1000
+        while time.perf_counter() < deadline:
+            self.send_heartbeat()
+            await asyncio.sleep(interval)
+
+    def close(self):
+        self.socket.close()
+
+
+async def receive_laps(ws, stats: LoadStats):
+    """接收lap_data并匹配发送时刻"""
+    async for raw in ws:
+        received_at = time.perf_counter()
+        message = json.loads(raw)
+        if message.get('type') != 'lap_data':
+            continue
+        stats.laps_received += 1
+        key = (message.get('device'), round(message['measurement'] * 1000))
+        sent_at = stats.pending.pop(key, None)
+        if sent_at is None:
+            stats.unmatched += 1
+        else:
+            stats.latencies.append((received_at - sent_at) * 1000)
+
+
+async def wait_for(ws, message_type: str, timeout: float = 5.0) -> dict:
+    """等待指定类型的消息"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        raw = await asyncio.wait_for(ws.recv(), max(deadline - time.perf_counter(), 0.01))
+        message = json.loads(raw)
+        if message.get('type') == message_type:
+            return message
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def print_report(stats: LoadStats, elapsed: float, server: dict):
+    """输出压测结果"""
+    expected = stats.events_sent - stats.events_lost - stats.first_events
+    missing = max(expected - len(stats.latencies), 0)
+    latencies = sorted(stats.latencies)
+
+    print("\n📊 压测结果")
+    print(f"  发送: {stats.packets_sent} 个数据包, {stats.events_sent} 个遮挡事件, "
+          f"{stats.packets_sent / elapsed:,.0f} 包/秒")
+    print(f"  模拟丢包: {stats.packets_lost} 个数据包 ({stats.events_lost} 个事件)")
+    print(f"  接收: {stats.laps_received} 圈, {stats.laps_received / elapsed:,.0f} 圈/秒, "
+          f"未匹配 {stats.unmatched}")
+    if expected > 0:
+        print(f"  丢失率: {missing / expected:.3%} ({missing}/{expected}, 不含模拟丢包)")
+    if latencies:
+        print(f"  延迟(ms): p50 {percentile(latencies, 50):.2f}  p99 {percentile(latencies, 99):.2f}  "
+              f"p999 {percentile(latencies, 99.9):.2f}  max {latencies[-1]:.2f}")
+    if server:
+        print(f"  服务器接收队列: {server}")
+
+
+async def run_load_test(args):
+    """执行压测"""
+    stats = LoadStats()
+    base_id = args.base_sensor_id or random.randint(1, 1 << 30)
+    devices = [SimulatedDevice(base_id + i, args, stats) for i in range(args.devices)]
+    stats.first_events = len(devices)
+
+    print(f"🚀 模拟 {args.devices} 个设备 ({args.format}), 每设备 {args.lap_rate} 圈/秒, "
+          f"心跳 {args.heartbeat_interval}ms, 持续 {args.duration}秒")
+    print(f"📡 UDP {args.host}:{args.udp_port}  WebSocket {args.ws_url}")
+
+    async with websockets.connect(args.ws_url, max_size=None) as ws:
+        # 开启监测（同时作为新设备的默认状态）
+        await ws.send(json.dumps({'type': 'start_monitoring'}))
+        await wait_for(ws, 'monitoring_started')
+
+        receiver = asyncio.create_task(receive_laps(ws, stats))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        senders = []
+        for device in devices:
+            senders.append(asyncio.create_task(device.run_events(deadline)))
+            if args.heartbeat_interval > 0:
+                senders.append(asyncio.create_task(device.run_heartbeats(deadline)))
+        await asyncio.gather(*senders)
+        elapsed = time.perf_counter() - start
+
+        # 等待在途数据
+        await asyncio.sleep(args.drain)
+        receiver.cancel()
+
+        server = {}
+        try:
+            await ws.send(json.dumps({'type': 'list_devices'}))
+            server = (await wait_for(ws, 'device_list')).get('ingest', {})
+        except asyncio.TimeoutError:
+            pass
+
+    for device in devices:
+        device.close()
+    print_report(stats, elapsed, server)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多设备UDP压测")
+    parser.add_argument('--host', default='127.0.0.1', help="UDP服务器地址")
+    parser.add_argument('--udp-port', type=int, default=8888)
+    parser.add_argument('--ws-url', default='ws://127.0.0.1:8000/ws')
+    parser.add_argument('--devices', type=int, default=10, help="模拟设备数")
+    parser.add_argument('--duration', type=float, default=10.0, help="发送时长(秒)")
+    parser.add_argument('--lap-rate', type=float, default=2.0, help="每个设备每秒的遮挡事件数")
+    parser.add_argument('--heartbeat-interval', type=float, default=200.0, help="心跳间隔(毫秒)，0为不发送")
+    parser.add_argument('--jitter', type=float, default=20.0, help="事件间隔抖动(±毫秒)")
+    parser.add_argument('--burst-prob', type=float, default=0.02, help="突发概率")
+    parser.add_argument('--burst-size', type=int, default=5, help="突发时连续发送的事件数")
+    parser.add_argument('--loss', type=float, default=0.0, help="模拟丢包率(0-1)")
+    parser.add_argument('--format', choices=('binary', 'text'), default='binary', help="数据包格式")
+    parser.add_argument('--base-sensor-id', type=int, default=0, help="起始设备ID，默认随机")
+    parser.add_argument('--drain', type=float, default=2.0, help="发送结束后等待接收的时间(秒)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_load_test(parse_args()))
+    except KeyboardInterrupt:
+        print("\n🛑 检测到停止信号")
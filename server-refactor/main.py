@@ -4,161 +4,108 @@
 支持暂停/继续监测功能
 """
 
+import atexit
 import json
 import time
 import logging
+import sqlite3
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from typing import Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 import uvicorn
 
 from config import settings
-from services.udp_server import UDPServer
-from services.data_processor import DataProcessor
-from services.websocket_manager import WebSocketManager
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from services import export, metrics
+from services.history import LapHistory
+from services.ingest_channel import IngestSubscriber
+from services.ingest_pipeline import IngestPipeline
+from services.websocket_manager import WebSocketManager, parse_topics
+from services.logging_setup import setup_logging
+from services.static_assets import StaticAssets
+
+# 配置日志（后台线程输出，按模板限频）
+log_pipeline = setup_logging(
+    level=settings.log_level,
+    log_format=settings.log_format,
+    log_file=settings.log_file,
+    rate_limit=settings.log_rate_limit,
+    queue_size=settings.log_queue_size
 )
+atexit.register(log_pipeline.stop)
 logger = logging.getLogger(__name__)
 
 # 全局变量
-udp_server = None
 websocket_manager = None
-data_processor = None
+lap_history = None
+ingest_pipeline = None  # 单进程模式: 本进程内的采集管道
+ingest_subscriber = None  # 分进程模式: 连接采集进程的订阅者
+static_assets = StaticAssets("static", settings.static_gzip_level, settings.static_brotli_quality)
 
 
 async def handle_websocket_message(message: dict, websocket: WebSocket):
-    """处理WebSocket消息"""
-    message_type = message.get('type')
-
-    if message_type == 'reset_data':
-        # 重置后端数据
-        if data_processor:
-            data_processor.reset_data()
-            # 重置后不自动开启监测，保持当前状态或关闭状态
-            data_processor.set_monitoring(False)
-
-            # 获取重置原因
-            reset_reason = message.get('reason', 'unknown')
-            logger.info(f"后端数据已重置，原因: {reset_reason}，监测状态: 关闭")
-
-            # 发送确认消息给客户端
-            reason_text = {
-                'auto_reset': '自动重置',
-                'manual_reset': '手动重置',
-                'page_unload': '页面卸载重置',
-                'unknown': '重置'
-            }.get(reset_reason, '重置')
-
-            await websocket_manager.send_data({
-                'type': 'reset_confirm',
-                'message': f'后端数据已{reason_text}，从第0圈开始，请手动启动检测',
-                'reason': reset_reason,
-                'timestamp': time.time() * 1000
-            })
-
-    elif message_type == 'start_monitoring':
-        # 开始监测
-        if data_processor:
-            data_processor.set_monitoring(True)
-            logger.info("开始监测")
-
-            await websocket_manager.send_data({
-                'type': 'monitoring_started',
-                'message': '监测已开始',
-                'timestamp': time.time() * 1000
-            })
-
-    elif message_type == 'stop_monitoring':
-        # 停止监测（暂停）
-        if data_processor:
-            data_processor.set_monitoring(False)
-            logger.info("停止监测（暂停）")
-
-            await websocket_manager.send_data({
-                'type': 'monitoring_stopped',
-                'message': '监测已暂停，数据保持连续',
-                'timestamp': time.time() * 1000
-            })
-
-    elif message_type == 'update_lap_count':
-        # 更新统计圈数
-        lap_count = message.get('lap_count')
-        if data_processor and lap_count:
-            success = data_processor.set_lap_count(lap_count)
-
-            if success:
-                await websocket_manager.send_data({
-                    'type': 'lap_count_updated',
-                    'message': f'统计圈数已更新为 {lap_count}',
-                    'lap_count': lap_count,
-                    'timestamp': time.time() * 1000
-                })
-                logger.info(f"圈数设置已更新为: {lap_count}")
-            else:
-                await websocket_manager.send_data({
-                    'type': 'error',
-                    'message': '无效的圈数设置，请输入1-10之间的数字',
-                    'timestamp': time.time() * 1000
-                })
-
-    elif message_type == 'request_current_stats':
-        # 请求当前统计数据
-        if data_processor:
-            if len(data_processor.lap_times) > 0:
-                current_stats = data_processor._get_laps_stats()
-                await websocket_manager.send_data({
-                    'type': 'current_stats',
-                    'laps_stats': current_stats,
-                    'current_lap': data_processor.lap_count,
-                    'total_time': data_processor.total_time,
-                    'timestamp': time.time() * 1000
-                })
-                logger.info("已发送当前统计数据")
-            else:
-                # 没有数据时发送空状态
-                await websocket_manager.send_data({
-                    'type': 'current_stats',
-                    'laps_stats': None,
-                    'current_lap': 0,
-                    'total_time': 0.0,
-                    'timestamp': time.time() * 1000
-                })
-                logger.info("发送空状态数据")
-        else:
-            logger.warning("数据处理器未初始化")
-
-    else:
-        logger.warning("未知的消息类型: %s", message_type)
+    """处理WebSocket消息，应答只发送给该客户端"""
+    async def reply(data: dict):
+        await websocket_manager.send_to(websocket, data)
+
+    if message.get('type') == 'subscribe':
+        # 订阅在本进程内处理，替换客户端的订阅条件
+        topics = websocket_manager.subscribe(websocket, parse_topics(
+            message.get('devices'), message.get('sessions'), message.get('types')))
+        if topics is not None:
+            await reply({'type': 'subscribed',
+                         **{f"{field}s": sorted(values) if values else None for field, values in topics.items()}})
+    elif ingest_subscriber:
+        # 分进程部署：转发给采集进程执行
+        await ingest_subscriber.send_command(message, reply)
+    elif ingest_pipeline:
+        await ingest_pipeline.command_handler.handle(message, reply)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global udp_server, websocket_manager, data_processor
+    global websocket_manager, lap_history, ingest_pipeline, ingest_subscriber
 
     # 启动时初始化
-    logger.info("启动速度监测系统...")
+    logger.info("启动速度监测系统(部署模式: %s)...", settings.deployment_mode)
+    static_assets.load()
+    static_assets.start(settings.static_check_interval)
 
     # 创建服务实例
-    websocket_manager = WebSocketManager()
-    data_processor = DataProcessor(websocket_manager)
-    udp_server = UDPServer(data_processor)
-
-    # 启动UDP服务器
-    await udp_server.start()
-    logger.info(f"UDP服务器启动在 {settings.udp_host}:{settings.udp_port}")
+    websocket_manager = WebSocketManager(
+        queue_size=settings.ws_send_queue_size,
+        slow_client_policy=settings.ws_slow_client_policy,
+        replay_size=settings.ws_replay_buffer_size
+    )
+    await websocket_manager.start()
+    metrics.WS_CLIENTS.set_function(lambda: websocket_manager.connection_count)
+    metrics.LOGS_DROPPED.set_function(lambda: log_pipeline.queue_handler.dropped)
+    metrics.LOGS_SUPPRESSED.set_function(lambda: log_pipeline.stats()['suppressed'])
+    if settings.lap_log_enabled:
+        lap_history = LapHistory(settings.lap_log_path)
+
+    if settings.deployment_mode == 'split':
+        # UDP采集在独立进程(ingest_main.py)中运行，本进程只负责WebSocket和HTTP
+        ingest_subscriber = IngestSubscriber(settings.ingest_socket_path, websocket_manager)
+        websocket_manager.snapshot_provider = ingest_subscriber.request_snapshot
+        await ingest_subscriber.start()
+    else:
+        ingest_pipeline = IngestPipeline(websocket_manager)
+        websocket_manager.snapshot_provider = ingest_pipeline.command_handler.snapshot
+        await ingest_pipeline.start()
 
     yield
 
     # 关闭时清理
     logger.info("关闭速度监测系统...")
-    if udp_server:
-        await udp_server.stop()
+    if ingest_subscriber:
+        await ingest_subscriber.stop()
+    if ingest_pipeline:
+        await ingest_pipeline.stop()
+    if websocket_manager:
+        await websocket_manager.stop()
+    await static_assets.stop()
 
 
 # 创建FastAPI应用
@@ -169,29 +116,143 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# 挂载静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def _static_response(path: str, request: Request) -> Optional[Response]:
+    """从内存缓存返回静态资源(预压缩，带ETag)，HEAD请求只返回响应头"""
+    result = static_assets.respond(path, request.headers.get('accept-encoding', ''),
+                                   request.headers.get('if-none-match', ''))
+    if result is None:
+        return None
+    status_code, body, headers = result
+    if request.method == 'HEAD':
+        headers['Content-Length'] = str(len(body))
+        return Response(status_code=status_code, headers=headers)
+    return Response(content=body, status_code=status_code, headers=headers)
+
+
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_root(request: Request):
+    """主页面"""
+    response = _static_response("index.html", request)
+    if response is None:
+        return HTMLResponse(content="<h1>页面未找到</h1><p>请确保static/index.html文件存在</p>")
+    return response
 
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """主页面"""
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def read_static(path: str, request: Request):
+    """静态文件，带内容哈希的文件名可长期缓存"""
+    response = _static_response(path, request)
+    if response is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return response
+
+
+def _history() -> LapHistory:
+    """获取历史查询服务，未启用持久化日志时返回503"""
+    if not lap_history:
+        raise HTTPException(status_code=503, detail="未启用圈速持久化日志")
+    return lap_history
+
+
+@app.get("/api/sessions")
+def list_sessions(device: Optional[str] = None, cursor: Optional[str] = None,
+                  limit: int = Query(50, ge=1, le=1000)):
+    """会话列表（按开始时间倒序，游标分页）"""
     try:
-        with open("static/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
-        return HTMLResponse(content="<h1>页面未找到</h1><p>请确保static/index.html文件存在</p>")
+        return _history().list_sessions(device=device, cursor=cursor, limit=limit)
+    except (ValueError, sqlite3.Error) as e:
+        raise HTTPException(status_code=400, detail=f"查询失败: {e}")
+
+
+@app.get("/api/sessions/{session}/laps")
+def get_session_laps(session: str,
+                     start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                     start_time: Optional[int] = None, end_time: Optional[int] = None,
+                     cursor: Optional[int] = None, limit: int = Query(500, ge=1, le=1000)):
+    """会话圈速历史（按圈号或时间范围过滤，游标分页）"""
+    try:
+        return _history().query_laps(session, start_lap=start_lap, end_lap=end_lap,
+                                     start_time=start_time, end_time=end_time,
+                                     cursor=cursor, limit=limit)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=400, detail=f"查询失败: {e}")
+
+
+@app.get("/api/sessions/{session}/series")
+def get_session_series(session: str, field: str = 'speed', method: str = 'lttb',
+                       points: int = Query(500, ge=3, le=10000),
+                       start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                       start_time: Optional[int] = None, end_time: Optional[int] = None):
+    """会话图表序列，服务端降采样到指定点数(lttb / minmax)"""
+    try:
+        return _history().query_series(session, field=field, points=points, method=method,
+                                       start_lap=start_lap, end_lap=end_lap,
+                                       start_time=start_time, end_time=end_time)
+    except (ValueError, sqlite3.Error) as e:
+        raise HTTPException(status_code=400, detail=f"查询失败: {e}")
+
+
+@app.get("/api/sessions/{session}/export")
+def export_session(session: str, request: Request, format: str = 'csv',
+                   start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                   start_time: Optional[int] = None, end_time: Optional[int] = None):
+    """
+    流式导出会话圈速(csv / ndjson，安装pyarrow时支持parquet / arrow)
+    按批读取和编码，内存占用与会话长度无关；文本格式在客户端支持时逐块gzip压缩
+    """
+    history = _history()
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400,
+                            detail=f"不支持的导出格式: {format}，可选: {', '.join(export.EXPORT_FORMATS)}")
+    try:
+        info = history.get_session(session)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=400, detail=f"查询失败: {e}")
+    if info is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+    batches = history.iter_laps(session, start_lap=start_lap, end_lap=end_lap,
+                                start_time=start_time, end_time=end_time,
+                                batch_size=export.batch_size(format, settings.export_batch_size))
+    body = export.stream(batches, format)
+    headers = {'Content-Disposition': f'attachment; filename="{session}.{format}"'}
+    if format in export.TEXT_FORMATS:
+        headers['Vary'] = 'Accept-Encoding'
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            body = export.gzip_chunks(body, settings.export_gzip_level)
+            headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=export.MEDIA_TYPES[format], headers=headers)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus格式的运行指标"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket连接端点"""
-    await websocket_manager.connect(websocket)
+    """
+    WebSocket连接端点
+    查询参数 encoding=json|msgpack 选择消息编码，delta=1 表示客户端支持增量统计，
+    重连时 last_seq/epoch 为收到的最后一条广播的序号和纪元(见hello消息)，用于补发错过的消息，
+    devices/sessions/types 为逗号分隔的订阅条件，只接收符合条件的广播
+    """
+    params = websocket.query_params
+    last_seq = params.get('last_seq')
+    await websocket_manager.connect(
+        websocket,
+        encoding=params.get('encoding', 'json'),
+        delta=params.get('delta') == '1',
+        last_seq=int(last_seq) if last_seq and last_seq.isdigit() else None,
+        epoch=params.get('epoch'),
+        topics=parse_topics(params.get('devices'), params.get('sessions'), params.get('types'))
+    )
     try:
         while True:
             # 接收客户端消息
             data = await websocket.receive_text()
-            logger.info("收到客户端消息: %s", data)
+            logger.debug("收到客户端消息: %s", data)
 
             try:
                 message = json.loads(data)
@@ -209,5 +270,6 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        log_level="info"
+        log_level="info",
+        log_config=None  # uvicorn日志也经过后台线程日志管道
     )
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+UDP消息分类器
+使用预编译的正则直接匹配原始字节，区分心跳、遮挡事件、二进制数据包和未知消息
+分类过程不解码、不抛出异常，心跳不会再走float()解析失败的异常路径
+
+支持的文本格式:
+    心跳:     "Time: 123 ms" / "Time: 123ms"
+    遮挡事件: "遮挡时间: 12.345 ms" / "12.345"，可在末尾附带事件时的设备时间 "遮挡时间: 12.345 ms @ 123456"
+"""
+
+import re
+from typing import Optional, Tuple
+
+from services.wire_format import MAGIC
+
+# 消息类别
+MSG_HEARTBEAT = 'heartbeat'
+MSG_BLOCK = 'block'
+MSG_BINARY = 'binary'
+MSG_UNKNOWN = 'unknown'
+
+MESSAGE_CLASSES = (MSG_HEARTBEAT, MSG_BLOCK, MSG_BINARY, MSG_UNKNOWN)
+
+_NUMBER = rb'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+HEARTBEAT_PATTERN = re.compile(rb'\s*Time:\s*(\d+)\s*ms\s*')
+BLOCK_PATTERN = re.compile(rb'\s*(?:' + '遮挡时间'.encode('utf-8') + rb'\s*(?::|' + '：'.encode('utf-8') + rb')\s*)?'
+                           + _NUMBER + rb'\s*(?:ms)?\s*(?:@\s*(\d+)\s*)?')
+
+
+def classify(data: bytes) -> Tuple[str, Optional[float], Optional[int]]:
+    """
+    对原始数据包分类
+    return: (类别, 数值, 设备时间ms)，数值对心跳为设备时间ms，对遮挡事件为遮挡时间ms，其他为None；
+        设备时间只有心跳和附带设备时间的遮挡事件才有
+    """
+    if data[:2] == MAGIC:
+        return MSG_BINARY, None, None
+
+    match = BLOCK_PATTERN.fullmatch(data)
+    if match:
+        device_ms = match.group(2)
+        return MSG_BLOCK, float(match.group(1)), int(device_ms) if device_ms is not None else None
+
+    match = HEARTBEAT_PATTERN.fullmatch(data)
+    if match:
+        device_ms = int(match.group(1))
+        return MSG_HEARTBEAT, device_ms, device_ms
+
+    return MSG_UNKNOWN, None, None
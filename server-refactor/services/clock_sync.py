@@ -0,0 +1,158 @@
+"""
+设备时钟同步
+根据心跳和二进制数据包中的设备时间(millis)持续估计设备时钟相对服务器时钟的偏移和漂移，
+圈用时按设备时钟计算，不受Wi-Fi抖动、设备休眠和事件循环调度延迟的影响
+
+每个样本为(设备时间, 到达时间)，到达时间 = 设备时间 + 偏移 + 延迟，延迟总是非负，
+所以延迟最小的样本最接近真实偏移(NTP时钟过滤器的思路):
+按设备时间把窗口分成若干段，每段只保留偏移最小的样本作为下包络，
+漂移取下包络两两斜率的中位数(Theil-Sen)，偏移取各段投影到最新时刻后的中位数，少数异常段不影响结果
+"""
+
+import logging
+from collections import deque
+from statistics import median
+from typing import Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WRAP = 1 << 32  # millis() 为32位无符号数，约49.7天回绕一次
+
+# 设备时钟时间戳: (纪元, 展开回绕后的设备时间ms)，设备重启或时钟跳变后纪元加一，不同纪元的时间不可比较
+DeviceTime = Tuple[int, int]
+
+
+class ClockSync:
+    """单个设备的时钟同步状态"""
+
+    def __init__(self, window_ms: int = 300_000, segments: int = 10, min_samples: int = 8,
+                 max_skew_ppm: float = 1000.0, step_ms: float = 2000.0):
+        """
+        window_ms: 参与估计的设备时间窗口
+        segments: 窗口分段数(下包络的点数)
+        min_samples: 开始使用估计结果前需要的样本数
+        max_skew_ppm: 漂移估计的上限，晶振漂移通常在±100ppm以内
+        step_ms: 偏移变化超过该值时认为设备重启或时钟跳变，重新开始估计
+        """
+        self.segment_ms = max(window_ms // segments, 1)
+        self.segments = segments
+        self.min_samples = min_samples
+        self.max_skew = max_skew_ppm / 1e6
+        self.step_ms = step_ms
+        self.epoch = 0
+        self.resets = 0  # 检测到的时钟跳变次数
+        self.reset()
+
+    def reset(self):
+        """丢弃所有样本，开始新的纪元"""
+        self.epoch += 1
+        self.samples = 0
+        self._last_raw: Optional[int] = None
+        self._last_ext = 0
+        # 下包络: [(段号, 设备时间, 偏移)]，每段只保留偏移最小的样本
+        self._envelope: Deque[Tuple[int, int, float]] = deque()
+        self._jumps = 0  # 连续偏大的样本数
+        self.offset: Optional[float] = None  # 参考时刻的偏移(服务器时间 - 设备时间)
+        self.skew = 0.0  # 设备时钟每毫秒相对服务器时钟的快慢，服务器间隔 = 设备间隔 * (1 + skew)
+        self.reference = 0  # 偏移对应的设备时间
+
+    @property
+    def synced(self) -> bool:
+        """样本足够，可以把设备时间换算为服务器时间"""
+        return self.samples >= self.min_samples and self.offset is not None
+
+    def _unwrap(self, device_ms: int, advance: bool) -> int:
+        """展开32位回绕，允许比最新样本稍早的时间(同一数据包中的事件、乱序到达的数据包)"""
+        if self._last_raw is None:
+            if advance:
+                self._last_raw, self._last_ext = device_ms, device_ms
+            return device_ms
+        delta = (device_ms - self._last_raw) % WRAP
+        if delta >= WRAP // 2:
+            return self._last_ext - (WRAP - delta)
+        ext = self._last_ext + delta
+        if advance:
+            self._last_raw, self._last_ext = device_ms, ext
+        return ext
+
+    def add(self, device_ms: int, received_ms: float):
+        """
+        加入一个同步样本
+        device_ms: 设备发送时的millis
+        received_ms: 服务器收到数据包的时间(毫秒)
+        """
+        ext = self._unwrap(int(device_ms) % WRAP, advance=True)
+        offset = received_ms - ext
+
+        if self.offset is not None:
+            residual = offset - self.predict_offset(ext)
+            # 延迟只会使偏移偏大；明显偏小说明时钟跳变，连续偏大很多说明设备重启
+            self._jumps = self._jumps + 1 if residual > self.step_ms else 0
+            if residual < -self.step_ms or self._jumps >= 3:
+                logger.warning("设备时钟跳变(偏差 %.0fms)，重新同步", residual)
+                self.resets += 1
+                self.reset()
+                ext = self._unwrap(int(device_ms) % WRAP, advance=True)
+                offset = received_ms - ext
+
+        self.samples += 1
+        segment = ext // self.segment_ms
+        envelope = self._envelope
+        if envelope and envelope[-1][0] == segment:
+            if offset < envelope[-1][2]:
+                envelope[-1] = (segment, ext, offset)
+            else:
+                return  # 不是本段的新下界，估计不变
+        elif envelope and segment < envelope[-1][0]:
+            return  # 乱序到达的旧样本
+        else:
+            envelope.append((segment, ext, offset))
+            while envelope[0][0] <= segment - self.segments:
+                envelope.popleft()
+        self._estimate()
+
+    def _estimate(self):
+        """根据下包络估计漂移和偏移"""
+        points = self._envelope
+        if len(points) >= 3:
+            slopes = [(points[j][2] - points[i][2]) / (points[j][1] - points[i][1])
+                      for i in range(len(points)) for j in range(i + 1, len(points))
+                      if points[j][1] != points[i][1]]
+            if slopes:
+                self.skew = max(-self.max_skew, min(self.max_skew, median(slopes)))
+        self.reference = points[-1][1]
+        self.offset = median(offset + self.skew * (self.reference - ext) for _, ext, offset in points)
+
+    def predict_offset(self, ext: int) -> float:
+        """展开后的设备时间处的偏移"""
+        return self.offset + self.skew * (ext - self.reference)
+
+    def stamp(self, device_ms: int) -> DeviceTime:
+        """事件的设备时钟时间戳"""
+        return self.epoch, self._unwrap(int(device_ms) % WRAP, advance=False)
+
+    def to_server(self, device_time: DeviceTime) -> Optional[float]:
+        """设备时间换算为服务器时间(毫秒)，未同步或纪元已变化时返回None"""
+        epoch, ext = device_time
+        if epoch != self.epoch or not self.synced:
+            return None
+        return ext + self.predict_offset(ext)
+
+    def interval(self, start: DeviceTime, end: DeviceTime) -> Optional[float]:
+        """两个设备时间之间按服务器时钟计的间隔(毫秒)，纪元不同或间隔不为正时返回None"""
+        if start[0] != end[0]:
+            return None
+        elapsed = end[1] - start[1]
+        if elapsed <= 0:
+            return None
+        return elapsed * (1 + self.skew) if self.synced else float(elapsed)
+
+    def stats(self) -> dict:
+        """同步状态摘要"""
+        return {
+            'synced': self.synced,
+            'offset_ms': round(self.offset, 1) if self.offset is not None else None,
+            'skew_ppm': round(self.skew * 1e6, 1),
+            'samples': self.samples,
+            'resets': self.resets
+        }
@@ -0,0 +1,172 @@
+"""
+控制命令处理
+处理前端发来的控制命令(重置、开始/暂停监测、统计圈数、统计数据和设备列表请求)，
+应答只发送给发出命令的客户端；没有指定应答对象时通过广播器发送给所有客户端。
+单进程模式下广播器为WebSocketManager，分进程部署时在采集进程中执行，广播器为IngestPublisher，
+应答随请求的回复帧返回发出命令的Web进程
+另外提供设备状态快照，供断线重连的客户端恢复显示
+"""
+
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CommandHandler:
+    """控制命令处理器"""
+
+    def __init__(self, device_registry, broadcaster, ingest_queue=None):
+        self.device_registry = device_registry
+        self.broadcaster = broadcaster  # 提供 send_data(message) 的广播器
+        self.ingest_queue = ingest_queue
+
+    async def handle(self, message: dict, reply: Optional[Callable[[dict], Awaitable[None]]] = None):
+        """
+        处理一条控制命令
+        reply: 把应答发送给发出命令的客户端，为None时广播应答
+        """
+        send = reply or self.broadcaster.send_data
+        message_type = message.get('type')
+        # 可选的目标设备，未指定时作用于所有设备
+        device_id = message.get('device')
+
+        if message_type == 'reset_data':
+            # 重置后端数据
+            if self.device_registry:
+                self.device_registry.reset_data(device_id)
+                # 重置后不自动开启监测，保持当前状态或关闭状态
+                self.device_registry.set_monitoring(False, device_id)
+
+                # 获取重置原因
+                reset_reason = message.get('reason', 'unknown')
+                logger.info(f"后端数据已重置，设备: {device_id or '全部'}，原因: {reset_reason}，监测状态: 关闭")
+
+                # 发送确认消息给客户端
+                reason_text = {
+                    'auto_reset': '自动重置',
+                    'manual_reset': '手动重置',
+                    'page_unload': '页面卸载重置',
+                    'unknown': '重置'
+                }.get(reset_reason, '重置')
+
+                await send({
+                    'type': 'reset_confirm',
+                    'message': f'后端数据已{reason_text}，从第0圈开始，请手动启动检测',
+                    'reason': reset_reason,
+                    'device': device_id,
+                    'timestamp': time.time() * 1000
+                })
+
+        elif message_type == 'start_monitoring':
+            # 开始监测
+            if self.device_registry:
+                self.device_registry.set_monitoring(True, device_id)
+                logger.info(f"开始监测，设备: {device_id or '全部'}")
+
+                await send({
+                    'type': 'monitoring_started',
+                    'message': '监测已开始',
+                    'device': device_id,
+                    'timestamp': time.time() * 1000
+                })
+
+        elif message_type == 'stop_monitoring':
+            # 停止监测（暂停）
+            if self.device_registry:
+                self.device_registry.set_monitoring(False, device_id)
+                logger.info(f"停止监测（暂停），设备: {device_id or '全部'}")
+
+                await send({
+                    'type': 'monitoring_stopped',
+                    'message': '监测已暂停，数据保持连续',
+                    'device': device_id,
+                    'timestamp': time.time() * 1000
+                })
+
+        elif message_type == 'update_lap_count':
+            # 更新统计圈数
+            lap_count = message.get('lap_count')
+            if self.device_registry and lap_count:
+                success = self.device_registry.set_lap_count(lap_count, device_id)
+
+                if success:
+                    await send({
+                        'type': 'lap_count_updated',
+                        'message': f'统计圈数已更新为 {lap_count}',
+                        'lap_count': lap_count,
+                        'device': device_id,
+                        'timestamp': time.time() * 1000
+                    })
+                    logger.info(f"圈数设置已更新为: {lap_count}")
+                else:
+                    await send({
+                        'type': 'error',
+                        'message': '无效的圈数设置，请输入1-10之间的数字',
+                        'timestamp': time.time() * 1000
+                    })
+
+        elif message_type == 'request_current_stats':
+            # 请求当前统计数据，未指定设备时返回最近活跃设备的数据
+            if self.device_registry:
+                data_processor = self.device_registry.get(device_id) if device_id else self.device_registry.latest()
+                if data_processor and data_processor.lap_count > 0:
+                    current_stats = data_processor._get_laps_stats()
+                    await send({
+                        'type': 'current_stats',
+                        'laps_stats': current_stats,
+                        'current_lap': data_processor.lap_count,
+                        'total_time': data_processor.total_time,
+                        'summary': data_processor.session_stats.summary(),
+                        'device': data_processor.device_id,
+                        'session': data_processor.session_id,
+                        'timestamp': time.time() * 1000
+                    })
+                    logger.info("已发送当前统计数据")
+                else:
+                    # 没有数据时发送空状态
+                    await send({
+                        'type': 'current_stats',
+                        'laps_stats': None,
+                        'summary': None,
+                        'current_lap': 0,
+                        'total_time': 0.0,
+                        'device': device_id,
+                        'timestamp': time.time() * 1000
+                    })
+                    logger.info("发送空状态数据")
+            else:
+                logger.warning("设备注册表未初始化")
+
+        elif message_type == 'list_devices':
+            # 请求设备列表
+            if self.device_registry:
+                await send({
+                    'type': 'device_list',
+                    'devices': self.device_registry.summary(),
+                    'ingest': self.ingest_queue.stats() if self.ingest_queue else None,
+                    'timestamp': time.time() * 1000
+                })
+
+        else:
+            logger.warning("未知的消息类型: %s", message_type)
+
+    async def snapshot(self) -> List[dict]:
+        """各设备当前状态快照"""
+        return self.device_registry.snapshot() if self.device_registry else []
+
+    async def handle_request(self, message: dict) -> dict:
+        """处理需要应答的请求(分进程部署时由Web进程发来)，返回应答内容"""
+        if message.get('type') == 'snapshot':
+            return {'devices': await self.snapshot()}
+        if message.get('type') == 'command':
+            # 控制命令，应答随回复帧返回给发出命令的Web进程
+            replies = []
+
+            async def collect(data: dict):
+                replies.append(data)
+
+            await self.handle(message.get('message') or {}, collect)
+            return {'replies': replies}
+        raise ValueError(f"未知的请求类型: {message.get('type')}")
@@ -1,40 +1,95 @@
 """
 数据处理器 - 支持暂停/继续功能
-负责处理UDP接收到的数据，计算速度和圈速，包含最近圈速和最佳圈速统计
+负责处理UDP接收到的数据，计算速度和圈速，包含最近圈速和最佳圈速统计以及整个会话的统计摘要
 支持暂停监测而不重置数据
+状态可保存为紧凑的检查点，重启时从检查点和其后的日志尾部恢复
+数据带有设备时间时，圈间隔按同步后的设备时钟计算，不受网络和调度延迟影响
 """
 
 import logging
 import time
+import uuid
 from datetime import datetime
 from typing import Optional, Dict, List
 from config import settings
+from services import metrics
+from services.clock_sync import ClockSync, DeviceTime
+from services.lap_stats import LapStatsIndex
+from services.lap_store import LapStore
+from services.session_stats import SessionStats
+from services.classifier import MESSAGE_CLASSES
+from services.wire_format import EVENT_BLOCK, EVENT_HEARTBEAT, SensorPacket
 
 logger = logging.getLogger(__name__)
 
+# 序号回退超过该数量，或发送时设备时间回退超过该毫秒数时，认为传感器已重启(序号从0重新开始)，
+# 而不是网络造成的乱序: UDP乱序通常只相差几个数据包、几毫秒
+SEQ_REORDER_WINDOW = 64
+DEVICE_REORDER_MS = 2000
+
 
 class DataProcessor:
     """数据处理器"""
 
-    def __init__(self, websocket_manager):
+    def __init__(self, websocket_manager, device_id: str = '', lap_log=None):
         self.websocket_manager = websocket_manager
+        self.device_id = device_id  # 所属设备ID
+        self.lap_log = lap_log  # 圈速持久化日志，可选
+        self.session_id = None
+        self.last_seq: Optional[int] = None  # 二进制数据包的最后序号
+        self.last_packet_ms: Optional[int] = None  # 最后一个二进制数据包发送时的设备时间
+        self.lost_packets = 0  # 根据序号统计的丢包数
+        self.rejected_packets = 0  # 序号重复或乱序被丢弃的数据包数
+        self.restarts = 0  # 检测到的传感器重启次数
+        self._rejecting = False  # 正在连续丢弃数据包
+        self.last_heartbeat: Optional[tuple] = None  # 最后一次心跳(设备时间ms, 到达时间ms)
+        # 设备时钟同步，未启用时只按到达时间计算
+        self.clock = ClockSync(window_ms=int(settings.clock_sync_window * 1000),
+                               min_samples=settings.clock_sync_min_samples) if settings.clock_sync_enabled else None
+        self.message_counts = dict.fromkeys(MESSAGE_CLASSES, 0)  # 各类消息计数
         self.is_monitoring = False  # 监测状态，默认关闭
         self.lap_count_setting = 3  # 统计圈数设置，默认3圈
+        self.checkpointed_lap = 0  # 最近一次检查点时的圈数
+        # 圈速历史（列式环形存储）与增量统计
+        self.laps = LapStore(capacity=max(settings.lap_history_capacity, 10))
+        self.stats_index = LapStatsIndex(self.laps, max_window=10)
+        self.session_stats = SessionStats()  # 整个会话的流式统计摘要
         self.reset_data()
 
     def reset_data(self):
         """重置数据"""
+        had_session = self.session_id is not None
+        if self.lap_log and had_session:
+            self.lap_log.append_event(self.session_id, self.device_id, 'reset')
+        self.session_id = uuid.uuid4().hex  # 每次重置开始新的会话
         self.is_first_data = True
-        self.lap_count = 0
         self.total_time = 0.0
         self.last_data_time = None
-        self.lap_times = []
-        self.lap_details = []  # 存储每圈的详细信息
+        self.last_device_time: Optional[DeviceTime] = None  # 上一次数据的设备时钟时间戳
+        # 重新开始序号检查，第一个数据包作为新的起点
+        self.last_seq = None
+        self.last_packet_ms = None
+        self.laps.reset()
+        self.stats_index.reset()
+        self.session_stats.reset()
+        if had_session:
+            self.save_checkpoint()
         logger.info("数据处理器已重置所有数据")
 
+    @property
+    def lap_count(self) -> int:
+        """当前圈数"""
+        return self.laps.count
+
     def set_monitoring(self, is_monitoring: bool):
         """设置监测状态"""
+        if self.lap_log and is_monitoring != self.is_monitoring:
+            self.lap_log.append_event(self.session_id, self.device_id, 'monitoring',
+                                      {'monitoring': is_monitoring})
+        changed = is_monitoring != self.is_monitoring
         self.is_monitoring = is_monitoring
+        if changed:
+            self.save_checkpoint()
         status = "开启" if is_monitoring else "暂停"
         logger.info(f"监测状态已设置为：{status}")
 
@@ -46,41 +101,199 @@ class DataProcessor:
 
         old_count = self.lap_count_setting
         self.lap_count_setting = lap_count
+        if lap_count != old_count:
+            self.save_checkpoint()
         logger.info(f"统计圈数已从 {old_count} 更新为 {lap_count}")
         return True
 
-    async def process_udp_data(self, raw_data: str, addr: tuple):
-        """处理UDP数据"""
+    def checkpoint(self) -> dict:
+        """
+        当前状态的紧凑检查点
+        只保存最近max_window圈，足以重建统计索引；更早的圈在持久化日志中
+        """
+        window_start = max(self.laps.first_lap, self.lap_count - self.stats_index.max_window + 1)
+        return {
+            'lap_count': self.lap_count,
+            'total_time': self.total_time,
+            'last_data_time': self.last_data_time,
+            'is_first_data': self.is_first_data,
+            'is_monitoring': self.is_monitoring,
+            'lap_count_setting': self.lap_count_setting,
+            'last_seq': self.last_seq,
+            'last_packet_ms': self.last_packet_ms,
+            'lost_packets': self.lost_packets,
+            'best': self.stats_index.best,
+            'session_stats': self.session_stats.to_state(),
+            'recent': [self.laps.get(n) for n in range(window_start, self.lap_count + 1)]
+        }
+
+    def save_checkpoint(self):
+        """把检查点写入持久化日志（后台线程与圈速一起落盘）"""
+        if not self.lap_log or not settings.checkpoint_enabled:
+            return
+        self.lap_log.append_checkpoint(self.device_id, self.session_id, self.lap_count, self.checkpoint())
+        self.checkpointed_lap = self.lap_count
+
+    def restore(self, session_id: str, state: dict, tail: list, max_gap: float = 30.0):
+        """
+        从检查点恢复状态，并重放检查点之后写入日志的圈
+        tail: [(圈用时, 累计时间, 时间戳, 速度)]，按圈号顺序
+        max_gap: 最后一次数据距今超过该秒数时，下一个数据包重新作为首次数据，避免把停机时间算进圈用时
+        """
+        self.session_id = session_id
+        self.total_time = state['total_time']
+        self.last_data_time = state['last_data_time']
+        self.is_first_data = state['is_first_data']
+        self.is_monitoring = state['is_monitoring']
+        self.lap_count_setting = state['lap_count_setting']
+        self.last_seq = state['last_seq']
+        self.last_packet_ms = state.get('last_packet_ms')
+        self.lost_packets = state['lost_packets']
+        self.laps.restore(state['lap_count'], state['recent'])
+        self.stats_index.best = [tuple(best) if best else None for best in state['best']]
+        self.session_stats.reset()
+        if 'session_stats' in state:
+            self.session_stats.load_state(state['session_stats'])
+
+        for lap_time, total_time, timestamp, speed in tail:
+            self.laps.append(lap_time, total_time, timestamp)
+            self.stats_index.add_lap()
+            self.session_stats.add(self.lap_count, lap_time, speed)
+            self.total_time = total_time
+            self.last_data_time = timestamp
+            self.is_first_data = False
+        self.checkpointed_lap = state['lap_count']
+
+        if self.last_data_time is None or time.time_ns() // 1_000_000 - self.last_data_time > max_gap * 1000:
+            self.is_first_data = True
+        logger.info("设备 %s 已从检查点恢复: 第%d圈, 重放 %d 圈", self.device_id, self.lap_count, len(tail))
+
+    async def process_measurement(self, timestamp_ms: float, addr: tuple, received_at: Optional[int] = None,
+                                  device_ms: Optional[int] = None):
+        """
+        处理文本格式的遮挡事件
+        received_at: 数据包到达时间戳(毫秒)，排队处理时用它代替处理时刻计算圈用时
+        device_ms: 事件时的设备时间(消息附带时)，同时作为时钟同步样本
+        """
         try:
-            # 解析时间戳
-            timestamp_ms = float(raw_data.strip())      # in milliseconds
-            current_time = time.time_ns() // 1_000_000  # 当前时间戳(毫秒)
+            current_time = received_at if received_at is not None else time.time_ns() // 1_000_000
+            device_time = None
+            if device_ms is not None and self.clock:
+                self.clock.add(device_ms, current_time)
+                device_time, current_time = self._device_event(device_ms, current_time)
+            await self._handle_measurement(timestamp_ms, current_time, addr, device_time)
+        except Exception as e:
+            metrics.ERRORS.inc('process')
+            logger.error("处理UDP数据时发生错误: %s", e)
 
-            logger.info("收到UDP数据: %s ms from %s, 监测状态: %s",
-                       timestamp_ms, addr, "开启" if self.is_monitoring else "暂停")
+    def process_heartbeat(self, device_ms: int, received_at: int):
+        """处理心跳（设备时间ms与到达时间），同时作为时钟同步样本"""
+        self.last_heartbeat = (device_ms, received_at)
+        if self.clock:
+            self.clock.add(device_ms, received_at)
 
-            # 如果监测被暂停，不处理数据但记录日志
-            if not self.is_monitoring:
-                logger.info("监测已暂停，忽略UDP数据")
-                return
+    def _device_event(self, device_ms: int, fallback_time: float) -> tuple:
+        """
+        事件的设备时钟时间戳和对应的服务器时间(整数毫秒，与到达时间一致)
+        时钟尚未同步时服务器时间取fallback_time
+        """
+        device_time = self.clock.stamp(device_ms)
+        server_time = self.clock.to_server(device_time)
+        return device_time, round(server_time) if server_time is not None else fallback_time
+
+    def count_message(self, message_class: str) -> int:
+        """按类别统计收到的消息，返回该类别的累计数量"""
+        self.message_counts[message_class] += 1
+        metrics.MESSAGES.inc(message_class)
+        return self.message_counts[message_class]
 
-            # 处理首次数据
-            if self.is_first_data:
-                await self._handle_first_data(timestamp_ms, current_time, addr)
+    async def process_sensor_packet(self, packet: SensorPacket, addr: tuple, received_at: int):
+        """
+        处理二进制数据包，一个数据包可包含多个遮挡事件
+        数据包的发送时刻和到达时间作为时钟同步样本；事件时间按同步后的设备时钟换算，
+        未同步时按数据包发送时刻对齐到到达时间，保留事件之间在设备上的真实间隔
+        """
+        try:
+            if not self._accept_seq(packet.seq, packet.device_ms):
                 return
 
-            # 处理正常数据
-            await self._process_lap_data(timestamp_ms, current_time, addr)
+            if self.clock:
+                self.clock.add(packet.device_ms, received_at)
+            for kind, device_ms, duration_us in packet.events:
+                current_time = received_at - ((packet.device_ms - device_ms) & 0xFFFFFFFF)
+                device_time = None
+                if self.clock:
+                    device_time, current_time = self._device_event(device_ms, current_time)
+                if kind == EVENT_BLOCK:
+                    await self._handle_measurement(duration_us / 1000, current_time, addr, device_time)
+                elif kind == EVENT_HEARTBEAT:
+                    # 时间由数据包头部推算，不再作为同步样本
+                    self.last_heartbeat = (device_ms, current_time)
 
-        except ValueError as e:
-            logger.error("数据解析错误: %s, 原始数据: %s", e, raw_data)
         except Exception as e:
-            logger.error("处理UDP数据时发生错误: %s", e)
+            metrics.ERRORS.inc('process')
+            logger.error("处理二进制数据包时发生错误: %s", e)
+
+    def _accept_seq(self, seq: int, device_ms: int) -> bool:
+        """
+        检查数据包序号，丢弃重复和乱序的数据包并统计丢包
+        传感器重启后序号从0重新开始，序号或设备时间大幅回退时认为设备已重启，从新的序号继续
+        """
+        if self.last_seq is not None:
+            gap = (seq - self.last_seq) & 0xFFFFFFFF
+            if gap == 0 or gap > 0x7FFFFFFF:
+                if not self._restarted(seq, device_ms):
+                    self.rejected_packets += 1
+                    metrics.SENSOR_PACKETS_REJECTED.inc()
+                    # 连续丢弃时只记录第一个数据包，其余只计数(见list_devices和/metrics)
+                    log = logger.debug if self._rejecting else logger.warning
+                    log("丢弃重复或乱序的数据包: 序号 %d, 上一个序号 %d", seq, self.last_seq)
+                    self._rejecting = True
+                    return False
+                self.restarts += 1
+                metrics.DEVICE_RESTARTS.inc()
+                logger.info("设备 %s 已重启: 序号 %d -> %d，重新开始序号检查", self.device_id, self.last_seq, seq)
+            else:
+                self.lost_packets += gap - 1
+        self.last_seq = seq
+        self.last_packet_ms = device_ms
+        self._rejecting = False
+        return True
+
+    def _restarted(self, seq: int, device_ms: int) -> bool:
+        """序号回退是否由传感器重启造成(而不是重复或乱序到达的数据包)"""
+        if (self.last_seq - seq) & 0xFFFFFFFF > SEQ_REORDER_WINDOW:
+            return True
+        if self.last_packet_ms is None:
+            return False
+        back = (self.last_packet_ms - device_ms) & 0xFFFFFFFF
+        return DEVICE_REORDER_MS < back <= 0x7FFFFFFF
+
+    async def _handle_measurement(self, timestamp_ms: float, current_time: float, addr: tuple,
+                                  device_time: Optional[DeviceTime] = None):
+        """处理一次遮挡测量，device_time为事件的设备时钟时间戳(有时)"""
+        logger.debug("收到UDP数据: %s ms from %s, 监测状态: %s",
+                   timestamp_ms, addr, "开启" if self.is_monitoring else "暂停")
+
+        # 如果监测被暂停，不处理数据但记录日志
+        if not self.is_monitoring:
+            logger.debug("监测已暂停，忽略UDP数据")
+            return
+
+        # 处理首次数据
+        if self.is_first_data:
+            self.last_device_time = device_time
+            await self._handle_first_data(timestamp_ms, current_time, addr)
+            return
+
+        # 处理正常数据
+        await self._process_lap_data(timestamp_ms, current_time, addr, device_time)
 
     async def _handle_first_data(self, timestamp_ms: float, current_time: float, addr: tuple):
         """处理首次数据"""
         self.is_first_data = False
         self.last_data_time = current_time
+        self.save_checkpoint()
 
         logger.info("首次数据初始化完成，时间戳: %s ms", timestamp_ms)
 
@@ -89,37 +302,50 @@ class DataProcessor:
             'type': 'init',
             'message': '系统已初始化，开始监测...',
             'timestamp': current_time,
-            'from': f"{addr[0]}:{addr[1]}"
+            'from': f"{addr[0]}:{addr[1]}",
+            'device': self.device_id
         })
 
-    async def _process_lap_data(self, timestamp_ms: float, current_time: float, addr: tuple):
+    async def _process_lap_data(self, timestamp_ms: float, current_time: float, addr: tuple,
+                                device_time: Optional[DeviceTime] = None):
         """处理圈速数据"""
-        # 计算时间间隔
-        interval_ms = current_time - self.last_data_time
+        # 计算时间间隔：两次数据都带设备时间时按设备时钟，否则按到达时间
+        interval_ms = None
+        if device_time is not None and self.last_device_time is not None:
+            interval_ms = self.clock.interval(self.last_device_time, device_time)
+        timing = 'device' if interval_ms is not None else 'arrival'
+        if interval_ms is None:
+            interval_ms = current_time - self.last_data_time
         self.last_data_time = current_time
-        self.lap_count += 1
+        self.last_device_time = device_time
 
         # 计算圈用时(秒)
         lap_time = self._calculate_lap_time(interval_ms, timestamp_ms)
         self.total_time += lap_time
-        self.lap_times.append(lap_time)
-
-        # 存储圈的详细信息
-        lap_info = {
-            'lap_number': self.lap_count,
-            'lap_time': lap_time,
-            'total_time': self.total_time,
-            'timestamp': current_time
-        }
-        self.lap_details.append(lap_info)
 
         # 计算速度
         speed = self._calculate_speed(timestamp_ms)
 
+        self.laps.append(lap_time, self.total_time, current_time)
+        self.stats_index.add_lap()
+        self.session_stats.add(self.lap_count, lap_time, speed)
+        metrics.LAPS.inc()
+
         logger.info("圈数: %d, 圈用时: %.3f秒, 速度: %.2f",
                    self.lap_count, lap_time, speed)
 
+        # 写入持久化日志（后台线程批量落盘）
+        if self.lap_log:
+            if self.lap_count == 1:
+                self.lap_log.append_session(self.session_id, self.device_id, current_time)
+            self.lap_log.append_lap(self.session_id, self.device_id, self.lap_count, lap_time,
+                                    self.total_time, current_time, timestamp_ms, interval_ms, speed)
+
         # 构造数据包
+        start = time.perf_counter_ns()
+        laps_stats = self._get_laps_stats()
+        summary = self.session_stats.summary()
+        metrics.STAGE_SECONDS.observe_since(start, 'laps_stats')
         data_packet = {
             'type': 'lap_data',
             'lap_number': self.lap_count,
@@ -129,8 +355,12 @@ class DataProcessor:
             'timestamp': current_time,
             'measurement': timestamp_ms,
             'interval': round(interval_ms, 1),
+            'timing': timing,  # 圈间隔的计时来源: device(设备时钟) / arrival(到达时间)
             'from': f"{addr[0]}:{addr[1]}",
-            'laps_stats': self._get_laps_stats()  # 统计数据
+            'device': self.device_id,
+            'session': self.session_id,
+            'laps_stats': laps_stats,  # 最近/最快连续N圈统计
+            'summary': summary  # 整个会话的统计摘要
         }
 
         # 发送数据给WebSocket客户端
@@ -167,78 +397,43 @@ class DataProcessor:
         if count is None:
             count = self.lap_count_setting
 
-        if len(self.lap_times) == 0:
+        if self.stats_index.lap_total == 0:
             stats = {
                 'best_laps': {'laps': '', 'total': 0},
                 'recent_laps': {'laps': '', 'total': 0}
             }
             return stats
 
-        # 创建包含圈号和用时的元组列表
-        lap_times_with_number = [(i + 1, time) for i, time in enumerate(self.lap_times)]
-
-        # 获取连续的最快count圈
-        best_total = float('inf')
-        best_continuous = None
-
-        # 使用滑动窗口找出连续的最快圈
-        if len(lap_times_with_number) >= count:
-            for i in range(len(lap_times_with_number) - count + 1):
-                window = lap_times_with_number[i:i + count]
-                total = sum(time for _, time in window)
-                if total < best_total:
-                    best_total = total
-                    best_continuous = window
-
-        if best_continuous:
-            best_total = round(best_total, 3)
-            if count == 1:
-                best_range = f"第{best_continuous[0][0]}圈"
-            else:
-                best_range = f"第{best_continuous[0][0]}-{best_continuous[-1][0]}圈"
-        else:
-            # 如果圈数不够count圈，就使用现有的所有圈
-            if len(lap_times_with_number) == 0:
-                best_range = ""
-                best_total = 0
-            elif len(lap_times_with_number) == 1:
-                best_range = f"第{lap_times_with_number[0][0]}圈"
-                best_total = round(lap_times_with_number[0][1], 3)
-            else:
-                # 当数据不足count圈时，显示实际的圈数范围
-                actual_count = min(count, len(lap_times_with_number))
-                if actual_count == 1:
-                    best_range = f"第{lap_times_with_number[-1][0]}圈"
-                    best_total = round(lap_times_with_number[-1][1], 3)
-                else:
-                    start_idx = len(lap_times_with_number) - actual_count
-                    end_idx = len(lap_times_with_number) - 1
-                    best_range = f"第{lap_times_with_number[start_idx][0]}-{lap_times_with_number[end_idx][0]}圈"
-                    best_total = round(sum(time for _, time in lap_times_with_number[start_idx:]), 3)
-
-        # 获取最近圈速
-        recent_laps = lap_times_with_number[-count:] if len(lap_times_with_number) >= count else lap_times_with_number
-        recent_total = round(sum(time for _, time in recent_laps), 3)
-
-        if len(recent_laps) == 0:
-            recent_range = ""
-        elif len(recent_laps) == 1:
-            recent_range = f"第{recent_laps[0][0]}圈"
+        # 获取最近圈速（圈数不够count圈时使用现有的所有圈）
+        recent_total, recent_start = self.stats_index.recent_total(count)
+        recent_end = self.stats_index.lap_total
+
+        # 获取连续的最快count圈，圈数不够时与最近圈速相同
+        best = self.stats_index.best_total(count)
+        if best:
+            best_total, best_start = best
+            best_end = best_start + count - 1
         else:
-            recent_range = f"第{recent_laps[0][0]}-{recent_laps[-1][0]}圈"
+            best_total, best_start, best_end = recent_total, recent_start, recent_end
 
         stats = {
             'best_laps': {
-                'laps': best_range,
-                'total': best_total
+                'laps': self._format_lap_range(best_start, best_end),
+                'total': round(best_total, 3)
             },
             'recent_laps': {
-                'laps': recent_range,
-                'total': recent_total
+                'laps': self._format_lap_range(recent_start, recent_end),
+                'total': round(recent_total, 3)
             },
             'setting': {
                 'lap_count': count  # 添加当前设置的圈数
             }
         }
 
-        return stats
\ No newline at end of file
+        return stats
+
+    def _format_lap_range(self, start: int, end: int) -> str:
+        """格式化圈数范围"""
+        if start == end:
+            return f"第{start}圈"
+        return f"第{start}-{end}圈"
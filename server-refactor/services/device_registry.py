@@ -0,0 +1,233 @@
+"""
+设备注册表
+按传感器地址为每个设备维护独立的数据处理器，首次收到数据时创建，空闲超时后回收
+启用持久化日志时定期保存有新圈的设备检查点，启动时从检查点恢复
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from services.data_processor import DataProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """设备注册表"""
+
+    # 保存注册表默认设置的检查点使用的设备ID
+    DEFAULTS_KEY = '*'
+
+    def __init__(self, websocket_manager, idle_timeout: float = 600.0, sweep_interval: float = 30.0,
+                 lap_log=None, checkpoint_interval: float = 5.0):
+        self.websocket_manager = websocket_manager
+        self.lap_log = lap_log  # 所有设备共用的圈速日志
+        self.idle_timeout = idle_timeout  # 设备空闲超时(秒)
+        self.sweep_interval = sweep_interval  # 空闲检查间隔(秒)
+        self.checkpoint_interval = checkpoint_interval  # 检查点间隔(秒)，0为不保存
+        self.devices: Dict[str, DataProcessor] = {}
+        self.last_seen: Dict[str, float] = {}
+        # 新设备继承的默认设置
+        self.is_monitoring = False
+        self.lap_count_setting = 3
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def device_id_for(addr: tuple, sensor_id: Optional[int] = None) -> str:
+        """生成设备ID，二进制数据包使用其中的设备ID，文本数据使用UDP来源地址"""
+        if sensor_id is not None:
+            return f"sensor-{sensor_id}"
+        return f"{addr[0]}:{addr[1]}"
+
+    def get(self, device_id: str) -> Optional[DataProcessor]:
+        """获取设备的数据处理器"""
+        return self.devices.get(device_id)
+
+    def get_or_create(self, device_id: str) -> DataProcessor:
+        """获取设备的数据处理器，不存在时创建"""
+        processor = self.devices.get(device_id)
+        if processor is None:
+            processor = DataProcessor(self.websocket_manager, device_id=device_id, lap_log=self.lap_log)
+            processor.set_monitoring(self.is_monitoring)
+            processor.set_lap_count(self.lap_count_setting)
+            self.devices[device_id] = processor
+            logger.info("新设备接入: %s，当前设备数: %d", device_id, len(self.devices))
+        self.last_seen[device_id] = time.monotonic()
+        return processor
+
+    def select(self, device_id: Optional[str] = None) -> List[DataProcessor]:
+        """选择命令作用的设备，未指定设备时返回全部设备"""
+        if device_id is None:
+            return list(self.devices.values())
+        processor = self.devices.get(device_id)
+        return [processor] if processor else []
+
+    def latest(self) -> Optional[DataProcessor]:
+        """获取最近活跃的设备"""
+        if not self.last_seen:
+            return None
+        device_id = max(self.last_seen, key=self.last_seen.get)
+        return self.devices.get(device_id)
+
+    def set_monitoring(self, is_monitoring: bool, device_id: Optional[str] = None):
+        """设置监测状态，未指定设备时同时作为新设备的默认状态"""
+        if device_id is None:
+            self.is_monitoring = is_monitoring
+            self._save_defaults()
+        for processor in self.select(device_id):
+            processor.set_monitoring(is_monitoring)
+
+    def set_lap_count(self, lap_count: int, device_id: Optional[str] = None) -> bool:
+        """设置统计圈数，未指定设备时同时作为新设备的默认设置"""
+        if lap_count < 1 or lap_count > 10:
+            logger.warning(f"无效的圈数设置: {lap_count}")
+            return False
+
+        if device_id is None:
+            self.lap_count_setting = lap_count
+            self._save_defaults()
+        for processor in self.select(device_id):
+            processor.set_lap_count(lap_count)
+        return True
+
+    def reset_data(self, device_id: Optional[str] = None):
+        """重置设备数据"""
+        for processor in self.select(device_id):
+            processor.reset_data()
+
+    def evict_idle(self) -> List[str]:
+        """回收空闲超时的设备"""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = [device_id for device_id, seen in self.last_seen.items() if seen < deadline]
+        for device_id in evicted:
+            del self.last_seen[device_id]
+            self.devices.pop(device_id, None)
+            logger.info("设备空闲超时已回收: %s，当前设备数: %d", device_id, len(self.devices))
+        return evicted
+
+    def summary(self) -> List[dict]:
+        """获取所有设备的状态摘要"""
+        now = time.monotonic()
+        return [
+            {
+                'device': device_id,
+                'monitoring': processor.is_monitoring,
+                'current_lap': processor.lap_count,
+                'total_time': round(processor.total_time, 3),
+                'lost_packets': processor.lost_packets,
+                'rejected_packets': processor.rejected_packets,
+                'restarts': processor.restarts,
+                'messages': dict(processor.message_counts),
+                'clock': processor.clock.stats() if processor.clock else None,
+                'idle': round(now - self.last_seen.get(device_id, now), 1)
+            }
+            for device_id, processor in self.devices.items()
+        ]
+
+    def snapshot(self) -> List[dict]:
+        """获取所有设备的当前状态快照，用于重连的客户端恢复显示"""
+        now = time.monotonic()
+        return [
+            {
+                'device': device_id,
+                'session': processor.session_id,
+                'monitoring': processor.is_monitoring,
+                'lap_count_setting': processor.lap_count_setting,
+                'current_lap': processor.lap_count,
+                'total_time': round(processor.total_time, 3),
+                'laps_stats': processor._get_laps_stats() if processor.lap_count > 0 else None,
+                'summary': processor.session_stats.summary(),
+                'idle': round(now - self.last_seen.get(device_id, now), 1)
+            }
+            for device_id, processor in self.devices.items()
+        ]
+
+    def _save_defaults(self):
+        """保存新设备默认设置的检查点"""
+        if self.lap_log and self.checkpoint_interval:
+            self.lap_log.append_checkpoint(self.DEFAULTS_KEY, '', 0, {
+                'is_monitoring': self.is_monitoring,
+                'lap_count_setting': self.lap_count_setting
+            })
+
+    def save_checkpoints(self, force: bool = False) -> int:
+        """
+        保存有新圈的设备检查点，force时保存所有设备，返回保存的设备数
+        没有新圈的设备(如暂停中只有心跳)只把检查点时间更新为最后活动时间，
+        否则重启时会被当作空闲超时的设备丢弃
+        """
+        if not self.lap_log:
+            return 0
+        saved = 0
+        now_ms = time.time() * 1000
+        now = time.monotonic()
+        for device_id, processor in self.devices.items():
+            if force or processor.lap_count != processor.checkpointed_lap:
+                processor.save_checkpoint()
+                saved += 1
+            elif device_id in self.last_seen:
+                self.lap_log.touch_checkpoint(device_id, int(now_ms - (now - self.last_seen[device_id]) * 1000))
+        if self.devices:
+            # 默认设置在有设备在线时同样保持有效
+            self.lap_log.touch_checkpoint(self.DEFAULTS_KEY, int(now_ms))
+        return saved
+
+    def restore(self, max_gap: float = 30.0) -> int:
+        """
+        启动时从检查点恢复设备，每个设备只重放检查点之后的日志尾部
+        只恢复空闲超时内保存的检查点，返回恢复的设备数
+        """
+        if not self.lap_log:
+            return 0
+        min_taken_at = int((time.time() - self.idle_timeout) * 1000)
+        restored = 0
+        for device_id, session_id, lap_number, state in self.lap_log.load_checkpoints(min_taken_at):
+            if device_id == self.DEFAULTS_KEY:
+                self.is_monitoring = state['is_monitoring']
+                self.lap_count_setting = state['lap_count_setting']
+                continue
+            try:
+                processor = DataProcessor(self.websocket_manager, device_id=device_id, lap_log=self.lap_log)
+                processor.restore(session_id, state, self.lap_log.laps_after(session_id, lap_number), max_gap)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("设备 %s 的检查点无效，跳过: %s", device_id, e)
+                continue
+            self.devices[device_id] = processor
+            self.last_seen[device_id] = time.monotonic()
+            restored += 1
+        return restored
+
+    async def start(self):
+        """启动空闲设备回收和检查点任务"""
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+        if self.lap_log and self.checkpoint_interval:
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+
+    async def stop(self):
+        """停止后台任务，并为所有设备保存最终检查点（重启后无需重放）"""
+        for task in (self._sweep_task, self._checkpoint_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._sweep_task = None
+        self._checkpoint_task = None
+        if self.checkpoint_interval:
+            self.save_checkpoints(force=True)
+
+    async def _sweep_loop(self):
+        """定期回收空闲设备"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    async def _checkpoint_loop(self):
+        """定期保存有新圈的设备检查点"""
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.save_checkpoints()
@@ -0,0 +1,85 @@
+"""
+图表降采样
+Largest-Triangle-Three-Buckets(LTTB)和最小/最大值分桶，用于把长会话压缩为指定点数
+"""
+
+from typing import List, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    LTTB降采样，保留曲线的视觉形状
+    points: 按x排序的(x, y)点
+    threshold: 目标点数(至少3个)，点数不超过目标时原样返回
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # 上一个选中点的下标
+
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / next_count
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / next_count
+
+        # 当前桶中与上一个选中点、下一个桶平均点构成最大三角形的点
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    最小/最大值分桶降采样，每个桶保留最小和最大两个点，不丢失极值
+    points: 按x排序的(x, y)点
+    threshold: 目标点数，点数不超过目标时原样返回
+    """
+    n = len(points)
+    if threshold >= n or threshold < 2:
+        return list(points)
+
+    buckets = threshold // 2
+    bucket_size = n / buckets
+    sampled = []
+    for i in range(buckets):
+        bucket = points[int(i * bucket_size):int((i + 1) * bucket_size)]
+        if not bucket:
+            continue
+        low = min(bucket, key=lambda p: p[1])
+        high = max(bucket, key=lambda p: p[1])
+        # 按x顺序输出，保证折线方向正确
+        if low is high:
+            sampled.append(low)
+        elif low[0] < high[0]:
+            sampled.extend((low, high))
+        else:
+            sampled.extend((high, low))
+    return sampled
+
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
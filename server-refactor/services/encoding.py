@@ -0,0 +1,54 @@
+"""
+消息编码与解码
+JSON文本帧优先使用orjson，客户端可协商使用MessagePack二进制帧
+orjson和msgpack为可选依赖，未安装时回退到标准库json
+"""
+
+import json
+import logging
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+# 支持的编码，msgpack需要安装msgpack包
+ENCODINGS = ('json', 'msgpack') if msgpack else ('json',)
+
+
+def negotiate(requested: str) -> str:
+    """根据客户端请求选择编码，不支持时回退到json"""
+    if requested in ENCODINGS:
+        return requested
+    if requested and requested != 'json':
+        logger.warning("不支持的消息编码: %s，使用json", requested)
+    return 'json'
+
+
+def encode(message: dict, encoding: str = 'json') -> Union[str, bytes]:
+    """
+    编码消息
+    return: json返回str(文本帧)，msgpack返回bytes(二进制帧)
+    """
+    if encoding == 'msgpack':
+        return msgpack.packb(message)
+    if orjson:
+        return orjson.dumps(message).decode('utf-8')
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode(payload: Union[str, bytes], encoding: str = 'json') -> dict:
+    """解码消息，encode的逆操作"""
+    if encoding == 'msgpack':
+        return msgpack.unpackb(payload)
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
@@ -0,0 +1,147 @@
+"""
+会话导出
+以流的方式导出会话的圈速: CSV / NDJSON，安装pyarrow时还支持Parquet和Arrow IPC流
+圈速按圈号分批读取(见LapHistory.iter_laps)，逐批编码后交给StreamingResponse，
+内存占用与会话长度无关；文本格式的gzip压缩同样逐块进行
+"""
+
+import csv
+import io
+import zlib
+from typing import Iterable, Iterator, List
+
+from services.encoding import encode
+from services.history import LAP_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = pq = None
+
+TEXT_FORMATS = ('csv', 'ndjson')
+# 支持的导出格式，parquet和arrow需要安装pyarrow包
+EXPORT_FORMATS = TEXT_FORMATS + (('parquet', 'arrow') if pa else ())
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+# 列式格式每批(Parquet行组)的圈数，过小的行组会降低压缩率和读取效率
+COLUMNAR_BATCH_SIZE = 32768
+
+if pa:
+    SCHEMA = pa.schema([
+        ('lap_number', pa.int64()),
+        ('lap_time', pa.float64()),
+        ('total_time', pa.float64()),
+        ('timestamp', pa.int64()),
+        ('measurement', pa.float64()),
+        ('interval', pa.float64()),
+        ('speed', pa.float64())
+    ])
+
+
+def batch_size(export_format: str, text_batch_size: int) -> int:
+    """读取圈速的批大小"""
+    return text_batch_size if export_format in TEXT_FORMATS else COLUMNAR_BATCH_SIZE
+
+
+def stream(batches: Iterable[List[tuple]], export_format: str) -> Iterator[bytes]:
+    """把分批读取的圈速编码为指定格式的字节流"""
+    if export_format == 'csv':
+        return _csv_chunks(batches)
+    if export_format == 'ndjson':
+        return _ndjson_chunks(batches)
+    if export_format == 'parquet' and pa:
+        return _parquet_chunks(batches)
+    if export_format == 'arrow' and pa:
+        return _arrow_chunks(batches)
+    raise ValueError(f"不支持的导出格式: {export_format}，可选: {', '.join(EXPORT_FORMATS)}")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """逐块gzip压缩"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _csv_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(LAP_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')  # 没有圈时只输出表头
+
+
+def _ndjson_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    for rows in batches:
+        yield ''.join(encode(dict(zip(LAP_COLUMNS, row))) + '\n' for row in rows).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加写入的文件对象，写入的数据由生成器及时取走，不在内存中累积整个文件"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _record_batch(rows: List[tuple]):
+    columns = zip(*rows)
+    return pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, SCHEMA)],
+                           schema=SCHEMA)
+
+
+def _parquet_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """每批写为一个行组，写完即输出；文件尾(元数据)在最后输出"""
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, SCHEMA, compression='zstd')
+    try:
+        for rows in batches:
+            writer.write_batch(_record_batch(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _arrow_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, SCHEMA, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    try:
+        for rows in batches:
+            writer.write_batch(_record_batch(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,186 @@
+"""
+历史数据查询
+从圈速日志数据库只读查询会话和圈速，使用游标分页，并提供降采样的图表序列和导出用的分批读取
+查询为同步阻塞调用，由FastAPI在线程池中执行
+数据库文件在写入线程首次启动时才创建，之前的查询返回空结果
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+from typing import Iterator, List, Optional
+
+from services.downsample import METHODS
+
+LAP_COLUMNS = ('lap_number', 'lap_time', 'total_time', 'timestamp', 'measurement', 'interval', 'speed')
+SERIES_FIELDS = ('lap_time', 'speed', 'total_time', 'measurement', 'interval')
+
+
+class LapHistory:
+    """圈速历史查询"""
+
+    def __init__(self, path: str, max_page_size: int = 1000):
+        self.path = path
+        self.max_page_size = max_page_size
+
+    def _connect(self) -> sqlite3.Connection:
+        """以只读方式打开数据库(WAL模式下不阻塞写入线程)"""
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    def _exists(self) -> bool:
+        """数据库文件是否已创建(只读模式不会创建文件，直接打开会抛出OperationalError)"""
+        return os.path.exists(self.path)
+
+    def _page_size(self, limit: int) -> int:
+        return max(1, min(limit, self.max_page_size))
+
+    def list_sessions(self, device: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        按开始时间倒序列出会话
+        cursor: 上一页返回的next_cursor，格式为"开始时间:会话ID"
+        """
+        if not self._exists():
+            return {'sessions': [], 'next_cursor': None}
+        limit = self._page_size(limit)
+        where, params = [], []
+        if device:
+            where.append("device = ?")
+            params.append(device)
+        if cursor:
+            started_at, _, session = cursor.partition(':')
+            where.append("(started_at, session) < (?, ?)")
+            params.extend((int(started_at), session))
+
+        sql = "SELECT session, device, started_at FROM sessions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY started_at DESC, session DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+            sessions = []
+            for session, session_device, started_at in rows[:limit]:
+                lap_count, last_timestamp = conn.execute(
+                    "SELECT MAX(lap_number), MAX(timestamp) FROM laps WHERE session = ?", (session,)
+                ).fetchone()
+                sessions.append({
+                    'session': session,
+                    'device': session_device,
+                    'started_at': started_at,
+                    'lap_count': lap_count or 0,
+                    'last_timestamp': last_timestamp
+                })
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = f"{last['started_at']}:{last['session']}"
+        return {'sessions': sessions, 'next_cursor': next_cursor}
+
+    def get_session(self, session: str) -> Optional[dict]:
+        """会话信息，不存在时返回None"""
+        if not self._exists():
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT device, started_at FROM sessions WHERE session = ?", (session,)).fetchone()
+        if row is None:
+            return None
+        return {'session': session, 'device': row[0], 'started_at': row[1]}
+
+    @staticmethod
+    def _range_filter(session: str, start_lap: Optional[int], end_lap: Optional[int],
+                      start_time: Optional[int], end_time: Optional[int]):
+        """构造圈号/时间范围过滤条件"""
+        where, params = ["session = ?"], [session]
+        if start_lap is not None:
+            where.append("lap_number >= ?")
+            params.append(start_lap)
+        if end_lap is not None:
+            where.append("lap_number <= ?")
+            params.append(end_lap)
+        if start_time is not None:
+            where.append("timestamp >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            where.append("timestamp <= ?")
+            params.append(end_time)
+        return where, params
+
+    def query_laps(self, session: str, start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                   start_time: Optional[int] = None, end_time: Optional[int] = None,
+                   cursor: Optional[int] = None, limit: int = 500) -> dict:
+        """
+        按圈号顺序查询会话的圈速
+        cursor: 上一页返回的next_cursor(最后一圈的圈号)
+        """
+        if not self._exists():
+            return {'session': session, 'laps': [], 'next_cursor': None}
+        limit = self._page_size(limit)
+        where, params = self._range_filter(session, start_lap, end_lap, start_time, end_time)
+        if cursor is not None:
+            where.append("lap_number > ?")
+            params.append(cursor)
+        sql = (f"SELECT {', '.join(LAP_COLUMNS)} FROM laps WHERE {' AND '.join(where)} "
+               "ORDER BY lap_number LIMIT ?")
+        params.append(limit + 1)
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        laps = [dict(zip(LAP_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = laps[-1]['lap_number'] if len(rows) > limit else None
+        return {'session': session, 'laps': laps, 'next_cursor': next_cursor}
+
+    def iter_laps(self, session: str, start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                  start_time: Optional[int] = None, end_time: Optional[int] = None,
+                  batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """
+        按圈号顺序分批读取会话的圈速(列顺序同LAP_COLUMNS)
+        按圈号键集分页，每批单独打开一个短连接查询:
+        慢速读取时不会长时间占用读事务、阻止WAL检查点；StreamingResponse会在线程池的任意线程中
+        继续迭代(或关闭)生成器，连接不能跨yield保留
+        """
+        if not self._exists():
+            return
+        where, params = self._range_filter(session, start_lap, end_lap, start_time, end_time)
+        where.append("lap_number > ?")
+        sql = (f"SELECT {', '.join(LAP_COLUMNS)} FROM laps WHERE {' AND '.join(where)} "
+               "ORDER BY lap_number LIMIT ?")
+        last_lap = -1
+        while True:
+            with closing(self._connect()) as conn:
+                rows = conn.execute(sql, params + [last_lap, batch_size]).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            last_lap = rows[-1][0]
+
+    def query_series(self, session: str, field: str = 'speed', points: int = 500, method: str = 'lttb',
+                     start_lap: Optional[int] = None, end_lap: Optional[int] = None,
+                     start_time: Optional[int] = None, end_time: Optional[int] = None) -> dict:
+        """
+        查询会话的降采样图表序列
+        return: points为[圈号, 值]列表，total为降采样前的点数
+        """
+        if field not in SERIES_FIELDS:
+            raise ValueError(f"不支持的字段: {field}")
+        if method not in METHODS:
+            raise ValueError(f"不支持的降采样方法: {method}")
+
+        rows: List[tuple] = []
+        if self._exists():
+            where, params = self._range_filter(session, start_lap, end_lap, start_time, end_time)
+            sql = f"SELECT lap_number, {field} FROM laps WHERE {' AND '.join(where)} ORDER BY lap_number"
+            with closing(self._connect()) as conn:
+                rows = conn.execute(sql, params).fetchall()
+
+        sampled = METHODS[method](rows, points)
+        return {
+            'session': session,
+            'field': field,
+            'method': method,
+            'total': len(rows),
+            'points': [list(point) for point in sampled]
+        }
@@ -0,0 +1,267 @@
+"""
+采集进程与Web进程之间的本地通道
+分进程部署时，采集进程(ingest_main.py)持有UDP服务器和设备数据处理器，
+通过Unix域套接字把广播消息发布给各个uvicorn Web进程，Web进程把控制命令转发回采集进程
+
+帧格式: 长度 u32(大端序) | 消息体(有msgpack时使用msgpack，否则为JSON)
+    采集进程 -> Web进程: {'type': 'event', 'message': 广播消息, 'received_ns': 数据包到达时间}
+    Web进程 -> 采集进程: {'type': 'command', 'message': 控制命令}
+    需要应答的请求(如设备状态快照): Web进程发送 {'type': 'request', 'id': 请求号, 'message': 请求}，
+        采集进程只回复该Web进程 {'type': 'reply', 'id': 请求号, 'message': 应答, 'error': 错误信息}
+    客户端发出的控制命令以请求 {'type': 'command', 'message': 控制命令} 转发，
+        应答 {'replies': [...]} 由Web进程只发送给发出命令的客户端
+"""
+
+import asyncio
+import logging
+import os
+import struct
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services import metrics
+from services.encoding import ENCODINGS, decode, encode
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+CHANNEL_ENCODING = 'msgpack' if 'msgpack' in ENCODINGS else 'json'
+
+
+def pack_frame(frame: dict) -> bytes:
+    """编码一帧"""
+    payload = encode(frame, CHANNEL_ENCODING)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    """读取一帧，连接关闭时抛出asyncio.IncompleteReadError"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"帧过大: {length} 字节")
+    return decode(await reader.readexactly(length), CHANNEL_ENCODING)
+
+
+class IngestPublisher:
+    """
+    采集进程侧的发布者
+    提供与WebSocketManager相同的 send_data/broadcast 接口，数据处理器无需区分部署模式
+    """
+
+    def __init__(self, path: str, max_buffer: int = 4 * 1024 * 1024):
+        self.path = path  # Unix域套接字路径
+        self.max_buffer = max_buffer  # 单个Web进程的发送缓冲上限(字节)，超过时丢弃消息
+        self.on_command: Optional[Callable[[dict], Awaitable[None]]] = None  # 控制命令回调
+        self.on_request: Optional[Callable[[dict], Awaitable[dict]]] = None  # 请求回调，返回应答内容
+        self.subscribers: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self.dropped = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def connection_count(self) -> int:
+        """当前连接的Web进程数"""
+        return len(self.subscribers)
+
+    async def start(self):
+        """开始监听Unix域套接字"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 清理上次未正常退出留下的套接字文件
+        self._server = await asyncio.start_unix_server(self._handle_subscriber, path=self.path)
+        logger.info("采集进程通道已启动: %s", self.path)
+
+    async def stop(self):
+        """停止监听并断开所有Web进程"""
+        if self._server:
+            self._server.close()
+        # 关闭连接使各处理任务读到EOF后自行退出（不取消任务，避免asyncio记录已取消任务的异常）
+        tasks = list(self.subscribers.values())
+        for writer in list(self.subscribers):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._server:
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def broadcast(self, message: dict):
+        """发布消息给所有Web进程（只写入发送缓冲，不等待）"""
+        if not self.subscribers:
+            return
+        frame = pack_frame({'type': 'event', 'message': message, 'received_ns': metrics.RECEIVED_NS.get()})
+        for writer in self.subscribers:
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                # Web进程处理不过来，丢弃而不是阻塞采集
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logger.warning("Web进程发送缓冲已满，丢弃消息(累计丢弃: %d)", self.dropped)
+                continue
+            writer.write(frame)
+
+    async def send_data(self, data: dict):
+        """发送数据给所有Web进程"""
+        await self.broadcast(data)
+
+    async def _answer(self, frame: dict) -> dict:
+        """执行一个请求并构造应答帧"""
+        reply = {'type': 'reply', 'id': frame.get('id'), 'message': None, 'error': None}
+        try:
+            if not self.on_request:
+                raise ValueError("采集进程不支持请求")
+            reply['message'] = await self.on_request(frame.get('message') or {})
+        except Exception as e:
+            logger.error("执行请求时发生错误: %s", e)
+            reply['error'] = str(e)
+        return reply
+
+    async def _handle_subscriber(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个Web进程连接：接收其转发的控制命令"""
+        self.subscribers[writer] = asyncio.current_task()
+        logger.info("Web进程已连接，当前连接数: %d", len(self.subscribers))
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame.get('type') == 'command' and self.on_command:
+                    try:
+                        await self.on_command(frame.get('message') or {})
+                    except Exception as e:
+                        logger.error("执行控制命令时发生错误: %s", e)
+                elif frame.get('type') == 'request':
+                    writer.write(pack_frame(await self._answer(frame)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            logger.error("Web进程发送的数据无效: %s", e)
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+            logger.info("Web进程已断开，当前连接数: %d", len(self.subscribers))
+
+
+class IngestSubscriber:
+    """
+    Web进程侧的订阅者
+    接收采集进程发布的消息并交给本进程的WebSocketManager广播，断线后自动重连
+    """
+
+    def __init__(self, path: str, websocket_manager, reconnect_interval: float = 1.0):
+        self.path = path
+        self.websocket_manager = websocket_manager
+        self.reconnect_interval = reconnect_interval
+        self.connected = False
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._request_id = 0
+        self._pending: Dict[int, asyncio.Future] = {}  # 等待应答的请求
+
+    async def start(self):
+        """启动接收任务"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止接收任务"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def send_command(self, message: dict, reply: Optional[Callable[[dict], Awaitable[None]]] = None):
+        """
+        转发控制命令给采集进程
+        reply: 把应答发送给发出命令的客户端，为None时不等待应答(应答由采集进程广播)
+        """
+        send = reply or self.websocket_manager.send_data
+        if not self.connected:
+            await send({
+                'type': 'error',
+                'message': '采集进程未连接，命令未执行',
+                'device': message.get('device')
+            })
+            return
+        if reply is None:
+            self._writer.write(pack_frame({'type': 'command', 'message': message}))
+            await self._writer.drain()
+            return
+        try:
+            result = await self.request({'type': 'command', 'message': message})
+        except ConnectionError as e:
+            await reply({'type': 'error', 'message': f'命令未执行: {e}', 'device': message.get('device')})
+            return
+        for data in result.get('replies', ()):
+            await reply(data)
+
+    async def request(self, message: dict) -> dict:
+        """发送请求给采集进程并等待应答，连接断开或采集进程出错时抛出ConnectionError"""
+        if not self.connected:
+            raise ConnectionError("采集进程未连接")
+        self._request_id += 1
+        request_id = self._request_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(pack_frame({'type': 'request', 'id': request_id, 'message': message}))
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request_snapshot(self) -> List[dict]:
+        """向采集进程请求各设备当前状态快照"""
+        return (await self.request({'type': 'snapshot'}))['devices']
+
+    def _resolve(self, frame: dict):
+        """把应答交给等待中的请求"""
+        future = self._pending.get(frame.get('id'))
+        if future is None or future.done():
+            return
+        if frame.get('error'):
+            future.set_exception(ConnectionError(f"采集进程执行请求失败: {frame['error']}"))
+        else:
+            future.set_result(frame.get('message') or {})
+
+    async def _run(self):
+        """连接采集进程并接收消息，断线后重连"""
+        failures = 0
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionError) as e:
+                failures += 1
+                if failures % 30 == 1:
+                    logger.warning("无法连接采集进程 %s: %s，%.0f秒后重试", self.path, e, self.reconnect_interval)
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+
+            failures = 0
+            self.connected = True
+            logger.info("已连接采集进程: %s", self.path)
+            try:
+                while True:
+                    frame = await read_frame(reader)
+                    if frame.get('type') == 'reply':
+                        self._resolve(frame)
+                        continue
+                    if frame.get('type') != 'event':
+                        continue
+                    # 传递数据包到达时间，使本进程的端到端延迟指标包含跨进程转发
+                    metrics.RECEIVED_NS.set(frame.get('received_ns'))
+                    await self.websocket_manager.send_data(frame['message'])
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+                logger.warning("与采集进程的连接已断开: %s", e)
+            finally:
+                self.connected = False
+                self._writer.close()
+                self._writer = None
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("与采集进程的连接已断开"))
+            await asyncio.sleep(self.reconnect_interval)
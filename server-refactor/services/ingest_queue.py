@@ -0,0 +1,126 @@
+"""
+UDP接收队列
+每个设备一个有界队列，由该设备唯一的消费任务按到达顺序批量处理
+队列满时丢弃新数据包并计数，数据包突发时不会创建无限多的任务
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from services import metrics, wire_format
+from services.classifier import MSG_BINARY, MSG_BLOCK, MSG_HEARTBEAT, classify
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """按设备分区的有界接收队列"""
+
+    def __init__(self, device_registry, queue_size: int = 1024, batch_size: int = 64):
+        self.device_registry = device_registry
+        self.queue_size = queue_size  # 每个设备的队列长度
+        self.batch_size = batch_size  # 每批处理的数据包数，处理完一批后让出事件循环
+        self.queues: Dict[str, Deque[Tuple[bytes, tuple, int]]] = {}
+        self.consumers: Dict[str, asyncio.Task] = {}
+        # 统计计数
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """当前所有设备队列中等待处理的数据包数"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, data: bytes, addr: tuple) -> bool:
+        """
+        数据包入队（在datagram_received中同步调用，不阻塞）
+        return: 队列已满被丢弃时返回False
+        """
+        received_ns = time.time_ns()  # 到达时间，用于计算圈用时和延迟指标
+        self.received += 1
+        device_id = self.device_registry.device_id_for(addr, wire_format.peek_sensor_id(data))
+
+        queue = self.queues.get(device_id)
+        if queue is None:
+            queue = self.queues[device_id] = deque()
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning("设备 %s 接收队列已满，丢弃数据包(累计丢弃: %d)", device_id, self.dropped)
+            return False
+
+        queue.append((data, addr, received_ns))
+        if len(queue) > self.max_depth:
+            self.max_depth = len(queue)
+
+        # 每个设备只有一个消费任务，保证按到达顺序处理
+        if device_id not in self.consumers:
+            self.consumers[device_id] = asyncio.create_task(self._consume(device_id, queue))
+        return True
+
+    async def _consume(self, device_id: str, queue: Deque[Tuple[bytes, tuple, int]]):
+        """按顺序批量处理设备队列，队列清空后退出"""
+        try:
+            while queue:
+                for _ in range(min(self.batch_size, len(queue))):
+                    data, addr, received_ns = queue.popleft()
+                    metrics.STAGE_SECONDS.observe((time.time_ns() - received_ns) / 1e9, 'queue_wait')
+                    metrics.RECEIVED_NS.set(received_ns)
+                    start = time.perf_counter_ns()
+                    try:
+                        await self._dispatch(device_id, data, addr, received_ns // 1_000_000)
+                    except Exception as e:
+                        metrics.ERRORS.inc('dispatch')
+                        logger.error("处理UDP数据包时发生错误: %s", e)
+                    metrics.STAGE_SECONDS.observe_since(start, 'dispatch')
+                    self.processed += 1
+                # 一批处理完后让出事件循环，避免单个设备占用过久
+                await asyncio.sleep(0)
+        finally:
+            del self.consumers[device_id]
+            if not queue:
+                self.queues.pop(device_id, None)
+
+    async def _dispatch(self, device_id: str, data: bytes, addr: tuple, received_at: int):
+        """按消息类别分发给设备数据处理器的对应方法"""
+        message_class, value, device_ms = classify(data)
+        processor = self.device_registry.get_or_create(device_id)
+        count = processor.count_message(message_class)
+
+        if message_class == MSG_BLOCK:
+            await processor.process_measurement(value, addr, received_at, device_ms)
+        elif message_class == MSG_HEARTBEAT:
+            processor.process_heartbeat(value, received_at)
+        elif message_class == MSG_BINARY:
+            try:
+                packet = wire_format.parse(data)
+            except ValueError as e:
+                metrics.ERRORS.inc('parse')
+                logger.error("二进制数据包解析失败: %s, 原始数据: %s", e, data)
+                return
+            await processor.process_sensor_packet(packet, addr, received_at)
+        elif count % 100 == 1:
+            # 未知消息限频记录
+            logger.warning("设备 %s 发送未知格式数据(累计 %d 条): %r", device_id, count, data[:64])
+
+    def stats(self) -> dict:
+        """接收队列统计"""
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'depth': self.depth,
+            'max_depth': self.max_depth
+        }
+
+    async def stop(self):
+        """停止所有消费任务"""
+        tasks = list(self.consumers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
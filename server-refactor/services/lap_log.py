@@ -0,0 +1,243 @@
+"""
+圈速持久化日志
+使用SQLite(WAL模式)追加写入圈速和事件，写入在后台线程批量完成
+事件循环只负责把记录放入内存队列，不会因磁盘IO阻塞
+设备状态检查点与圈速在同一事务中按入队顺序写入，检查点落盘时它之前的圈也一定已落盘
+磁盘卡顿时待写的圈和事件最多积压max_pending条，超出后丢弃新记录(计数并记录日志)，
+不反压事件循环：实时显示优先于历史记录的完整性
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# fsync策略 -> SQLite synchronous设置
+FSYNC_MODES = {
+    'off': 'OFF',  # 不主动fsync，由操作系统决定落盘时机
+    'normal': 'NORMAL',  # WAL检查点时fsync，进程崩溃不丢数据
+    'full': 'FULL',  # 每批提交都fsync，断电也不丢数据
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    started_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS laps (
+    session TEXT NOT NULL,
+    device TEXT NOT NULL,
+    lap_number INTEGER NOT NULL,
+    lap_time REAL NOT NULL,
+    total_time REAL NOT NULL,
+    timestamp INTEGER NOT NULL,
+    measurement REAL NOT NULL,
+    interval REAL NOT NULL,
+    speed REAL NOT NULL,
+    PRIMARY KEY (session, lap_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS laps_timestamp ON laps (session, timestamp);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    device TEXT NOT NULL,
+    type TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    payload TEXT
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    device TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    lap_number INTEGER NOT NULL,
+    taken_at INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+"""
+
+
+class LapLog:
+    """追加写入的圈速日志"""
+
+    def __init__(self, path: str, flush_interval: float = 0.5, fsync: str = 'normal',
+                 max_pending: int = 100_000):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"未知的fsync策略: {fsync}，可选: {', '.join(FSYNC_MODES)}")
+        self.path = path
+        self.flush_interval = flush_interval  # 批量写入间隔(秒)
+        self.fsync = fsync
+        self.max_pending = max_pending  # 待写的圈和事件上限(会话和检查点很少，不受限制)
+        self._sessions = deque()
+        self._laps = deque()
+        self._events = deque()
+        self._checkpoints = deque()
+        self._touches = deque()  # (最后活动时间, 设备ID)，只更新检查点的taken_at
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # 写入统计
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0  # 积压超过上限被丢弃的记录数
+        self._overflow_dropped = 0  # 本次积压期间丢弃的记录数
+
+    def start(self):
+        """打开数据库并启动后台写入线程"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={FSYNC_MODES[self.fsync]}")
+        self._conn.executescript(SCHEMA)
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='lap-log-writer', daemon=True)
+        self._thread.start()
+        logger.info("圈速日志已启动: %s (写入间隔: %.3fs, fsync: %s)", self.path, self.flush_interval, self.fsync)
+
+    def stop(self):
+        """写入剩余记录并关闭数据库"""
+        if not self._thread:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._conn.close()
+        self._conn = None
+        logger.info("圈速日志已关闭，共写入 %d 条记录", self.written)
+
+    @property
+    def pending(self) -> int:
+        """等待写入的记录数"""
+        return len(self._sessions) + len(self._laps) + len(self._events) + len(self._checkpoints)
+
+    def append_session(self, session: str, device: str, started_at: int):
+        """记录新会话"""
+        self._sessions.append((session, device, started_at))
+
+    def _admit(self) -> bool:
+        """待写的圈和事件未超过上限时返回True，否则计数丢弃"""
+        if len(self._laps) + len(self._events) < self.max_pending:
+            if self._overflow_dropped:
+                logger.warning("圈速日志积压已恢复，期间丢弃 %d 条记录", self._overflow_dropped)
+                self._overflow_dropped = 0
+            return True
+        if not self._overflow_dropped:
+            logger.error("圈速日志积压达到上限(%d条)，磁盘写入跟不上，开始丢弃新记录", self.max_pending)
+        self._overflow_dropped += 1
+        self.dropped += 1
+        return False
+
+    def append_lap(self, session: str, device: str, lap_number: int, lap_time: float, total_time: float,
+                   timestamp: int, measurement: float, interval: float, speed: float):
+        """记录一圈数据"""
+        if not self._admit():
+            return
+        self._laps.append((session, device, lap_number, lap_time, total_time,
+                           timestamp, measurement, interval, speed))
+
+    def append_event(self, session: str, device: str, event_type: str, payload: Optional[dict] = None):
+        """记录事件（监测开关、重置等）"""
+        if not self._admit():
+            return
+        self._events.append((session, device, event_type, time.time_ns() // 1_000_000,
+                             json.dumps(payload) if payload is not None else None))
+
+    def append_checkpoint(self, device: str, session: str, lap_number: int, state: dict):
+        """记录设备状态检查点（每个设备只保留最新一个）"""
+        self._checkpoints.append((device, session, lap_number, time.time_ns() // 1_000_000,
+                                  json.dumps(state, separators=(',', ':'))))
+
+    def touch_checkpoint(self, device: str, taken_at: int):
+        """
+        更新检查点的时间(毫秒)而不重写状态：暂停中的设备只有心跳没有新圈，
+        检查点内容不变，但重启时按该时间判断设备是否仍然在线
+        """
+        self._touches.append((taken_at, device))
+
+    def load_checkpoints(self, min_taken_at: int = 0) -> List[Tuple[str, str, int, dict]]:
+        """
+        读取min_taken_at(毫秒)之后的检查点，在启动时、后台写入线程开始写入之前调用
+        return: [(设备ID, 会话ID, 检查点圈号, 状态)]
+        """
+        if not os.path.exists(self.path):
+            return []
+        with closing(sqlite3.connect(self.path)) as conn:
+            rows = conn.execute(
+                "SELECT device, session, lap_number, state FROM checkpoints WHERE taken_at >= ?",
+                (min_taken_at,)).fetchall()
+        return [(device, session, lap_number, json.loads(state)) for device, session, lap_number, state in rows]
+
+    def laps_after(self, session: str, lap_number: int) -> List[Tuple[float, float, int, float]]:
+        """读取会话中检查点之后的圈（日志尾部），return: [(圈用时, 累计时间, 时间戳, 速度)]，按圈号顺序"""
+        with closing(sqlite3.connect(self.path)) as conn:
+            return conn.execute(
+                "SELECT lap_time, total_time, timestamp, speed FROM laps WHERE session = ? AND lap_number > ? "
+                "ORDER BY lap_number", (session, lap_number)).fetchall()
+
+    def _run(self):
+        """后台写入循环"""
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._flush()
+        # 停止前写入剩余记录
+        self._flush()
+
+    @staticmethod
+    def _drain(queue: deque) -> list:
+        """取出队列中当前所有记录"""
+        items = []
+        try:
+            while True:
+                items.append(queue.popleft())
+        except IndexError:
+            return items
+
+    def _flush(self):
+        """在一个事务中批量写入所有待写记录"""
+        # 先取检查点：取到的检查点之前入队的圈一定会在随后取出，与它在同一事务中写入
+        checkpoints = self._drain(self._checkpoints)
+        sessions = self._drain(self._sessions)
+        laps = self._drain(self._laps)
+        events = self._drain(self._events)
+        touches = self._drain(self._touches)
+        count = len(sessions) + len(laps) + len(events) + len(checkpoints)
+        if not count and not touches:
+            return
+
+        try:
+            with self._conn:
+                if sessions:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)", sessions)
+                if laps:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO laps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", laps)
+                if events:
+                    self._conn.executemany(
+                        "INSERT INTO events (session, device, type, timestamp, payload) VALUES (?, ?, ?, ?, ?)",
+                        events)
+                if checkpoints:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)", checkpoints)
+                if touches:
+                    self._conn.executemany(
+                        "UPDATE checkpoints SET taken_at = MAX(taken_at, ?) WHERE device = ?", touches)
+            self.written += count
+            self.flushes += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error("圈速日志写入失败，丢弃 %d 条记录: %s", count, e)
@@ -0,0 +1,63 @@
+"""
+圈速统计索引
+增量维护最近N圈和最快连续N圈的统计，每圈更新为常数时间
+支持1到max_window之间任意统计圈数的即时查询，无需重新扫描历史数据
+"""
+
+from typing import List, Optional, Tuple
+
+from services.lap_store import LapStore
+
+
+class LapStatsIndex:
+    """增量圈速统计索引"""
+
+    def __init__(self, store: LapStore, max_window: int = 10):
+        if store.capacity < max_window:
+            raise ValueError("圈速存储容量不能小于最大统计圈数")
+        self.store = store
+        self.max_window = max_window
+        self.reset()
+
+    def reset(self):
+        """清空统计索引"""
+        # best[k] = (最快连续k+1圈总用时, 起始圈号)
+        self.best: List[Optional[Tuple[float, int]]] = [None] * self.max_window
+
+    @property
+    def lap_total(self) -> int:
+        """已记录圈数"""
+        return self.store.count
+
+    def add_lap(self):
+        """存储中追加新的一圈后调用，更新所有窗口的统计"""
+        last_lap = self.store.count
+
+        # 从最新一圈向前累加，一次遍历得到所有窗口大小的最近总用时
+        total = 0.0
+        for k in range(min(self.max_window, last_lap)):
+            total += self.store.lap_time(last_lap - k)
+            best = self.best[k]
+            if best is None or total < best[0]:
+                self.best[k] = (total, last_lap - k)
+
+    def recent_total(self, count: int) -> Tuple[float, int]:
+        """
+        获取最近count圈的总用时
+        return: (总用时, 起始圈号)，圈数不足时返回所有已记录圈
+        """
+        last_lap = self.store.count
+        count = min(count, self.max_window, last_lap)
+        total = 0.0
+        for k in range(count):
+            total += self.store.lap_time(last_lap - k)
+        return total, last_lap - count + 1
+
+    def best_total(self, count: int) -> Optional[Tuple[float, int]]:
+        """
+        获取最快连续count圈的总用时
+        return: (总用时, 起始圈号)，圈数不足count圈时返回None
+        """
+        if count < 1 or count > self.max_window or self.lap_total < count:
+            return None
+        return self.best[count - 1]
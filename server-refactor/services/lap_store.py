@@ -0,0 +1,97 @@
+"""
+圈速历史存储
+按列存储每圈的圈用时、累计时间和时间戳，使用array紧凑保存
+内存中只保留最近capacity圈（环形缓冲），按圈号O(1)访问
+"""
+
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+class LapStore:
+    """列式环形圈速存储"""
+
+    def __init__(self, capacity: int = 100_000):
+        if capacity < 1:
+            raise ValueError("capacity必须大于0")
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """清空所有圈数据"""
+        self.count = 0  # 已记录的总圈数（即最新圈号）
+        self.base = 0  # 缓冲区第一个位置之前的圈数（从检查点恢复时不为0）
+        self.lap_times = array('d')  # 圈用时(秒)
+        self.total_times = array('d')  # 累计时间(秒)
+        self.timestamps = array('q')  # 时间戳(毫秒)
+
+    def __len__(self) -> int:
+        """内存中保留的圈数"""
+        return len(self.lap_times)
+
+    @property
+    def first_lap(self) -> int:
+        """内存中最早一圈的圈号"""
+        return self.count - len(self) + 1
+
+    def append(self, lap_time: float, total_time: float, timestamp: int) -> int:
+        """追加一圈数据，返回圈号"""
+        if len(self) < self.capacity:
+            self.lap_times.append(lap_time)
+            self.total_times.append(total_time)
+            self.timestamps.append(timestamp)
+        else:
+            # 缓冲区已满，覆盖最早的一圈
+            slot = (self.count - self.base) % self.capacity
+            self.lap_times[slot] = lap_time
+            self.total_times[slot] = total_time
+            self.timestamps[slot] = timestamp
+        self.count += 1
+        return self.count
+
+    def _slot(self, lap_number: int) -> Optional[int]:
+        """圈号对应的缓冲区位置，不在内存中时返回None"""
+        if lap_number < self.first_lap or lap_number > self.count:
+            return None
+        return (lap_number - 1 - self.base) % self.capacity
+
+    def __contains__(self, lap_number: int) -> bool:
+        return self._slot(lap_number) is not None
+
+    def lap_time(self, lap_number: int) -> float:
+        """获取指定圈的圈用时"""
+        slot = self._slot(lap_number)
+        if slot is None:
+            raise IndexError(f"第{lap_number}圈不在内存中")
+        return self.lap_times[slot]
+
+    def get(self, lap_number: int) -> Optional[Tuple[float, float, int]]:
+        """
+        获取指定圈的数据
+        return: (圈用时, 累计时间, 时间戳)，不在内存中时返回None
+        """
+        slot = self._slot(lap_number)
+        if slot is None:
+            return None
+        return self.lap_times[slot], self.total_times[slot], self.timestamps[slot]
+
+    def iter_range(self, start: int, end: int) -> Iterator[Tuple[int, float, float, int]]:
+        """按圈号顺序遍历[start, end]范围内存中保留的圈，产出(圈号, 圈用时, 累计时间, 时间戳)"""
+        start = max(start, self.first_lap)
+        end = min(end, self.count)
+        for lap_number in range(start, end + 1):
+            slot = (lap_number - 1 - self.base) % self.capacity
+            yield lap_number, self.lap_times[slot], self.total_times[slot], self.timestamps[slot]
+
+    def restore(self, count: int, laps: Iterable[Tuple[float, float, int]]):
+        """
+        从检查点恢复：总圈数为count，laps为最近若干圈的(圈用时, 累计时间, 时间戳)，按圈号顺序
+        更早的圈不在内存中，需要时从持久化日志查询
+        """
+        self.reset()
+        for lap_time, total_time, timestamp in laps:
+            self.append(lap_time, total_time, timestamp)
+        if self.count > count:
+            raise ValueError("恢复的圈数多于总圈数")
+        self.base = count - self.count
+        self.count = count
@@ -0,0 +1,159 @@
+"""
+日志配置
+事件循环线程只把日志记录放入有界队列，格式化输出和文件写入由后台线程完成，
+突发数据包时不会因stderr或磁盘写入阻塞事件循环
+同一条日志模板按令牌桶限频，被省略的条数附加在下一条放行的日志上；支持JSON结构化输出
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Dict, Optional, Tuple
+
+# LogRecord的标准属性，其余属性视为extra结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'suppressed'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FORMATS = ('text', 'json')
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按日志模板(logger名+未格式化的消息)限频的令牌桶
+    rate: 每个模板每秒允许的条数，burst: 允许的突发条数
+    """
+
+    MAX_KEYS = 4096  # 模板数上限，防止f-string日志使字典无限增长
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.buckets: Dict[Tuple[str, str], list] = {}  # 模板 -> [令牌数, 上次更新时间, 被省略条数]
+        self.suppressed = 0  # 累计被省略的日志数
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg if isinstance(record.msg, str) else repr(type(record.msg)))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_KEYS:
+                self.buckets.clear()
+            bucket = self.buckets[key] = [self.burst, record.created, 0]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (record.created - bucket[1]) * self.rate)
+            bucket[1] = record.created
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            self.suppressed += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时直接丢弃日志并计数，不阻塞调用方"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，附加被省略的日志条数"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" (已省略 {suppressed} 条相似日志)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON结构化格式，每行一条，extra字段原样输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                    + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """后台线程日志管道"""
+
+    def __init__(self, level: str = 'INFO', log_format: str = 'text', log_file: str = '',
+                 rate_limit: float = 20.0, queue_size: int = 10000):
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"未知的日志格式: {log_format}，可选: {', '.join(LOG_FORMATS)}")
+        formatter = JsonFormatter() if log_format == 'json' else TextFormatter(TEXT_FORMAT)
+
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.rate_filter = RateLimitFilter(rate_limit) if rate_limit > 0 else None
+        if self.rate_filter:
+            # 在入队前限频，被省略的日志不占用队列
+            self.queue_handler.addFilter(self.rate_filter)
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, *handlers,
+                                                       respect_handler_level=True)
+        self.level = level.upper()
+
+    def start(self):
+        """替换根logger的处理器并启动后台输出线程"""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        """输出队列中剩余的日志并停止后台线程"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self) -> dict:
+        """日志管道统计"""
+        return {
+            'queued': self.queue_handler.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'suppressed': self.rate_filter.suppressed if self.rate_filter else 0
+        }
+
+
+def setup_logging(level: str = 'INFO', log_format: str = 'text', log_file: str = '',
+                  rate_limit: float = 20.0, queue_size: int = 10000) -> LogPipeline:
+    """配置并启动后台线程日志管道"""
+    pipeline = LogPipeline(level, log_format, log_file, rate_limit, queue_size)
+    pipeline.start()
+    return pipeline
@@ -0,0 +1,168 @@
+"""
+运行指标
+轻量的计数器/仪表/直方图实现，以Prometheus文本格式输出
+热路径上只做整数加法和一次二分查找；已有的统计(队列长度、连接数等)在抓取时通过回调读取
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 当前正在处理的数据包到达时间(time.time_ns)，由接收队列的消费任务设置，用于统计端到端延迟
+RECEIVED_NS: ContextVar[Optional[int]] = ContextVar('received_ns', default=None)
+
+# 默认直方图分桶(秒)，覆盖10us到1s
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    parts = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    return '{' + parts + '}'
+
+
+class _Metric:
+    """指标基类，可带一个标签维度"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label  # 标签名，None表示无标签
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取时调用function获取当前值，不在热路径上更新"""
+        self._function = function
+
+    def _labels(self, label_value: Optional[str]) -> Dict[str, str]:
+        return {self.label: label_value} if self.label and label_value is not None else {}
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        super().__init__(name, documentation, label)
+        self.values: Dict[Optional[str], float] = {}
+
+    def inc(self, label_value: Optional[str] = None, amount: float = 1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self) -> List[str]:
+        if self._function:
+            return [f"{self.name} {_format_value(self._function())}"]
+        if not self.values and not self.label:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(self._labels(label_value))} {_format_value(value)}"
+                for label_value, value in self.values.items()]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self) -> List[str]:
+        value = self._function() if self._function else self.value
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """分桶直方图，单位为秒"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数(最后一个为+Inf), 总和, 总数]
+        self.series: Dict[Optional[str], list] = {}
+
+    def observe(self, seconds: float, label_value: Optional[str] = None):
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+        series[2] += 1
+
+    def observe_since(self, start_ns: int, label_value: Optional[str] = None):
+        """记录从start_ns(time.perf_counter_ns)到现在的耗时"""
+        self.observe((time.perf_counter_ns() - start_ns) / 1e9, label_value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for label_value, (counts, total, count) in self.series.items():
+            labels = self._labels(label_value)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, 'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+# --- 指标定义 ---
+PACKETS_RECEIVED = Counter('speed_monitor_packets_received_total', "收到的UDP数据包数")
+PACKETS_DROPPED = Counter('speed_monitor_packets_dropped_total', "接收队列已满被丢弃的UDP数据包数")
+MESSAGES = Counter('speed_monitor_messages_total', "按类别统计的UDP消息数", label='class')
+SENSOR_PACKETS_REJECTED = Counter('speed_monitor_sensor_packets_rejected_total', "序号重复或乱序被丢弃的二进制数据包数")
+DEVICE_RESTARTS = Counter('speed_monitor_device_restarts_total', "根据序号和设备时间回退检测到的传感器重启次数")
+LAPS = Counter('speed_monitor_laps_total', "计算出的圈数")
+ERRORS = Counter('speed_monitor_errors_total', "各阶段发生的错误数", label='stage')
+WS_DROPPED = Counter('speed_monitor_ws_messages_dropped_total', "慢客户端被丢弃的广播消息数")
+LAP_LOG_DROPPED = Counter('speed_monitor_lap_log_dropped_total', "圈速日志积压超过上限被丢弃的记录数")
+LOGS_DROPPED = Counter('speed_monitor_logs_dropped_total', "日志队列已满被丢弃的日志数")
+LOGS_SUPPRESSED = Counter('speed_monitor_logs_suppressed_total', "被限频省略的日志数")
+
+WS_CLIENTS = Gauge('speed_monitor_websocket_clients', "当前WebSocket连接数")
+LAP_LOG_PENDING = Gauge('speed_monitor_lap_log_pending', "圈速日志等待写入的记录数")
+INGEST_DEPTH = Gauge('speed_monitor_ingest_queue_depth', "接收队列中等待处理的数据包数")
+DEVICES = Gauge('speed_monitor_devices', "在线设备数")
+
+STAGE_SECONDS = Histogram('speed_monitor_stage_seconds', "数据处理各阶段耗时", label='stage')
+INGEST_TO_SEND_SECONDS = Histogram('speed_monitor_ingest_to_send_seconds',
+                                   "从UDP数据包到达到WebSocket消息发送完成的延迟",
+                                   buckets=DEFAULT_BUCKETS + (2.5, 5.0))
+
+REGISTRY = [PACKETS_RECEIVED, PACKETS_DROPPED, SENSOR_PACKETS_REJECTED, DEVICE_RESTARTS, MESSAGES, LAPS, ERRORS,
+            WS_DROPPED, LAP_LOG_DROPPED, LOGS_DROPPED, LOGS_SUPPRESSED, WS_CLIENTS, LAP_LOG_PENDING, INGEST_DEPTH,
+            DEVICES, STAGE_SECONDS, INGEST_TO_SEND_SECONDS]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render() -> str:
+    """以Prometheus文本格式输出所有指标"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
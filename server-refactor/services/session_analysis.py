@@ -0,0 +1,208 @@
+"""
+离线会话分析
+从圈速日志数据库载入已记录的会话，用新的物理常数向量化重算速度和圈用时，
+并计算跨会话的对比统计: 稳定性、圈速分布、每个k的最快连续k圈
+所有会话的圈拼接为一组列式数组，重算时不逐圈循环
+"""
+
+import sqlite3
+from contextlib import closing
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class Sessions(NamedTuple):
+    """按会话、圈号排序拼接的圈数据，offsets[i]:offsets[i+1] 为第i个会话的圈"""
+
+    ids: List[str]
+    devices: List[str]
+    offsets: np.ndarray
+    lap_number: np.ndarray
+    timestamp: np.ndarray
+    measurement: np.ndarray  # 遮挡时长(毫秒)
+    interval: np.ndarray  # 与上一次数据的间隔(毫秒)
+    lap_time: np.ndarray  # 记录的圈用时(秒)
+    total_time: np.ndarray
+    speed: np.ndarray
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def slice(self, index: int) -> slice:
+        return slice(self.offsets[index], self.offsets[index + 1])
+
+
+def load_sessions(path: str, sessions: Optional[Sequence[str]] = None, device: Optional[str] = None,
+                  latest: Optional[int] = None) -> Sessions:
+    """
+    从圈速日志载入会话
+    sessions: 指定会话ID，为空时按device/latest筛选
+    latest: 只载入最近的N个会话
+    """
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+        if sessions:
+            placeholders = ','.join('?' * len(sessions))
+            rows = conn.execute(f"SELECT session, device FROM sessions WHERE session IN ({placeholders}) "
+                                "ORDER BY started_at", list(sessions)).fetchall()
+        else:
+            sql, params = "SELECT session, device FROM sessions", []
+            if device:
+                sql += " WHERE device = ?"
+                params.append(device)
+            sql += " ORDER BY started_at DESC"
+            if latest:
+                sql += " LIMIT ?"
+                params.append(latest)
+            rows = conn.execute(sql, params).fetchall()[::-1]
+
+        ids, devices, counts, columns = [], [], [], []
+        for session, session_device in rows:
+            data = conn.execute("SELECT lap_number, timestamp, measurement, interval, lap_time, total_time, speed "
+                                "FROM laps WHERE session = ? ORDER BY lap_number", (session,)).fetchall()
+            if not data:
+                continue
+            ids.append(session)
+            devices.append(session_device)
+            counts.append(len(data))
+            columns.append(np.array(data, dtype=np.float64))
+
+    table = np.concatenate(columns) if columns else np.empty((0, 7))
+    return Sessions(
+        ids=ids,
+        devices=devices,
+        offsets=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).astype(np.int64),
+        lap_number=table[:, 0].astype(np.int64),
+        timestamp=table[:, 1].astype(np.int64),
+        measurement=table[:, 2].copy(),
+        interval=table[:, 3].copy(),
+        lap_time=table[:, 4].copy(),
+        total_time=table[:, 5].copy(),
+        speed=table[:, 6].copy()
+    )
+
+
+def speed_factor(distance_l: float, radius_r1: float, radius_r2: float) -> float:
+    """
+    速度系数，速度(米/秒) = 系数 / 遮挡时长(毫秒)
+    与DataProcessor._calculate_speed相同的单位换算: 距离毫米、小半径厘米、大半径米
+    """
+    distance_m = distance_l / 1000
+    radius_r1_m = radius_r1 / 100
+    return (radius_r2 / radius_r1_m) * distance_m * 1000
+
+
+def recompute(data: Sessions, distance_l: float, radius_r1: float, radius_r2: float) -> Dict[str, np.ndarray]:
+    """
+    用新的物理常数重算所有圈
+    圈用时 = (间隔 + 遮挡时长) / 1000，不依赖物理常数，重算可发现记录中的不一致；
+    累计时间按会话分段累加
+    return: {'lap_time', 'total_time', 'speed'}
+    """
+    lap_time = (data.interval + data.measurement) / 1000
+    cumulative = np.cumsum(lap_time)
+    # 每个会话减去之前所有会话的累计值
+    starts = data.offsets[:-1]
+    before = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0.0)
+    total_time = cumulative - np.repeat(before, data.counts)
+
+    speed = np.zeros_like(data.measurement)
+    np.divide(speed_factor(distance_l, radius_r1, radius_r2), data.measurement,
+              out=speed, where=data.measurement > 0)
+    return {'lap_time': lap_time, 'total_time': total_time, 'speed': speed}
+
+
+def best_windows(lap_times: np.ndarray, max_k: int) -> List[Optional[dict]]:
+    """
+    每个k(1..max_k)的最快连续k圈
+    前缀和相减得到所有长度为k的窗口总用时，每个k一次向量化运算
+    return: 第k-1项为 {'k', 'start', 'total'}(start为窗口第一圈的下标)，圈数不足k时为None
+    """
+    prefix = np.concatenate(([0.0], np.cumsum(lap_times)))
+    windows = []
+    for k in range(1, max_k + 1):
+        if k > len(lap_times):
+            windows.append(None)
+            continue
+        totals = prefix[k:] - prefix[:-k]
+        start = int(np.argmin(totals))
+        windows.append({'k': k, 'start': start, 'total': float(totals[start])})
+    return windows
+
+
+def pace_edges(lap_times: np.ndarray, bins: int) -> np.ndarray:
+    """所有会话共用的圈用时分桶边界(1%到99%分位，排除极端值)"""
+    if len(lap_times) == 0:
+        return np.linspace(0.0, 1.0, bins + 1)
+    low, high = np.percentile(lap_times, [1, 99])
+    if high <= low:
+        high = low + 1e-3
+    return np.linspace(low, high, bins + 1)
+
+
+def analyze(data: Sessions, lap_time: np.ndarray, speed: np.ndarray,
+            max_k: int = 10, bins: int = 10) -> dict:
+    """
+    计算各会话的统计和跨会话对比
+    稳定性用变异系数(标准差/均值)和四分位距/中位数衡量，越小越稳定
+    """
+    edges = pace_edges(lap_time, bins)
+    sessions = []
+    for index, session in enumerate(data.ids):
+        laps = lap_time[data.slice(index)]
+        speeds = speed[data.slice(index)]
+        first_lap = int(data.lap_number[data.offsets[index]])
+        p10, p25, p50, p75, p90 = np.percentile(laps, [10, 25, 50, 75, 90])
+        mean = float(laps.mean())
+        histogram, _ = np.histogram(np.clip(laps, edges[0], edges[-1]), bins=edges)
+        windows = [
+            None if window is None else {'k': window['k'], 'total': round(window['total'], 3),
+                                         'start_lap': first_lap + window['start'],
+                                         'end_lap': first_lap + window['start'] + window['k'] - 1}
+            for window in best_windows(laps, max_k)
+        ]
+        sessions.append({
+            'session': session,
+            'device': data.devices[index],
+            'laps': int(len(laps)),
+            'total_time': round(float(laps.sum()), 3),
+            'lap_time': {'mean': round(mean, 4), 'std': round(float(laps.std()), 4),
+                         'min': round(float(laps.min()), 4), 'max': round(float(laps.max()), 4),
+                         'p10': round(float(p10), 4), 'p50': round(float(p50), 4), 'p90': round(float(p90), 4)},
+            'consistency': {'cv': round(float(laps.std() / mean), 4) if mean > 0 else None,
+                            'iqr_ratio': round(float((p75 - p25) / p50), 4) if p50 > 0 else None},
+            'speed': {'mean': round(float(speeds.mean()), 3), 'max': round(float(speeds.max()), 3)},
+            'pace_histogram': (histogram / len(laps)).round(4).tolist(),
+            'best_windows': windows
+        })
+
+    # 每个k的最快会话
+    best_by_k = []
+    for k in range(1, max_k + 1):
+        candidates = [(s['best_windows'][k - 1]['total'], s['session']) for s in sessions
+                      if s['best_windows'][k - 1] is not None]
+        if candidates:
+            total, session = min(candidates)
+            best_by_k.append({'k': k, 'session': session, 'total': total})
+
+    ranked = sorted((s for s in sessions if s['consistency']['cv'] is not None),
+                    key=lambda s: s['consistency']['cv'])
+    return {
+        'sessions': sessions,
+        'pace_edges': edges.round(4).tolist(),
+        'best_by_k': best_by_k,
+        'consistency_ranking': [s['session'] for s in ranked]
+    }
+
+
+def apply_recompute(path: str, data: Sessions, result: Dict[str, np.ndarray]) -> int:
+    """把重算结果写回圈速日志(单个事务)，返回更新的圈数"""
+    session_ids = np.repeat(np.array(data.ids, dtype=object), data.counts)
+    rows = zip(result['lap_time'].tolist(), result['total_time'].tolist(), result['speed'].tolist(),
+               session_ids.tolist(), data.lap_number.tolist())
+    with closing(sqlite3.connect(path, timeout=30)) as conn:
+        with conn:
+            conn.executemany("UPDATE laps SET lap_time = ?, total_time = ?, speed = ? "
+                             "WHERE session = ? AND lap_number = ?", rows)
+    return int(len(data.lap_number))
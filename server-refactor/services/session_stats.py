@@ -0,0 +1,219 @@
+"""
+会话流式统计
+每圈常数时间更新整个会话的统计摘要，推送给前端直接显示，前端不再扫描圈速数组:
+Welford算法的均值和方差、带圈号的最小/最大值，以及t-digest估算的分位数
+"""
+
+import math
+from bisect import insort
+from typing import List, Optional, Sequence
+
+
+class RunningStats:
+    """Welford在线均值/方差，同时记录最小值和最大值所在的圈号"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # 与均值之差的平方和
+        self.min: Optional[float] = None
+        self.min_lap = 0
+        self.max: Optional[float] = None
+        self.max_lap = 0
+
+    def add(self, value: float, lap_number: int):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min, self.min_lap = value, lap_number
+        if self.max is None or value > self.max:
+            self.max, self.max_lap = value, lap_number
+
+    @property
+    def std(self) -> float:
+        """总体标准差"""
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def to_state(self) -> list:
+        return [self.count, self.mean, self.m2, self.min, self.min_lap, self.max, self.max_lap]
+
+    def load_state(self, state: Sequence):
+        self.count, self.mean, self.m2, self.min, self.min_lap, self.max, self.max_lap = state
+
+
+class TDigest:
+    """
+    合并式t-digest分位数草图
+    新值先进入有序缓冲，缓冲满或查询时与质心一起按k1尺度函数合并，
+    两端的质心更小，尾部分位数更准确；质心数量与数据量无关(约compression个)
+    """
+
+    def __init__(self, compression: float = 100, buffer_size: int = 64):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.reset()
+
+    def reset(self):
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.total = 0.0  # 已合并的权重
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._buffer: List[float] = []
+
+    @property
+    def count(self) -> float:
+        return self.total + len(self._buffer)
+
+    def add(self, value: float):
+        insort(self._buffer, value)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self._buffer) >= self.buffer_size:
+            self.compress()
+
+    def _k_to_q(self, k: float) -> float:
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _q_to_k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def compress(self):
+        """把缓冲中的值合并进质心"""
+        if not self._buffer:
+            return
+        # 质心和缓冲都已按均值排序，归并后一次遍历合并
+        points = sorted(zip(self.means + self._buffer, self.weights + [1.0] * len(self._buffer)))
+        self._buffer = []
+        total = self.total + len(points) - len(self.means)
+
+        means, weights = [], []
+        current_mean, current_weight = points[0]
+        merged = 0.0  # 已输出质心的权重
+        limit = total * self._k_to_q(self._q_to_k(0.0) + 1)
+        for mean, weight in points[1:]:
+            if merged + current_weight + weight <= limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                means.append(current_mean)
+                weights.append(current_weight)
+                merged += current_weight
+                limit = total * self._k_to_q(self._q_to_k(min(merged / total, 1.0)) + 1)
+                current_mean, current_weight = mean, weight
+        means.append(current_mean)
+        weights.append(current_weight)
+
+        self.means, self.weights, self.total = means, weights, total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估算分位数q(0-1)，在相邻质心中心之间线性插值"""
+        self.compress()
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        target = q * self.total
+        if target <= self.weights[0] / 2:
+            # 第一个质心中心之前，在最小值和质心之间插值
+            return self.min + (self.means[0] - self.min) * target / (self.weights[0] / 2)
+
+        cumulative = 0.0
+        for i in range(len(self.means) - 1):
+            center = cumulative + self.weights[i] / 2
+            next_center = cumulative + self.weights[i] + self.weights[i + 1] / 2
+            if target <= next_center:
+                fraction = (target - center) / (next_center - center)
+                return self.means[i] + (self.means[i + 1] - self.means[i]) * fraction
+            cumulative += self.weights[i]
+
+        last_center = self.total - self.weights[-1] / 2
+        fraction = (target - last_center) / (self.weights[-1] / 2)
+        return self.means[-1] + (self.max - self.means[-1]) * min(fraction, 1.0)
+
+    def to_state(self) -> dict:
+        self.compress()
+        return {'means': self.means, 'weights': self.weights, 'min': self.min, 'max': self.max}
+
+    def load_state(self, state: dict):
+        self.reset()
+        self.means, self.weights = list(state['means']), list(state['weights'])
+        self.total = float(sum(self.weights))
+        self.min, self.max = state['min'], state['max']
+
+
+class SessionStats:
+    """
+    单个会话的圈用时和速度统计摘要
+    分位数在圈数增长超过1/QUANTILE_REFRESH后才重新估算，长会话中合并质心的开销摊销到各圈
+    """
+
+    QUANTILES = (0.1, 0.5, 0.9)
+    QUANTILE_REFRESH = 64
+
+    def __init__(self, compression: float = 100):
+        self.lap_time = RunningStats()
+        self.speed = RunningStats()
+        self.digest = TDigest(compression)
+        self.total_time = 0.0
+        self._quantiles: tuple = ()
+        self._quantiles_at = 0  # 上次估算分位数时的圈数
+
+    def reset(self):
+        self.lap_time.reset()
+        self.speed.reset()
+        self.digest.reset()
+        self.total_time = 0.0
+        self._quantiles, self._quantiles_at = (), 0
+
+    def add(self, lap_number: int, lap_time: float, speed: float):
+        """新的一圈"""
+        self.lap_time.add(lap_time, lap_number)
+        self.speed.add(speed, lap_number)
+        self.digest.add(lap_time)
+        self.total_time += lap_time
+
+    def summary(self) -> Optional[dict]:
+        """推送给前端的紧凑统计摘要，没有圈时返回None"""
+        lap_time = self.lap_time
+        if not lap_time.count:
+            return None
+        if lap_time.count - self._quantiles_at >= max(1, lap_time.count // self.QUANTILE_REFRESH):
+            self._quantiles = tuple(round(self.digest.quantile(q), 3) for q in self.QUANTILES)
+            self._quantiles_at = lap_time.count
+        p10, p50, p90 = self._quantiles
+        return {
+            'laps': lap_time.count,
+            'total_time': round(self.total_time, 3),
+            'mean': round(lap_time.mean, 3),
+            'std': round(lap_time.std, 3),
+            'min': round(lap_time.min, 3),
+            'min_lap': lap_time.min_lap,
+            'max': round(lap_time.max, 3),
+            'max_lap': lap_time.max_lap,
+            'p10': p10,
+            'p50': p50,
+            'p90': p90,
+            'speed_mean': round(self.speed.mean, 2),
+            'speed_max': round(self.speed.max, 2),
+            'speed_max_lap': self.speed.max_lap
+        }
+
+    def to_state(self) -> dict:
+        """检查点状态"""
+        return {'lap_time': self.lap_time.to_state(), 'speed': self.speed.to_state(),
+                'digest': self.digest.to_state(), 'total_time': self.total_time}
+
+    def load_state(self, state: dict):
+        self.lap_time.load_state(state['lap_time'])
+        self.speed.load_state(state['speed'])
+        self.digest.load_state(state['digest'])
+        self.total_time = state['total_time']
+        self._quantiles, self._quantiles_at = (), 0
@@ -0,0 +1,197 @@
+"""
+静态资源缓存
+启动时把static目录下的文件读入内存并预先压缩(gzip，安装brotli时还有br)，请求时只查表返回，不读磁盘也不压缩:
+- ETag为内容哈希，客户端带If-None-Match重新验证时返回304
+- index.html中引用的资源改写为带内容哈希的文件名(如 /static/app.1a2b3c4d5e.js)，
+  这些地址的内容永不变化，按immutable长期缓存；原文件名和页面本身每次向服务器验证
+- 后台定期检查文件的修改时间和大小，有变化时在线程中重新加载，整表替换
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 支持的压缩编码，按优先级排列，br需要安装brotli包
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256  # 小于该大小的文件不压缩
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# 页面中引用静态资源的属性值: "/static/app.js"
+_REFERENCE = re.compile(r'(["\'])/static/([^"\'?#]+)\1')
+
+
+class Asset:
+    """一个静态文件的内存副本"""
+
+    __slots__ = ('name', 'media_type', 'digest', 'bodies')
+
+    def __init__(self, name: str, data: bytes, media_type: str, gzip_level: int, brotli_quality: int):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(data).hexdigest()[:10]
+        # 编码 -> 内容，只保留比原文件小的压缩结果
+        self.bodies: Dict[str, bytes] = {'identity': data}
+        if len(data) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(data, gzip_level, mtime=0)}
+            if brotli:
+                compressed['br'] = brotli.compress(data, quality=brotli_quality)
+            self.bodies.update((encoding, body) for encoding, body in compressed.items() if len(body) < len(data))
+
+    @property
+    def fingerprinted_name(self) -> str:
+        """带内容哈希的文件名"""
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+
+def accepted_encodings(header: str) -> Iterable[str]:
+    """Accept-Encoding中q>0的编码"""
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        yield coding.strip().lower()
+
+
+class StaticAssets:
+    """static目录的内存缓存"""
+
+    def __init__(self, directory: str = 'static', gzip_level: int = 9, brotli_quality: int = 11):
+        self.directory = directory
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # 请求路径(相对static目录) -> (资源, 是否带内容哈希)
+        self._routes: Dict[str, Tuple[Asset, bool]] = {}
+        self._signature: Optional[tuple] = None
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def _files(self) -> Iterable[str]:
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.startswith('.'):
+                    yield os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, '/')
+
+    def _scan(self) -> tuple:
+        """目录中各文件的(名称, 修改时间, 大小)，用于判断是否需要重新加载"""
+        entries = []
+        for name in self._files():
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def load(self):
+        """读取并压缩所有文件；HTML最后处理，其中的资源引用改写为带内容哈希的地址"""
+        signature = self._scan()
+        assets: Dict[str, Asset] = {}
+        pages = []
+        for name, _, _ in signature:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+            media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if media_type == 'text/html':
+                pages.append((name, data))
+                continue
+            assets[name] = self._asset(name, data, media_type)
+
+        def fingerprint(match: re.Match) -> str:
+            asset = assets.get(match.group(2))
+            if asset is None:
+                return match.group(0)
+            return f"{match.group(1)}/static/{asset.fingerprinted_name}{match.group(1)}"
+
+        for name, data in pages:
+            html = _REFERENCE.sub(fingerprint, data.decode('utf-8'))
+            assets[name] = self._asset(name, html.encode('utf-8'), 'text/html')
+
+        routes = {}
+        for name, asset in assets.items():
+            routes[name] = (asset, False)
+            routes[asset.fingerprinted_name] = (asset, True)
+        self._routes = routes
+        self._signature = signature
+        logger.info("已加载静态资源: %d个文件，原始%.1fKB，gzip%.1fKB%s", len(assets),
+                    sum(len(a.bodies['identity']) for a in assets.values()) / 1024,
+                    sum(len(a.bodies.get('gzip', a.bodies['identity'])) for a in assets.values()) / 1024,
+                    f"，br{sum(len(a.bodies.get('br', a.bodies['identity'])) for a in assets.values()) / 1024:.1f}KB"
+                    if brotli else "")
+
+    def _asset(self, name: str, data: bytes, media_type: str) -> Asset:
+        if media_type.startswith('text/') or media_type == 'application/javascript':
+            media_type += '; charset=utf-8'
+        return Asset(name, data, media_type, self.gzip_level, self.brotli_quality)
+
+    def respond(self, path: str, accept_encoding: str = '', if_none_match: str = '') -> Optional[tuple]:
+        """
+        生成响应
+        return: (状态码, 内容, 响应头)，资源不存在时返回None
+        """
+        found = self._routes.get(path)
+        if found is None:
+            return None
+        asset, immutable = found
+        accepted = set(accepted_encodings(accept_encoding)) if accept_encoding else ()
+        encoding = next((e for e in ENCODINGS if e in accepted and e in asset.bodies), 'identity')
+        etag = asset.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+            'Vary': 'Accept-Encoding'
+        }
+        if if_none_match and (if_none_match.strip() == '*'
+                              or etag in (tag.strip().lstrip('W/') for tag in if_none_match.split(','))):
+            return 304, b'', headers
+        headers['Content-Type'] = asset.media_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, asset.bodies[encoding], headers
+
+    async def _watch(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await loop.run_in_executor(None, self._scan) != self._signature:
+                    await loop.run_in_executor(None, self.load)
+            except Exception as e:
+                logger.error("重新加载静态资源失败: %s", e)
+
+    def start(self, interval: float):
+        """启动文件变化检查，interval为0时只在启动时加载一次"""
+        if interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
@@ -13,8 +13,8 @@ logger = logging.getLogger(__name__)
 class UDPServer:
     """UDP服务器"""
     
-    def __init__(self, data_processor):
-        self.data_processor = data_processor
+    def __init__(self, ingest_queue):
+        self.ingest_queue = ingest_queue
         self.transport: Optional[asyncio.DatagramTransport] = None
         self.protocol: Optional['UDPProtocol'] = None
         self.is_running = False
@@ -27,7 +27,7 @@ class UDPServer:
         
         # 创建UDP端点
         transport, protocol = await loop.create_datagram_endpoint(
-            lambda: UDPProtocol(self.data_processor),
+            lambda: UDPProtocol(self.ingest_queue),
             local_addr=(settings.udp_host, settings.udp_port)
         )
         
@@ -48,8 +48,8 @@ class UDPServer:
 class UDPProtocol(asyncio.DatagramProtocol):
     """UDP协议处理器"""
     
-    def __init__(self, data_processor):
-        self.data_processor = data_processor
+    def __init__(self, ingest_queue):
+        self.ingest_queue = ingest_queue
         super().__init__()
     
     def connection_made(self, transport):
@@ -60,16 +60,9 @@ class UDPProtocol(asyncio.DatagramProtocol):
     def datagram_received(self, data: bytes, addr: tuple):
         """接收到数据包时调用"""
         try:
-            # 解码数据
-            raw_data = data.decode('utf-8')
+            # 放入设备接收队列，由设备的消费任务按顺序处理
+            self.ingest_queue.submit(data, addr)
             
-            # 异步处理数据
-            asyncio.create_task(
-                self.data_processor.process_udp_data(raw_data, addr)
-            )
-            
-        except UnicodeDecodeError as e:
-            logger.error("UDP数据解码失败: %s, 原始数据: %s", e, data)
         except Exception as e:
             logger.error("处理UDP数据包时发生错误: %s", e)
     
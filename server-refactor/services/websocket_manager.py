@@ -1,53 +1,456 @@
 """
 WebSocket连接管理器
 负责管理WebSocket连接和消息广播
+每个连接有独立的有界发送队列和发送任务，慢客户端不会拖慢其他客户端和数据处理
+每条广播消息的每种编码只序列化一次，lap_data中未变化的统计字段以增量形式发送
+每条广播消息带有递增的序号(seq)，最近的消息保留在重放缓冲中：
+客户端重连时带上 last_seq 和 epoch，能补发时只补发错过的消息，否则发送各设备当前状态的快照
+客户端可按设备、会话和消息类型订阅，广播通过主题索引只分发给感兴趣的客户端；
+命令应答只发送给发出命令的客户端
 """
 
-import json
+import asyncio
 import logging
-from typing import List
+import time
+import uuid
+from collections import defaultdict, deque
+from itertools import islice
+from typing import Awaitable, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
 from fastapi import WebSocket
 
+from services import metrics
+from services.encoding import encode, negotiate
+
 logger = logging.getLogger(__name__)
 
+# 慢客户端处理策略
+SLOW_CLIENT_POLICIES = ('drop_oldest', 'conflate', 'disconnect')
+
+# 订阅主题的维度，对应广播消息中的字段
+TOPIC_FIELDS = ('device', 'session', 'type')
+
+Topics = Dict[str, Optional[FrozenSet[str]]]
+
+
+def parse_topics(devices: Union[str, Iterable[str], None] = None,
+                 sessions: Union[str, Iterable[str], None] = None,
+                 types: Union[str, Iterable[str], None] = None) -> Topics:
+    """
+    解析订阅条件，每个维度可以是逗号分隔的字符串或列表，为空表示不限
+    消息在每个维度上都匹配时才发送；消息中没有该字段(如不属于某个设备的消息)时视为匹配
+    """
+    topics = {}
+    for field, values in zip(TOPIC_FIELDS, (devices, sessions, types)):
+        if isinstance(values, str):
+            values = values.split(',')
+        values = frozenset(str(value).strip() for value in values or () if str(value).strip())
+        topics[field] = values or None
+    return topics
+
+
+class OutboundMessage:
+    """待发送的广播消息，缓存各编码的序列化结果"""
+
+    __slots__ = ('seq', 'message', 'device', 'delta', 'base_seq', 'received_ns', '_encoded')
+
+    def __init__(self, seq: Optional[int], message: dict, delta: Optional[dict] = None,
+                 base_seq: Optional[int] = None, received_ns: Optional[int] = None):
+        self.seq = seq  # 广播序号，只发给单个客户端的应答为None
+        self.message = message  # 完整消息
+        self.device = message.get('device', '')
+        self.delta = delta  # 相对上一条同设备lap_data的增量消息，不可用时为None
+        self.base_seq = base_seq  # 增量基准(上一条同设备lap_data)的序号
+        self.received_ns = received_ns  # 触发该消息的UDP数据包到达时间，用于延迟指标
+        self._encoded: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+
+    def encode(self, encoding: str, use_delta: bool) -> Union[str, bytes]:
+        """获取编码后的消息，同一编码只序列化一次"""
+        key = (encoding, use_delta)
+        payload = self._encoded.get(key)
+        if payload is None:
+            start = time.perf_counter_ns()
+            payload = encode(self.delta if use_delta else self.message, encoding)
+            metrics.STAGE_SECONDS.observe_since(start, 'encode')
+            self._encoded[key] = payload
+        return payload
+
+
+class ClientConnection:
+    """单个客户端连接及其发送队列"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str,
+                 encoding: str = 'json', delta: bool = False, topics: Optional[Topics] = None):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.policy = policy
+        self.encoding = encoding  # 消息编码: json / msgpack
+        self.delta = delta  # 客户端是否支持增量消息
+        self.topics = topics or parse_topics()  # 订阅条件
+        self.last_seq: Optional[int] = None  # 最后发送的广播序号
+        # 各设备最后发送给客户端的lap_data序号，等于增量消息的基准序号时才能发送增量
+        self.delta_base: Dict[str, int] = {}
+        self.queue: Deque[OutboundMessage] = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0  # 被丢弃的消息数
+        self.task: Optional[asyncio.Task] = None
+
+    def enqueue(self, message: OutboundMessage) -> bool:
+        """
+        消息入队，队列满时按策略处理，返回False表示应断开该客户端
+        drop_oldest丢弃最旧的广播，conflate只用新消息替换同一设备的同类旧消息；
+        发给该客户端的应答(seq为None)总是保留
+        """
+        if len(self.queue) >= self.queue_size:
+            if self.policy == 'disconnect':
+                return False
+            if self.policy == 'conflate':
+                victim = self._superseded(message)
+            else:
+                victim = next((queued for queued in self.queue if queued.seq is not None), None)
+            if victim is not None:
+                self.queue.remove(victim)
+                self.dropped += 1
+                metrics.WS_DROPPED.inc()
+        self.queue.append(message)
+        self.ready.set()
+        return True
+
+    @staticmethod
+    def _key(message: OutboundMessage) -> tuple:
+        return message.message.get('type'), message.device
+
+    def _superseded(self, message: OutboundMessage) -> Optional[OutboundMessage]:
+        """
+        conflate策略下可丢弃的最旧广播: 与新消息同一设备的同类消息，或队列中已有更新的同类消息
+        都没有时不丢弃，队列最多超出上限(设备数 × 消息类型数 + 应答数)
+        """
+        if message.seq is not None:
+            key = self._key(message)
+            for queued in self.queue:
+                if queued.seq is not None and self._key(queued) == key:
+                    return queued
+        newest = {}
+        for queued in self.queue:
+            if queued.seq is not None:
+                newest[self._key(queued)] = queued
+        return next((queued for queued in self.queue
+                     if queued.seq is not None and newest[self._key(queued)] is not queued), None)
+
+    def matches(self, message: dict) -> bool:
+        """消息是否符合订阅条件"""
+        for field, values in self.topics.items():
+            value = message.get(field)
+            if values is not None and value is not None and value not in values:
+                return False
+        return True
+
 
 class WebSocketManager:
     """WebSocket连接管理器"""
-    
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
 
-    async def connect(self, websocket: WebSocket):
-        """接受新的WebSocket连接"""
+    def __init__(self, queue_size: int = 256, slow_client_policy: str = 'drop_oldest',
+                 replay_size: int = 4096, snapshot_timeout: float = 2.0):
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"未知的慢客户端策略: {slow_client_policy}，可选: {', '.join(SLOW_CLIENT_POLICIES)}")
+        self.queue_size = queue_size  # 每个客户端的发送队列长度
+        self.slow_client_policy = slow_client_policy
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # 待分发的消息: (消息, UDP到达时间, 目标连接)，目标为None时广播；
+        # 应答与广播经过同一队列，每个客户端按产生顺序收到消息
+        self._outbox: Deque[Tuple[dict, Optional[int], Optional[WebSocket]]] = deque()
+        self._seq = 0
+        # 序号所属的纪元，进程重启或连到另一个Web进程后序号不可比较，客户端需要快照
+        self.epoch = uuid.uuid4().hex[:12]
+        self._replay: Deque[OutboundMessage] = deque(maxlen=replay_size)  # 最近广播的消息，用于断线重连补发
+        # 获取各设备当前状态快照的回调，重连客户端落后太多时使用
+        self.snapshot_provider: Optional[Callable[[], Awaitable[List[dict]]]] = None
+        self.snapshot_timeout = snapshot_timeout
+        # 各设备最后广播的(序号, laps_stats, summary)，作为增量基准
+        self._last_stats: Dict[str, Tuple[int, dict, Optional[dict]]] = {}
+        # 主题索引: (维度, 值) -> 订阅的客户端；在某个维度上不限的客户端单独登记
+        self._subscribers: Dict[Tuple[str, str], Set[ClientConnection]] = defaultdict(set)
+        self._unfiltered: Dict[str, Set[ClientConnection]] = {field: set() for field in TOPIC_FIELDS}
+        # 路由缓存: 消息的(设备, 会话, 类型) -> 接收的客户端，订阅变化时清空
+        self._routes: Dict[tuple, Tuple[ClientConnection, ...]] = {}
+        self._outbox_ready = asyncio.Event()
+        self._dispatch_task: Optional[asyncio.Task] = None
+
+    @property
+    def connection_count(self) -> int:
+        """当前连接数"""
+        return len(self.clients)
+
+    async def start(self):
+        """启动广播分发任务"""
+        self._dispatch_task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        """停止广播分发任务和所有发送任务"""
+        tasks = [client.task for client in self.clients.values() if client.task]
+        if self._dispatch_task:
+            tasks.append(self._dispatch_task)
+            self._dispatch_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def connect(self, websocket: WebSocket, encoding: str = 'json', delta: bool = False,
+                      last_seq: Optional[int] = None, epoch: Optional[str] = None,
+                      topics: Optional[Topics] = None):
+        """
+        接受新的WebSocket连接
+        encoding: 客户端请求的消息编码(json / msgpack)
+        delta: 客户端是否支持lap_data增量统计
+        last_seq, epoch: 重连客户端收到的最后一条广播的序号及其纪元，
+            能从重放缓冲补发时补发错过的消息，否则先发送当前状态快照
+        topics: 订阅条件(见parse_topics)，默认接收所有广播
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info("新客户端连接，当前连接数: %d", len(self.active_connections))
-    
+        client = ClientConnection(websocket, self.queue_size, self.slow_client_policy,
+                                  encoding=negotiate(encoding), delta=delta, topics=topics)
+
+        # 确定补发内容后立即加入广播（中间没有await），之后的广播都会进入该客户端的队列
+        missed = self._missed_since(last_seq, client) if last_seq is not None and epoch == self.epoch else None
+        resume = 'none' if last_seq is None else ('replay' if missed is not None else 'snapshot')
+        client.last_seq = last_seq if missed is not None else self._seq
+        if missed:
+            client.queue.extend(missed)
+            client.ready.set()
+        self.clients[websocket] = client
+        self._index(client)
+        logger.info("新客户端连接(恢复方式: %s)，当前连接数: %d", resume, len(self.clients))
+
+        # 快照和握手消息在发送任务启动前直接发送，排在所有广播之前
+        try:
+            await self._send_direct(client, {'type': 'hello', 'epoch': self.epoch, 'seq': client.last_seq,
+                                             'resume': resume, 'replayed': len(missed or ())})
+            if resume == 'snapshot':
+                devices = await self._snapshot()
+                if devices is not None:
+                    devices = [state for state in devices if client.matches({'device': state.get('device'),
+                                                                             'session': state.get('session')})]
+                await self._send_direct(client, {'type': 'snapshot', 'seq': client.last_seq, 'devices': devices})
+        except Exception as e:
+            logger.error("发送握手消息失败: %s", e)
+            self.disconnect(websocket)
+            return
+        if websocket in self.clients:
+            client.task = asyncio.create_task(self._client_writer(client))
+
+    def _missed_since(self, last_seq: int, client: ClientConnection) -> Optional[List[OutboundMessage]]:
+        """
+        重放缓冲中序号大于last_seq、符合客户端订阅条件的消息
+        缓冲中已没有、需要补发的消息超过客户端队列长度或序号无效时返回None，需要改发快照；
+        只订阅少数主题的客户端按过滤后的条数判断，错过很多其他设备的消息时仍可补发
+        """
+        count = self._seq - last_seq
+        if count < 0 or count > len(self._replay):
+            return None
+        missed = [outbound for outbound in islice(self._replay, len(self._replay) - count, None)
+                  if client.matches(outbound.message)]
+        if len(missed) > self.queue_size:
+            return None
+        return missed
+
+    async def _snapshot(self) -> Optional[List[dict]]:
+        """获取各设备当前状态快照，不可用时返回None，客户端改为请求当前统计"""
+        if not self.snapshot_provider:
+            return None
+        try:
+            return await asyncio.wait_for(self.snapshot_provider(), self.snapshot_timeout)
+        except Exception as e:
+            logger.warning("获取设备状态快照失败: %s", e)
+            return None
+
+    @staticmethod
+    async def _send_direct(client: ClientConnection, message: dict):
+        """不经过发送队列，直接发送一条消息给客户端"""
+        payload = encode(message, client.encoding)
+        if isinstance(payload, bytes):
+            await client.websocket.send_bytes(payload)
+        else:
+            await client.websocket.send_text(payload)
+
     def disconnect(self, websocket: WebSocket):
         """断开WebSocket连接"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info("客户端断开连接，当前连接数: %d", len(self.active_connections))
-    
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._unindex(client)
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+        logger.info("客户端断开连接，当前连接数: %d", len(self.clients))
+
+    def subscribe(self, websocket: WebSocket, topics: Topics) -> Optional[Topics]:
+        """替换客户端的订阅条件，返回生效的条件，客户端不存在时返回None"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return None
+        self._unindex(client)
+        client.topics = topics
+        self._index(client)
+        logger.info("客户端订阅已更新: %s", {field: sorted(values) if values else '*'
+                                             for field, values in topics.items()})
+        return topics
+
+    def _index(self, client: ClientConnection):
+        """把客户端加入主题索引"""
+        for field, values in client.topics.items():
+            if values is None:
+                self._unfiltered[field].add(client)
+            else:
+                for value in values:
+                    self._subscribers[(field, value)].add(client)
+        self._routes.clear()
+
+    def _unindex(self, client: ClientConnection):
+        """把客户端移出主题索引"""
+        for field, values in client.topics.items():
+            if values is None:
+                self._unfiltered[field].discard(client)
+                continue
+            for value in values:
+                subscribers = self._subscribers.get((field, value))
+                if subscribers is not None:
+                    subscribers.discard(client)
+                    if not subscribers:
+                        del self._subscribers[(field, value)]
+        self._routes.clear()
+
+    def _route(self, message: dict) -> Tuple[ClientConnection, ...]:
+        """
+        消息的接收者: 各维度(订阅该值的客户端 ∪ 该维度不限的客户端)的交集
+        同一设备、会话和类型的消息路由相同，结果缓存到订阅变化为止
+        """
+        key = tuple(message.get(field) for field in TOPIC_FIELDS)
+        route = self._routes.get(key)
+        if route is None:
+            matched: Optional[Set[ClientConnection]] = None
+            for field, value in zip(TOPIC_FIELDS, key):
+                if value is None:
+                    continue  # 消息不属于该维度，所有客户端都匹配
+                clients = self._unfiltered[field].union(self._subscribers.get((field, value), ()))
+                matched = clients if matched is None else matched & clients
+            route = tuple(self.clients.values()) if matched is None else tuple(matched)
+            if len(self._routes) >= 1024:
+                self._routes.clear()
+            self._routes[key] = route
+        return route
+
+    async def send_to(self, websocket: WebSocket, message: dict):
+        """
+        只发送给指定客户端（命令应答），不编号、不进入重放缓冲
+        与广播一起排队，不会越过之前已产生的广播
+        """
+        if websocket not in self.clients:
+            return
+        self._outbox.append((message, None, websocket))
+        self._outbox_ready.set()
+
     async def broadcast(self, message: dict):
-        """广播消息给所有连接的客户端"""
-        if not self.active_connections:
+        """广播消息给订阅了该消息的客户端（只入队，不等待发送）"""
+        if not self.clients and not self._replay.maxlen:
             return
-        
-        message_text = json.dumps(message)
-        disconnected = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_text)
-            except Exception as e:
-                logger.error("广播消息失败: %s", e)
-                disconnected.append(connection)
-        
-        # 清理断开的连接
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+        self._outbox.append((message, metrics.RECEIVED_NS.get(), None))
+        self._outbox_ready.set()
+
     async def send_data(self, data: dict):
-        """发送数据给所有客户端"""
+        """发送数据给订阅了该消息的客户端"""
         await self.broadcast(data)
+
+    async def _dispatch_loop(self):
+        """编号并放入重放缓冲和各客户端队列，序列化在发送时进行（每种编码只序列化一次）"""
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            while self._outbox:
+                message, received_ns, target = self._outbox.popleft()
+                if target is not None:
+                    client = self.clients.get(target)
+                    if client is not None and not client.enqueue(OutboundMessage(None, message)):
+                        self._drop_slow_client(client)
+                    continue
+                self._seq += 1
+                message['seq'] = self._seq
+                delta, base_seq = self._make_delta(self._seq, message)
+                outbound = OutboundMessage(self._seq, message, delta, base_seq, received_ns)
+                self._replay.append(outbound)
+                slow_clients = [client for client in self._route(message)
+                                if not client.enqueue(outbound)]
+                for client in slow_clients:
+                    self._drop_slow_client(client)
+
+    def _drop_slow_client(self, client: ClientConnection):
+        """发送队列已满(disconnect策略)时断开客户端"""
+        logger.warning("客户端发送队列已满，断开慢客户端")
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket))
+
+    def _make_delta(self, seq: int, message: dict) -> Tuple[Optional[dict], Optional[int]]:
+        """
+        生成lap_data的增量消息：laps_stats和summary中与该设备上一条lap_data相同的字段省略，
+        只在laps_stats_delta和summary_delta中发送变化的字段
+        (会话摘要的分位数、最值圈号等大多数圈不变，每圈只有圈数、均值等几个字段变化)
+        return: (增量消息, 基准消息的序号)，不可用时为(None, None)
+        """
+        stats = message.get('laps_stats')
+        if message.get('type') != 'lap_data' or not stats:
+            return None, None
+
+        device = message.get('device', '')
+        summary = message.get('summary')
+        base_seq, base, base_summary = self._last_stats.get(device, (None, None, None))
+        self._last_stats[device] = (seq, stats, summary)
+        if base is None or base.keys() != stats.keys():
+            return None, None
+
+        delta = {key: value for key, value in message.items() if key not in ('laps_stats', 'summary')}
+        delta['laps_stats_delta'] = {key: value for key, value in stats.items() if base[key] != value}
+        if summary is not None and base_summary is not None and base_summary.keys() == summary.keys():
+            delta['summary_delta'] = {key: value for key, value in summary.items() if base_summary[key] != value}
+        else:
+            delta['summary'] = summary
+        return delta, base_seq
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        """关闭连接（1013: 稍后重试）"""
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _client_writer(self, client: ClientConnection):
+        """单个客户端的发送任务"""
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.queue:
+                    outbound = client.queue.popleft()
+                    # 客户端收到的上一条同设备lap_data正是增量基准时才发送增量；
+                    # 消息被丢弃或被订阅条件过滤时基准不一致，发送完整消息
+                    use_delta = (client.delta and outbound.delta is not None
+                                 and client.delta_base.get(outbound.device) == outbound.base_seq)
+                    if client.delta and outbound.message.get('type') == 'lap_data' \
+                            and outbound.message.get('laps_stats'):
+                        client.delta_base[outbound.device] = outbound.seq
+                    payload = outbound.encode(client.encoding, use_delta)
+                    start = time.perf_counter_ns()
+                    if isinstance(payload, bytes):
+                        await client.websocket.send_bytes(payload)
+                    else:
+                        await client.websocket.send_text(payload)
+                    metrics.STAGE_SECONDS.observe_since(start, 'send')
+                    if outbound.received_ns is not None:
+                        metrics.INGEST_TO_SEND_SECONDS.observe((time.time_ns() - outbound.received_ns) / 1e9)
+                    if outbound.seq is not None:
+                        client.last_seq = outbound.seq
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.ERRORS.inc('send')
+            logger.error("发送消息失败: %s", e)
+
+        # 发送失败，清理连接
+        self.disconnect(client.websocket)
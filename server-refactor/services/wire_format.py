@@ -0,0 +1,71 @@
+"""
+传感器二进制数据包格式(v1)
+一个数据包可携带多个遮挡/心跳事件，使用struct直接从缓冲区解析，不构造中间字符串
+
+数据包布局(小端序):
+    头部 16字节: magic "SM"(2) | version u8 | 事件数 u8 | 设备ID u32 | 序号 u32 | 发送时设备时间ms u32
+    事件 12字节: 类型 u8 | 保留(3) | 事件时设备时间ms u32 | 遮挡时长us u32
+"""
+
+import struct
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+MAGIC = b'SM'
+VERSION = 1
+
+HEADER = struct.Struct('<2sBBIII')
+EVENT = struct.Struct('<B3xII')
+
+# 事件类型
+EVENT_BLOCK = 1  # 遮挡事件，时长为遮挡持续时间
+EVENT_HEARTBEAT = 2  # 心跳事件，时长为0
+
+MAX_EVENTS = 255
+
+
+class SensorPacket(NamedTuple):
+    """解析后的传感器数据包"""
+    sensor_id: int
+    seq: int
+    device_ms: int  # 发送时的设备时间(millis)
+    events: List[Tuple[int, int, int]]  # (类型, 设备时间ms, 遮挡时长us)
+
+
+def is_binary(data: bytes) -> bool:
+    """是否为二进制格式的数据包（否则按旧的文本格式处理）"""
+    return data[:2] == MAGIC
+
+
+def peek_sensor_id(data: bytes) -> Optional[int]:
+    """只读取头部中的设备ID，用于在解析前分配设备队列"""
+    if len(data) < HEADER.size or data[:2] != MAGIC:
+        return None
+    return int.from_bytes(data[4:8], 'little')
+
+
+def parse(data: bytes) -> SensorPacket:
+    """解析二进制数据包，格式错误时抛出ValueError"""
+    if len(data) < HEADER.size:
+        raise ValueError(f"数据包过短: {len(data)} 字节")
+    magic, version, count, sensor_id, seq, device_ms = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("数据包标识错误")
+    if version != VERSION:
+        raise ValueError(f"不支持的数据包版本: {version}")
+
+    end = HEADER.size + count * EVENT.size
+    if len(data) < end:
+        raise ValueError(f"数据包长度与事件数不符: {len(data)} 字节, {count} 个事件")
+    events = list(EVENT.iter_unpack(memoryview(data)[HEADER.size:end]))
+    return SensorPacket(sensor_id, seq, device_ms, events)
+
+
+def pack(sensor_id: int, seq: int, device_ms: int, events: Sequence[Tuple[int, int, int]]) -> bytes:
+    """打包二进制数据包（供模拟发送和测试使用）"""
+    if len(events) > MAX_EVENTS:
+        raise ValueError(f"单个数据包最多 {MAX_EVENTS} 个事件")
+    buffer = bytearray(HEADER.size + len(events) * EVENT.size)
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, len(events), sensor_id, seq & 0xFFFFFFFF, device_ms & 0xFFFFFFFF)
+    for i, (kind, event_ms, duration_us) in enumerate(events):
+        EVENT.pack_into(buffer, HEADER.size + i * EVENT.size, kind, event_ms & 0xFFFFFFFF, duration_us)
+    return bytes(buffer)
@@ -17,8 +17,25 @@ def start_server():
     print("启动速度监测系统...")
     os.system("python main.py")
 
+def start_split(workers: int):
+    """分进程启动：一个UDP采集进程 + 多个uvicorn Web进程"""
+    print(f"启动速度监测系统(采集进程 + {workers} 个Web进程)...")
+    env = dict(os.environ, DEPLOYMENT_MODE="split")
+    ingest = subprocess.Popen([sys.executable, "ingest_main.py"], env=env)
+    try:
+        subprocess.run([sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers),
+                        "--host", os.environ.get("HOST", "0.0.0.0"), "--port", os.environ.get("PORT", "8000")],
+                       env=env)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.terminate()
+        ingest.wait()
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "--install":
         install_dependencies()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--split":
+        start_split(int(sys.argv[2]) if len(sys.argv) > 2 else 2)
     else:
         start_server()
@@ -16,6 +16,34 @@ class SpeedMonitorApp {
         this.maxDataPoints = 1000; // 增加到1000条数据
         this.maxLapDisplayCount = 1000; // 圈速详细时间最多显示1000条
         this.hasInitialReset = false;
+        // 监测的设备ID（通过 ?device= 指定），未指定时接收所有设备
+        this.deviceId = new URLSearchParams(window.location.search).get('device');
+        this.lastLapsStats = {}; // 各设备最后的完整统计，用于合并增量
+        this.lastSummary = {}; // 各设备最后的完整会话统计摘要，用于合并增量
+        this.lastSeq = null; // 收到的最后一条广播序号，重连时用于补发错过的消息
+        this.epoch = null; // 广播序号所属的纪元（服务端hello消息下发）
+        this.sessionId = null; // 当前显示的会话
+        this.sessionSummary = null; // 服务端推送的整个会话统计摘要
+        this.bestLaps = null; // 服务端维护的最快连续N圈
+
+        // 逐帧渲染: 收到的消息先缓冲，每个动画帧统一处理一次，只重绘有变化的部分
+        this.pendingMessages = [];
+        this.renderScheduled = false;
+        this.dirty = { laps: false, header: false, stats: false, relative: false };
+        this.lapsReset = true; // 圈速数组被整体替换，列表和图表需要重建
+        this.appendedLaps = []; // 上次渲染后新增的圈
+        this.pendingLapsStats = null; // 待显示的最近/最快N圈统计
+        this.header = { currentLap: '0', totalTime: '0.000 s' };
+        this.pendingDebugEntries = [];
+        this.lapListNotice = null;
+        this.renderStats = { frames: 0, messages: 0, totalMs: 0, maxMs: 0, since: performance.now() };
+
+        // 相对分析和导出表格在Worker中计算
+        this.statsWorker = this.createStatsWorker();
+        this.workerRequests = new Map();
+        this.workerRequestId = 0;
+        this.inbound = Promise.resolve(); // WebSocket消息处理链，保证异步解码的消息按到达顺序处理
+        this.relativeInFlight = false;
 
         this.initElements();
         this.initChart();
@@ -52,6 +80,8 @@ class SpeedMonitorApp {
             exportIntelligentStats: document.getElementById('exportIntelligentStats'),
             exportRelativeAnalysis: document.getElementById('exportRelativeAnalysis'),
             confirmExportButton: document.getElementById('confirmExportButton'),
+            exportCsvButton: document.getElementById('exportCsvButton'),
+            exportNdjsonButton: document.getElementById('exportNdjsonButton'),
 
             // 设置相关
             settingsButton: document.getElementById('settingsButton'),
@@ -87,6 +117,8 @@ class SpeedMonitorApp {
             slowestSingleLap: document.getElementById('slowestSingleLap'),
             slowestSingleLapNumber: document.getElementById('slowestSingleLapNumber'),
             timeDifference: document.getElementById('timeDifference'),
+            lapTimeMedian: document.getElementById('lapTimeMedian'),
+            lapTimeSpread: document.getElementById('lapTimeSpread'),
             fastestSpeed: document.getElementById('fastestSpeed'),
             fastestSpeedLap: document.getElementById('fastestSpeedLap'),
 
@@ -174,7 +206,7 @@ class SpeedMonitorApp {
         this.addDebugLog('WebSocket连接中...');
 
         // 更新初始智能统计（显示空数据状态）
-        this.updateIntelligentStats();
+        this.markDirty('stats');
 
         // 确保按钮文本正确
         const buttonText = this.showDetailsView ? '📊 隐藏详细分析' : '📊 显示详细分析';
@@ -195,6 +227,8 @@ class SpeedMonitorApp {
         // 导出模态窗口
         this.elements.closeExportButton.addEventListener('click', () => this.closeExportModal());
         this.elements.confirmExportButton.addEventListener('click', () => this.handleExport());
+        this.elements.exportCsvButton.addEventListener('click', () => this.downloadSessionLaps('csv'));
+        this.elements.exportNdjsonButton.addEventListener('click', () => this.downloadSessionLaps('ndjson'));
 
         // 图表控制
         this.elements.exportPngButton.addEventListener('click', () => this.openExportModal());
@@ -318,10 +352,9 @@ class SpeedMonitorApp {
 
         this.addDebugLog(`设置详细分析显示状态: ${display}`);
 
-        // 如果显示详细视图，立即更新统计数据
+        // 如果显示详细视图，在下一帧更新统计数据
         if (this.showDetailsView) {
-            this.addDebugLog('更新智能统计数据...');
-            this.updateIntelligentStats();
+            this.markDirty('stats');
         }
     }
 
@@ -348,6 +381,18 @@ class SpeedMonitorApp {
         this.elements.exportModal.style.display = 'none';
     }
 
+    // 下载当前会话的全部圈速(服务端流式导出，不受前端圈数上限限制)
+    downloadSessionLaps(format) {
+        if (!this.sessionId) {
+            this.showNotification('当前没有会话可导出', 'warning');
+            return;
+        }
+        const link = document.createElement('a');
+        link.href = `/api/sessions/${encodeURIComponent(this.sessionId)}/export?format=${format}`;
+        link.click();
+        this.addDebugLog(`导出会话 ${this.sessionId} 的圈速 (${format})`);
+    }
+
     // 改进的导出内容处理
     handleExport() {
         const exportChart = this.elements.exportChart.checked;
@@ -570,9 +615,27 @@ class SpeedMonitorApp {
 
         // 绘制相对分析表格
         if (includeRelativeAnalysis && this.lapData.length > 0) {
-            currentY = this.drawRelativeAnalysisSection(ctx, currentY);
+            this.buildExportTable(12).then(table => {
+                currentY = this.drawRelativeAnalysisSection(ctx, currentY, table);
+                this.completeExport(ctx, canvas, exportInfo);
+            });
+            return;
+        }
+
+        this.completeExport(ctx, canvas, exportInfo);
+    }
+
+    // 相对分析表格的导出行，优先在Worker中计算
+    async buildExportTable(maxRows) {
+        const fastestTime = this.sessionSummary ? this.sessionSummary.min : 0;
+        const result = await this.requestWorker({ type: 'exportTable', fastestTime: fastestTime, maxRows: maxRows });
+        if (result) {
+            return result;
         }
+        return { rows: exportTableRows(this.lapData, fastestTime, maxRows), total: this.lapData.length };
+    }
 
+    completeExport(ctx, canvas, exportInfo) {
         // 添加页脚
         this.drawExportFooter(ctx, canvas.height);
 
@@ -635,15 +698,12 @@ class SpeedMonitorApp {
     }
 
     // 绘制相对分析部分
-    drawRelativeAnalysisSection(ctx, startY) {
+    drawRelativeAnalysisSection(ctx, startY, table) {
         ctx.fillStyle = '#37474f';
         ctx.font = 'bold 24px -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif';
         ctx.textAlign = 'left';
         ctx.fillText('📈 相对分析表格', 50, startY);
 
-        const times = this.lapData.map(lap => lap.time);
-        const fastestTime = Math.min(...times);
-
         // 表格设置
         const tableStartY = startY + 40;
         const rowHeight = 25;
@@ -667,32 +727,16 @@ class SpeedMonitorApp {
         ctx.font = '12px -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif';
         let currentRowY = tableStartY + rowHeight + 5;
 
-        // 限制显示行数
-        const maxRows = Math.min(this.lapData.length, 12);
-        const displayData = this.lapData.slice(0, maxRows);
-
-        displayData.forEach((lap, index) => {
-            const timeDiff = lap.time - fastestTime;
-            const percentDiff = ((lap.time - fastestTime) / fastestTime * 100);
-            const isFastest = lap.time === fastestTime;
-
+        table.rows.forEach(row => {
             // 最快圈高亮
-            if (isFastest) {
+            if (row.isFastest) {
                 ctx.fillStyle = 'rgba(77, 182, 172, 0.3)';
                 ctx.fillRect(50, currentRowY - 15, 800, rowHeight);
             }
 
             ctx.fillStyle = '#37474f';
 
-            const rowData = [
-                `第${lap.lap}圈`,
-                lap.time.toFixed(3),
-                lap.speed.toFixed(2),
-                isFastest ? '0.000' : '+' + timeDiff.toFixed(3),
-                isFastest ? '0.0%' : '+' + percentDiff.toFixed(1) + '%'
-            ];
-
-            rowData.forEach((data, i) => {
+            row.cells.forEach((data, i) => {
                 ctx.fillText(data, colStartX[i] + colWidths[i] / 2, currentRowY + 5);
             });
 
@@ -700,11 +744,11 @@ class SpeedMonitorApp {
         });
 
         // 如果数据被截断，显示提示
-        if (this.lapData.length > maxRows) {
+        if (table.total > table.rows.length) {
             ctx.fillStyle = '#ff7043';
             ctx.font = 'italic 12px -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif';
             ctx.textAlign = 'center';
-            ctx.fillText(`显示前${maxRows}圈数据，共${this.lapData.length}圈`, 450, currentRowY + 20);
+            ctx.fillText(`显示前${table.rows.length}圈数据，共${table.total}圈`, 450, currentRowY + 20);
             currentRowY += 40;
         }
 
@@ -821,9 +865,10 @@ class SpeedMonitorApp {
         this.exportSelectedContent(true, false, false);
     }
 
-    // 计算智能统计数据
+    // 智能统计数据（直接使用服务端推送的会话统计摘要，不扫描圈速数组）
     calculateIntelligentStats() {
-        if (this.lapData.length === 0) {
+        const summary = this.sessionSummary;
+        if (!summary) {
             return {
                 lapRange: '无数据',
                 totalTime: '0.000s',
@@ -838,67 +883,34 @@ class SpeedMonitorApp {
             };
         }
 
-        const times = this.lapData.map(lap => lap.time);
-        const speeds = this.lapData.map(lap => lap.speed);
-
-        const totalTime = times.reduce((sum, time) => sum + time, 0);
-        const averageTime = totalTime / times.length;
-        const averageSpeed = speeds.reduce((sum, speed) => sum + speed, 0) / speeds.length;
-        const maxSpeed = Math.max(...speeds);
-        const minTime = Math.min(...times);
-        const maxTime = Math.max(...times);
-
-        // 计算最快连续组合
-        const fastestCombo = this.findFastestContinuousLaps(this.lapCountSetting);
+        const fastestCombo = this.getFastestCombo();
 
         return {
-            lapRange: `第${this.lapData[0].lap}圈 - 第${this.lapData[this.lapData.length - 1].lap}圈`,
-            totalTime: `${totalTime.toFixed(3)}s`,
-            averageTime: `${averageTime.toFixed(3)}s`,
-            averageSpeed: `${averageSpeed.toFixed(2)} m/s`,
-            maxSpeed: `${maxSpeed.toFixed(2)} m/s`,
-            fastestLap: `${minTime.toFixed(3)}s (第${this.lapData.find(lap => lap.time === minTime).lap}圈)`,
-            slowestLap: `${maxTime.toFixed(3)}s (第${this.lapData.find(lap => lap.time === maxTime).lap}圈)`,
-            timeDifference: `${(maxTime - minTime).toFixed(3)}s`,
+            lapRange: `第1圈 - 第${summary.laps}圈`,
+            totalTime: `${summary.total_time.toFixed(3)}s`,
+            averageTime: `${summary.mean.toFixed(3)}s`,
+            averageSpeed: `${summary.speed_mean.toFixed(2)} m/s`,
+            maxSpeed: `${summary.speed_max.toFixed(2)} m/s`,
+            fastestLap: `${summary.min.toFixed(3)}s (第${summary.min_lap}圈)`,
+            slowestLap: `${summary.max.toFixed(3)}s (第${summary.max_lap}圈)`,
+            timeDifference: `${(summary.max - summary.min).toFixed(3)}s`,
             fastestCombo: `${fastestCombo.total.toFixed(3)}s`,
             fastestComboRange: fastestCombo.range
         };
     }
 
-    // 查找最快的连续N圈组合
-    findFastestContinuousLaps(n) {
-        if (this.lapData.length < n) {
-            return { total: 0, range: '数据不足', startLap: 0, endLap: 0 };
-        }
-
-        let minTotal = Number.MAX_VALUE;
-        let bestStartIndex = 0;
-
-        for (let i = 0; i <= this.lapData.length - n; i++) {
-            const total = this.lapData.slice(i, i + n).reduce((sum, lap) => sum + lap.time, 0);
-            if (total < minTotal) {
-                minTotal = total;
-                bestStartIndex = i;
-            }
+    // 最快的连续N圈（服务端增量维护）
+    getFastestCombo() {
+        if (!this.bestLaps || !this.sessionSummary || this.sessionSummary.laps < this.lapCountSetting) {
+            return { total: 0, range: '数据不足' };
         }
-
-        const startLap = this.lapData[bestStartIndex].lap;
-        const endLap = this.lapData[bestStartIndex + n - 1].lap;
-
-        return {
-            total: minTotal,
-            range: `第${startLap}-${endLap}圈`,
-            startLap: startLap,
-            endLap: endLap
-        };
+        return { total: this.bestLaps.total, range: this.bestLaps.laps };
     }
 
     // 更新智能统计显示
     updateIntelligentStats() {
-        this.addDebugLog(`更新智能统计 - 数据量: ${this.lapData.length}`);
-
-        if (this.lapData.length === 0) {
-            this.addDebugLog('显示空数据状态');
+        const summary = this.sessionSummary;
+        if (!summary) {
             // 显示空数据状态
             this.elements.fastestComboTime.textContent = '-';
             this.elements.fastestComboRange.textContent = '暂无数据';
@@ -911,85 +923,67 @@ class SpeedMonitorApp {
             this.elements.timeDifference.textContent = '-';
             this.elements.fastestSpeed.textContent = '-';
             this.elements.fastestSpeedLap.textContent = '暂无数据';
+            this.elements.lapTimeMedian.textContent = '-';
+            this.elements.lapTimeSpread.textContent = '中位数';
 
             // 清空相对分析表格
             this.elements.relativeAnalysisTableBody.innerHTML = '<tr><td colspan="5">暂无数据</td></tr>';
             return;
         }
 
-        this.addDebugLog('计算统计数据...');
-        const times = this.lapData.map(lap => lap.time);
-        const speeds = this.lapData.map(lap => lap.speed);
-
-        // 基本统计
-        const totalTime = times.reduce((sum, time) => sum + time, 0);
-        const averageTime = totalTime / times.length;
-        const averageSpeed = speeds.reduce((sum, speed) => sum + speed, 0) / speeds.length;
+        const fastestCombo = this.getFastestCombo();
 
-        // 最值
-        const minTime = Math.min(...times);
-        const maxTime = Math.max(...times);
-        const maxSpeed = Math.max(...speeds);
-
-        const fastestLapData = this.lapData.find(lap => lap.time === minTime);
-        const slowestLapData = this.lapData.find(lap => lap.time === maxTime);
-        const fastestSpeedData = this.lapData.find(lap => lap.speed === maxSpeed);
-
-        // 最快连续组合
-        const fastestCombo = this.findFastestContinuousLaps(this.lapCountSetting);
-
-        this.addDebugLog('更新显示元素...');
         // 更新显示
         this.elements.fastestComboTime.textContent = `${fastestCombo.total.toFixed(3)} s`;
         this.elements.fastestComboRange.textContent = fastestCombo.range;
-        this.elements.overallAverage.textContent = `${averageTime.toFixed(3)} s`;
-        this.elements.overallAverageSpeed.textContent = `平均速度: ${averageSpeed.toFixed(2)} m/s`;
-        this.elements.fastestSingleLap.textContent = `${minTime.toFixed(3)} s`;
-        this.elements.fastestSingleLapNumber.textContent = `第${fastestLapData.lap}圈`;
-        this.elements.slowestSingleLap.textContent = `${maxTime.toFixed(3)} s`;
-        this.elements.slowestSingleLapNumber.textContent = `第${slowestLapData.lap}圈`;
-        this.elements.timeDifference.textContent = `${(maxTime - minTime).toFixed(3)} s`;
-        this.elements.fastestSpeed.textContent = `${maxSpeed.toFixed(2)} m/s`;
-        this.elements.fastestSpeedLap.textContent = `第${fastestSpeedData.lap}圈`;
+        this.elements.overallAverage.textContent = `${summary.mean.toFixed(3)} s`;
+        this.elements.overallAverageSpeed.textContent = `平均速度: ${summary.speed_mean.toFixed(2)} m/s`;
+        this.elements.fastestSingleLap.textContent = `${summary.min.toFixed(3)} s`;
+        this.elements.fastestSingleLapNumber.textContent = `第${summary.min_lap}圈`;
+        this.elements.slowestSingleLap.textContent = `${summary.max.toFixed(3)} s`;
+        this.elements.slowestSingleLapNumber.textContent = `第${summary.max_lap}圈`;
+        this.elements.timeDifference.textContent = `${(summary.max - summary.min).toFixed(3)} s`;
+        this.elements.fastestSpeed.textContent = `${summary.speed_max.toFixed(2)} m/s`;
+        this.elements.fastestSpeedLap.textContent = `第${summary.speed_max_lap}圈`;
+        this.elements.lapTimeMedian.textContent = `${summary.p50.toFixed(3)} s`;
+        this.elements.lapTimeSpread.textContent =
+            `P10 ${summary.p10.toFixed(3)} / P90 ${summary.p90.toFixed(3)} · 标准差 ${summary.std.toFixed(3)}`;
 
         // 更新相对分析表格
         this.updateRelativeAnalysisTable();
-        this.addDebugLog('智能统计更新完成');
     }
 
-    // 更新相对分析表格
+    // 更新相对分析表格: 只在详细视图显示时生成，由Worker拼接HTML，同一时间只有一个请求在途
     updateRelativeAnalysisTable() {
         const tableBody = this.elements.relativeAnalysisTableBody;
 
-        if (this.lapData.length === 0) {
+        if (this.lapData.length === 0 || !this.sessionSummary) {
             tableBody.innerHTML = '<tr><td colspan="5" style="text-align: center; color: #78909c;">暂无数据</td></tr>';
             return;
         }
+        if (!this.showDetailsView) {
+            return;
+        }
 
-        const times = this.lapData.map(lap => lap.time);
-        const fastestTime = Math.min(...times);
-
-        tableBody.innerHTML = '';
-
-        this.lapData.forEach(lap => {
-            const timeDiff = lap.time - fastestTime;
-            const percentDiff = ((lap.time - fastestTime) / fastestTime * 100);
-            const isFastest = lap.time === fastestTime;
+        const fastestTime = this.sessionSummary.min;
+        if (!this.statsWorker) {
+            tableBody.innerHTML = relativeTableHtml(this.lapData, fastestTime);
+            return;
+        }
+        if (this.relativeInFlight) {
+            this.dirty.relative = true;
+            return;
+        }
 
-            const row = document.createElement('tr');
-            if (isFastest) {
-                row.className = 'fastest-lap';
+        this.relativeInFlight = true;
+        this.dirty.relative = false;
+        this.requestWorker({ type: 'relative', fastestTime: fastestTime }).then(result => {
+            this.relativeInFlight = false;
+            tableBody.innerHTML = result ? result.html : relativeTableHtml(this.lapData, fastestTime);
+            // 等待期间又有新数据
+            if (this.dirty.relative) {
+                this.updateRelativeAnalysisTable();
             }
-
-            row.innerHTML = `
-                <td>第${lap.lap}圈</td>
-                <td>${lap.time.toFixed(3)}</td>
-                <td>${lap.speed.toFixed(2)}</td>
-                <td>${isFastest ? '0.000' : '+' + timeDiff.toFixed(3)}</td>
-                <td>${isFastest ? '0.0%' : '+' + percentDiff.toFixed(1) + '%'}</td>
-            `;
-
-            tableBody.appendChild(row);
         });
     }
 
@@ -998,8 +992,23 @@ class SpeedMonitorApp {
         this.addDebugLog('正在连接WebSocket服务器...');
 
         try {
-            const wsUrl = `ws://${window.location.host}/ws`;
+            // delta=1: lap_data中未变化的统计字段以增量形式发送
+            // encoding=msgpack: 使用MessagePack二进制帧，服务端未安装msgpack时仍发送JSON文本帧
+            // 重连时带上最后收到的序号，服务端补发错过的消息或发送状态快照
+            const resuming = this.lastSeq !== null && this.epoch !== null;
+            let wsUrl = `ws://${window.location.host}/ws?delta=1`;
+            if (typeof decodeMsgpack === 'function') {
+                wsUrl += '&encoding=msgpack';
+            }
+            if (this.deviceId) {
+                // 只订阅指定设备的广播
+                wsUrl += `&devices=${encodeURIComponent(this.deviceId)}`;
+            }
+            if (resuming) {
+                wsUrl += `&last_seq=${this.lastSeq}&epoch=${encodeURIComponent(this.epoch)}`;
+            }
             this.ws = new WebSocket(wsUrl);
+            this.ws.binaryType = 'arraybuffer';
 
             this.ws.onopen = () => {
                 this.isConnected = true;
@@ -1012,7 +1021,9 @@ class SpeedMonitorApp {
                         this.performAutoReset();
                         this.hasInitialReset = true;
                     }
-                    this.requestCurrentStats();
+                    if (!resuming) {
+                        this.requestCurrentStats();
+                    }
                 }, 500);
 
                 // 不再自动启动监测，等待用户手动启动
@@ -1020,12 +1031,20 @@ class SpeedMonitorApp {
             };
 
             this.ws.onmessage = (event) => {
-                try {
-                    const data = JSON.parse(event.data);
-                    this.handleMessage(data);
-                } catch (e) {
-                    this.addDebugLog(`消息解析错误: ${e.message}`, 'error');
-                }
+                // 二进制帧交给Worker解码，文本帧直接解析，都按到达顺序处理
+                const decoded = typeof event.data === 'string' ? event.data : this.decodeBinary(event.data);
+                this.inbound = this.inbound
+                    .then(() => decoded)
+                    .then(payload => {
+                        const data = this.applyStatsDelta(typeof payload === 'string' ? JSON.parse(payload) : payload);
+                        if (typeof data.seq === 'number') {
+                            this.lastSeq = data.seq;
+                        }
+                        this.enqueueMessage(data);
+                    })
+                    .catch(e => {
+                        this.addDebugLog(`消息解析错误: ${e.message}`, 'error');
+                    });
             };
 
             this.ws.onclose = () => {
@@ -1051,6 +1070,39 @@ class SpeedMonitorApp {
         }
     }
 
+    // 解码MessagePack二进制帧，Worker不可用时在主线程解码
+    decodeBinary(buffer) {
+        return this.requestWorker({ type: 'decode', payload: buffer }).then(result => {
+            if (!result) {
+                return decodeMsgpack(buffer);
+            }
+            if (result.error) {
+                throw new Error(result.error);
+            }
+            return result.message;
+        });
+    }
+
+    // 将增量统计合并为完整的laps_stats和summary
+    applyStatsDelta(data) {
+        if (data.type !== 'lap_data') {
+            return data;
+        }
+
+        const device = data.device || '';
+        if (data.laps_stats_delta) {
+            data.laps_stats = { ...this.lastLapsStats[device], ...data.laps_stats_delta };
+            delete data.laps_stats_delta;
+        }
+        if (data.summary_delta) {
+            data.summary = { ...this.lastSummary[device], ...data.summary_delta };
+            delete data.summary_delta;
+        }
+        this.lastLapsStats[device] = data.laps_stats;
+        this.lastSummary[device] = data.summary;
+        return data;
+    }
+
     startMonitoring() {
         if (!this.isConnected) {
             this.addDebugLog('WebSocket未连接，无法开始监测', 'error');
@@ -1065,6 +1117,7 @@ class SpeedMonitorApp {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'start_monitoring',
+                device: this.deviceId,
                 timestamp: Date.now()
             }));
         }
@@ -1079,6 +1132,7 @@ class SpeedMonitorApp {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'stop_monitoring',
+                device: this.deviceId,
                 timestamp: Date.now()
             }));
         }
@@ -1128,9 +1182,25 @@ class SpeedMonitorApp {
     }
 
     handleMessage(data) {
+        // 指定设备时忽略其他设备的数据
+        if (this.deviceId && data.device && data.device !== this.deviceId) {
+            return;
+        }
+
         this.addDebugLog(`收到消息: ${data.type}`);
 
         switch (data.type) {
+            case 'hello':
+                this.epoch = data.epoch;
+                if (data.resume === 'replay') {
+                    this.addDebugLog(`已恢复连接，补发 ${data.replayed} 条消息`);
+                }
+                break;
+
+            case 'snapshot':
+                this.applySnapshot(data.devices);
+                break;
+
             case 'init':
                 this.addDebugLog(data.message);
                 break;
@@ -1159,8 +1229,11 @@ class SpeedMonitorApp {
                 break;
 
             case 'current_stats':
+                this.sessionSummary = data.summary || null;
+                this.bestLaps = data.laps_stats ? data.laps_stats.best_laps : null;
+                this.markDirty('stats');
                 if (data.laps_stats) {
-                    this.updateStatsDisplay(data.laps_stats);
+                    this.pendingLapsStats = data.laps_stats;
                     this.addDebugLog('统计数据已刷新');
                 } else {
                     this.addDebugLog('暂无统计数据');
@@ -1168,13 +1241,18 @@ class SpeedMonitorApp {
 
                 // 更新基本数据显示
                 if (typeof data.current_lap !== 'undefined') {
-                    this.elements.currentLap.textContent = data.current_lap;
-                }
-                if (typeof data.total_time !== 'undefined') {
-                    this.elements.totalTime.textContent = `${data.total_time.toFixed(3)} s`;
+                    this.setHeader(data.current_lap, `${data.total_time.toFixed(3)} s`);
                 }
                 break;
 
+            case 'subscribed':
+                this.addDebugLog(`订阅已更新: 设备 ${(data.devices || ['全部']).join(', ')}`);
+                break;
+
+            case 'device_list':
+                this.addDebugLog(`在线设备: ${data.devices.map(d => d.device).join(', ') || '无'}`);
+                break;
+
             case 'error':
                 this.addDebugLog(`错误: ${data.message}`, 'error');
                 break;
@@ -1184,61 +1262,328 @@ class SpeedMonitorApp {
         }
     }
 
+    // 重连后落后太多时，用服务端的状态快照恢复显示，并从历史接口补齐圈速列表
+    applySnapshot(devices) {
+        if (!devices) {
+            this.addDebugLog('状态快照不可用，重新请求统计数据');
+            this.requestCurrentStats();
+            return;
+        }
+
+        // 指定设备时取该设备，否则取最近活跃的设备
+        const candidates = this.deviceId ? devices.filter(d => d.device === this.deviceId) : devices;
+        const state = candidates.reduce((a, b) => (a && a.idle <= b.idle ? a : b), null);
+        if (!state) {
+            this.addDebugLog('状态快照中没有设备数据');
+            return;
+        }
+
+        this.addDebugLog(`已从状态快照恢复: 第${state.current_lap}圈`);
+        this.isMonitoring = state.monitoring;
+        this.updateMonitoringButtons();
+        this.setHeader(state.current_lap, `${state.total_time.toFixed(3)} s`);
+        this.sessionSummary = state.summary || null;
+        this.bestLaps = state.laps_stats ? state.laps_stats.best_laps : null;
+        this.markDirty('stats');
+        if (state.laps_stats) {
+            this.lastLapsStats[state.device] = state.laps_stats;
+            this.lastSummary[state.device] = state.summary;
+            this.pendingLapsStats = state.laps_stats;
+        }
+
+        if (state.session !== this.sessionId) {
+            this.replaceLaps([]);
+            this.sessionId = state.session;
+        }
+        if (state.current_lap > 0) {
+            this.backfillLaps(state.session, state.current_lap);
+        }
+    }
+
+    // 从圈速历史接口补齐断线期间的圈，与已收到的圈按圈号合并
+    async backfillLaps(session, currentLap) {
+        const startLap = Math.max(1, currentLap - this.maxDataPoints + 1);
+        try {
+            const response = await fetch(`/api/sessions/${session}/laps?start_lap=${startLap}&limit=${this.maxDataPoints}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const page = await response.json();
+            if (session !== this.sessionId) {
+                return; // 等待期间会话已变化
+            }
+
+            // 与lap_data消息相同的精度，相对分析按数值比较最快圈
+            const laps = new Map(page.laps.map(lap => [lap.lap_number, {
+                lap: lap.lap_number,
+                time: Math.round(lap.lap_time * 1000) / 1000,
+                speed: Math.round(lap.speed * 100) / 100,
+                timestamp: lap.timestamp
+            }]));
+            this.lapData.forEach(lap => laps.set(lap.lap, lap));
+            this.replaceLaps([...laps.values()].sort((a, b) => a.lap - b.lap).slice(-this.maxDataPoints));
+            this.addDebugLog(`已补齐圈速历史: ${page.laps.length}圈`);
+        } catch (e) {
+            this.addDebugLog(`补齐圈速历史失败: ${e.message}`, 'error');
+        }
+    }
+
     handleLapData(data) {
+        // 重连恢复期间可能重复收到已有的圈
+        if (data.session === this.sessionId && this.lapData.length > 0
+            && data.lap_number <= this.lapData[this.lapData.length - 1].lap) {
+            return;
+        }
+        this.sessionId = data.session;
+        this.sessionSummary = data.summary || null;
+        if (data.laps_stats) {
+            this.bestLaps = data.laps_stats.best_laps;
+        }
+
         this.addDebugLog(`第${data.lap_number}圈: ${data.lap_time}s, 速度: ${data.speed}m/s`);
 
         // 更新基本统计
-        this.elements.currentLap.textContent = data.lap_number;
-        this.elements.totalTime.textContent = `${data.total_time} s`;
+        this.setHeader(data.lap_number, `${data.total_time} s`);
 
         // 添加到数据数组，包含速度信息
-        this.lapData.push({
+        this.appendLap({
             lap: data.lap_number,
             time: data.lap_time,
             speed: data.speed,
             timestamp: data.timestamp
         });
+        this.markDirty('stats');
+
+        // 更新统计信息
+        if (data.laps_stats) {
+            this.pendingLapsStats = data.laps_stats;
+        }
+    }
+
+    // 追加一圈（渲染在下一帧进行）
+    appendLap(lap) {
+        this.lapData.push(lap);
+        this.appendedLaps.push(lap);
 
         // 限制数据点数量
         if (this.lapData.length > this.maxDataPoints) {
             this.lapData.shift();
         }
+        this.markDirty('laps');
+    }
 
-        // 更新显示
-        this.updateLapDetails();
-        this.updateChart();
-        this.updateIntelligentStats();
+    // 整体替换圈速数组（重置、补齐历史）
+    replaceLaps(laps) {
+        this.lapData = laps;
+        this.lapsReset = true;
+        this.appendedLaps = [];
+        this.markDirty('laps', 'stats');
+    }
 
-        // 更新统计信息
-        if (data.laps_stats) {
-            this.updateStatsDisplay(data.laps_stats);
+    setHeader(currentLap, totalTime) {
+        this.header = { currentLap: String(currentLap), totalTime: totalTime };
+        this.markDirty('header');
+    }
+
+    // 缓冲收到的消息，在下一帧统一处理
+    enqueueMessage(data) {
+        this.pendingMessages.push(data);
+        this.scheduleRender();
+    }
+
+    markDirty(...parts) {
+        parts.forEach(part => { this.dirty[part] = true; });
+        this.scheduleRender();
+    }
+
+    scheduleRender() {
+        if (this.renderScheduled) {
+            return;
+        }
+        this.renderScheduled = true;
+        // 后台标签页不触发动画帧，改用定时器避免消息无限堆积
+        if (document.hidden) {
+            setTimeout(() => this.renderFrame(), 250);
+        } else {
+            requestAnimationFrame(() => this.renderFrame());
+        }
+    }
+
+    // 每帧一次: 处理缓冲的消息，再只重绘有变化的部分
+    renderFrame() {
+        const start = performance.now();
+        let messages = [];
+        try {
+            messages = this.applyFrame();
+        } finally {
+            // 帧内产生的更新已在本帧处理，结束后才允许安排下一帧
+            this.renderScheduled = false;
         }
+        this.recordRenderCost(performance.now() - start, messages.length);
     }
 
-    updateLapDetails() {
+    applyFrame() {
+
+        const messages = this.pendingMessages;
+        this.pendingMessages = [];
+        messages.forEach(message => this.handleMessage(message));
+
+        if (this.dirty.header) {
+            this.elements.currentLap.textContent = this.header.currentLap;
+            this.elements.totalTime.textContent = this.header.totalTime;
+        }
+        if (this.dirty.laps) {
+            this.renderLapList();
+            this.renderChart();
+            this.syncStatsWorker();
+        }
+        if (this.dirty.stats) {
+            this.updateIntelligentStats();
+        }
+        if (this.pendingLapsStats) {
+            this.updateStatsDisplay(this.pendingLapsStats);
+            this.pendingLapsStats = null;
+        }
+        this.dirty.header = this.dirty.laps = this.dirty.stats = false;
+        this.lapsReset = false;
+        this.appendedLaps = [];
+        this.flushDebugLog();
+        return messages;
+    }
+
+    // 统计每帧渲染耗时，每10秒输出一次
+    recordRenderCost(elapsed, messageCount) {
+        const stats = this.renderStats;
+        stats.frames++;
+        stats.messages += messageCount;
+        stats.totalMs += elapsed;
+        stats.maxMs = Math.max(stats.maxMs, elapsed);
+
+        const now = performance.now();
+        if (now - stats.since >= 10000 && stats.messages > 0) {
+            console.log(`[Speed Monitor] 渲染: ${stats.frames}帧, ${stats.messages}条消息, ` +
+                `平均 ${(stats.totalMs / stats.frames).toFixed(2)}ms/帧, 最长 ${stats.maxMs.toFixed(2)}ms`);
+            this.renderStats = { frames: 0, messages: 0, totalMs: 0, maxMs: 0, since: now };
+        }
+    }
+
+    // 圈速列表: 增量追加新圈并移除超出显示上限的旧圈，只在整体替换时重建
+    renderLapList() {
         const lapDetails = this.elements.lapDetails;
 
         if (this.lapData.length === 0) {
             lapDetails.innerHTML = '<div class="lap-item">暂无圈速数据</div>';
+            this.lapListNotice = null;
             return;
         }
 
-        // 显示最近的圈数（倒序），最多显示1000条
-        const displayCount = Math.min(this.lapData.length, this.maxLapDisplayCount);
-        const recentLaps = this.lapData.slice(-displayCount);
+        const rebuild = this.lapsReset || !lapDetails.querySelector('.lap-item[data-lap]');
+        const laps = rebuild ? this.lapData.slice(-this.maxLapDisplayCount) : this.appendedLaps;
+        if (rebuild) {
+            lapDetails.textContent = '';
+            this.lapListNotice = null;
+        }
 
-        lapDetails.innerHTML = recentLaps.map(lap =>
-            `<div class="lap-item">第${lap.lap}圈: ${lap.time}s | ${lap.speed}m/s</div>`
-        ).join('');
+        const fragment = document.createDocumentFragment();
+        laps.forEach(lap => {
+            const item = document.createElement('div');
+            item.className = 'lap-item';
+            item.dataset.lap = lap.lap;
+            item.textContent = `第${lap.lap}圈: ${lap.time}s | ${lap.speed}m/s`;
+            fragment.appendChild(item);
+        });
+        lapDetails.appendChild(fragment);
+
+        // 最多显示maxLapDisplayCount条
+        const items = lapDetails.getElementsByClassName('lap-item');
+        let excess = items.length - this.maxLapDisplayCount;
+        while (excess-- > 0) {
+            lapDetails.removeChild(items[0]);
+        }
 
         // 如果有数据被截断，显示提示
         if (this.lapData.length > this.maxLapDisplayCount) {
-            lapDetails.innerHTML = `
-                <div style="background: linear-gradient(135deg, #ff7043 0%, #ff5722 100%); color: white; padding: 8px 12px; margin: 3px 0; border-radius: 8px; text-align: center; font-weight: 600;">
-                    显示最近${this.maxLapDisplayCount}圈数据 (共${this.lapData.length}圈)
-                </div>
-            ` + lapDetails.innerHTML;
+            if (!this.lapListNotice) {
+                this.lapListNotice = document.createElement('div');
+                this.lapListNotice.style.cssText = 'background: linear-gradient(135deg, #ff7043 0%, #ff5722 100%); color: white; padding: 8px 12px; margin: 3px 0; border-radius: 8px; text-align: center; font-weight: 600;';
+                lapDetails.insertBefore(this.lapListNotice, lapDetails.firstChild);
+            }
+            this.lapListNotice.textContent = `显示最近${this.maxLapDisplayCount}圈数据 (共${this.lapData.length}圈)`;
+        }
+    }
+
+    // 图表: 增量追加数据点，超出上限时移除最旧的点
+    renderChart() {
+        const labels = this.chart.data.labels;
+        const speeds = this.chart.data.datasets[0].data;
+
+        if (this.lapsReset) {
+            this.chart.data.labels = this.lapData.map(d => `第${d.lap}圈`);
+            this.chart.data.datasets[0].data = this.lapData.map(d => d.speed);
+        } else {
+            this.appendedLaps.forEach(d => {
+                labels.push(`第${d.lap}圈`);
+                speeds.push(d.speed);
+            });
+            const excess = labels.length - this.maxDataPoints;
+            if (excess > 0) {
+                labels.splice(0, excess);
+                speeds.splice(0, excess);
+            }
+        }
+        this.chart.update('none');
+    }
+
+    // 创建统计计算Worker，不支持时返回null，在主线程计算
+    createStatsWorker() {
+        if (typeof Worker === 'undefined') {
+            return null;
+        }
+        try {
+            // 与页面中的<script>使用同一个(带内容哈希的)地址，直接命中浏览器缓存
+            const script = document.querySelector('script[src*="/static/stats-worker"]');
+            const worker = new Worker(script ? script.src : '/static/stats-worker.js');
+            worker.onmessage = (event) => {
+                const resolve = this.workerRequests.get(event.data.id);
+                if (resolve) {
+                    this.workerRequests.delete(event.data.id);
+                    resolve(event.data);
+                }
+            };
+            worker.onerror = (error) => {
+                console.log(`[Speed Monitor] 统计Worker出错，改为主线程计算: ${error.message}`);
+                this.statsWorker = null;
+                this.workerRequests.forEach(resolve => resolve(null));
+                this.workerRequests.clear();
+            };
+            return worker;
+        } catch (e) {
+            return null;
+        }
+    }
+
+    // 把圈速数组的变化同步给Worker
+    syncStatsWorker() {
+        if (!this.statsWorker) {
+            return;
         }
+        if (this.lapsReset) {
+            this.statsWorker.postMessage({ type: 'reset', laps: this.lapData, maxLaps: this.maxDataPoints });
+        } else if (this.appendedLaps.length > 0) {
+            this.statsWorker.postMessage({ type: 'append', laps: this.appendedLaps });
+        }
+    }
+
+    // 向Worker发送请求，Worker不可用时resolve(null)
+    requestWorker(message) {
+        if (!this.statsWorker) {
+            return Promise.resolve(null);
+        }
+        const id = ++this.workerRequestId;
+        return new Promise(resolve => {
+            this.workerRequests.set(id, resolve);
+            this.statsWorker.postMessage({ ...message, id: id });
+        });
     }
 
     updateStatsDisplay(lapsStats) {
@@ -1381,15 +1726,6 @@ updateRecentLapsDetails(recentLaps, lapCount) {
         recentLapsDetails.innerHTML = detailsHTML;
     }
 
-    updateChart() {
-        const labels = this.lapData.map(d => `第${d.lap}圈`);
-        const speeds = this.lapData.map(d => d.speed);
-
-        this.chart.data.labels = labels;
-        this.chart.data.datasets[0].data = speeds;
-        this.chart.update('none');
-    }
-
     openSettings() {
         this.elements.settingsModal.style.display = 'block';
         this.elements.settingLapNumber.value = this.lapCountSetting;
@@ -1417,14 +1753,15 @@ updateRecentLapsDetails(recentLaps, lapCount) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'update_lap_count',
+                device: this.deviceId,
                 lap_count: newCount,
                 timestamp: Date.now()
             }));
             this.addDebugLog(`更新统计圈数为: ${newCount}`);
         }
 
-        // 立即更新智能统计
-        this.updateIntelligentStats();
+        // 更新智能统计
+        this.markDirty('stats');
     }
 
     toggleDebugDisplay() {
@@ -1439,6 +1776,7 @@ updateRecentLapsDetails(recentLaps, lapCount) {
             if (this.ws && this.ws.readyState === WebSocket.OPEN) {
                 this.ws.send(JSON.stringify({
                     type: 'reset_data',
+                    device: this.deviceId,
                     timestamp: Date.now(),
                     reason: 'manual_reset'
                 }));
@@ -1454,6 +1792,7 @@ updateRecentLapsDetails(recentLaps, lapCount) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'request_current_stats',
+                device: this.deviceId,
                 timestamp: Date.now()
             }));
             this.addDebugLog('请求当前统计数据');
@@ -1465,26 +1804,39 @@ updateRecentLapsDetails(recentLaps, lapCount) {
     addDebugLog(message, type = 'info') {
         if (!this.showDebug) return;
 
-        const debugContent = this.elements.debugContent;
         const time = new Date().toLocaleTimeString();
+        this.pendingDebugEntries.push({ text: `[${time}] ${message}`, type: type });
+        this.scheduleRender();
 
-        const entry = document.createElement('div');
-        entry.style.color = type === 'error' ? '#f44336' : '#37474f';
-        entry.innerHTML = `[${time}] ${message}`;
+        // 同时输出到控制台
+        console.log(`[Speed Monitor] ${message}`);
+    }
 
-        debugContent.appendChild(entry);
+    // 每帧一次把缓冲的调试日志写入页面
+    flushDebugLog() {
+        if (this.pendingDebugEntries.length === 0) {
+            return;
+        }
+        const debugContent = this.elements.debugContent;
+        const fragment = document.createDocumentFragment();
+        this.pendingDebugEntries.slice(-100).forEach(item => {
+            const entry = document.createElement('div');
+            entry.style.color = item.type === 'error' ? '#f44336' : '#37474f';
+            entry.innerHTML = item.text;
+            fragment.appendChild(entry);
+        });
+        this.pendingDebugEntries = [];
+        debugContent.appendChild(fragment);
 
         // 限制日志条数
         const entries = debugContent.children;
-        if (entries.length > 100) {
+        let excess = entries.length - 100;
+        while (excess-- > 0) {
             debugContent.removeChild(entries[0]);
         }
 
         // 滚动到底部
         debugContent.scrollTop = debugContent.scrollHeight;
-
-        // 同时输出到控制台
-        console.log(`[Speed Monitor] ${message}`);
     }
 
     // 页面加载时自动重置数据
@@ -1501,6 +1853,7 @@ updateRecentLapsDetails(recentLaps, lapCount) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'reset_data',
+                device: this.deviceId,
                 timestamp: Date.now(),
                 reason: 'page_unload'
             }));
@@ -1518,6 +1871,7 @@ updateRecentLapsDetails(recentLaps, lapCount) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 type: 'reset_data',
+                device: this.deviceId,
                 timestamp: Date.now(),
                 reason: 'auto_reset'
             }));
@@ -1530,23 +1884,16 @@ updateRecentLapsDetails(recentLaps, lapCount) {
 
     // 重置前端数据（不需要确认）
     resetFrontendData() {
-        this.lapData = [];
+        this.sessionSummary = null;
+        this.bestLaps = null;
+        this.pendingLapsStats = null;
 
-        // 重置显示
-        this.elements.currentLap.textContent = '0';
-        this.elements.totalTime.textContent = '0.000 s';
-        this.elements.lapDetails.innerHTML = '<div class="lap-item">暂无圈速数据</div>';
+        // 重置显示（圈速列表、图表和智能统计在下一帧重建）
+        this.replaceLaps([]);
+        this.setHeader('0', '0.000 s');
         this.elements.recentLapsDetails.innerHTML = '<div class="recent-lap-item">暂无数据</div>';
         this.elements.statsSection.style.display = 'none';
 
-        // 清空图表，保持示例数据结构
-        this.chart.data.labels = [];
-        this.chart.data.datasets[0].data = [];
-        this.chart.update();
-
-        // 重置智能统计
-        this.updateIntelligentStats();
-
         this.addDebugLog('前端数据已重置，等待新数据');
     }
 }
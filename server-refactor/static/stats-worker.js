@@ -0,0 +1,160 @@
+/**
+ * 速度监测系统 - 统计计算Worker
+ * 在后台线程保存一份圈速数据，生成相对分析表格和导出表格的数据，主线程只负责写入DOM/画布；
+ * 使用MessagePack编码时也在这里解码WebSocket二进制帧
+ * 同一文件也作为普通脚本加载，浏览器不支持Worker时主线程直接调用下面的函数
+ */
+
+// 单圈相对最快圈的表格行: [圈数, 圈速, 速度, 相对最快圈, 百分比差值]
+function relativeRow(lap, fastestTime) {
+    const isFastest = lap.time === fastestTime;
+    const timeDiff = lap.time - fastestTime;
+    const percentDiff = fastestTime > 0 ? timeDiff / fastestTime * 100 : 0;
+    return {
+        isFastest: isFastest,
+        cells: [
+            `第${lap.lap}圈`,
+            lap.time.toFixed(3),
+            lap.speed.toFixed(2),
+            isFastest ? '0.000' : '+' + timeDiff.toFixed(3),
+            isFastest ? '0.0%' : '+' + percentDiff.toFixed(1) + '%'
+        ]
+    };
+}
+
+// 相对分析表格的HTML
+function relativeTableHtml(laps, fastestTime) {
+    const parts = new Array(laps.length);
+    for (let i = 0; i < laps.length; i++) {
+        const row = relativeRow(laps[i], fastestTime);
+        parts[i] = `<tr${row.isFastest ? ' class="fastest-lap"' : ''}><td>${row.cells.join('</td><td>')}</td></tr>`;
+    }
+    return parts.join('');
+}
+
+// 导出图片中的表格行（最多maxRows行）
+function exportTableRows(laps, fastestTime, maxRows) {
+    return laps.slice(0, maxRows).map(lap => relativeRow(lap, fastestTime));
+}
+
+// MessagePack解码，支持服务端msgpack.packb会产生的所有类型(不含扩展类型)
+const utf8Decoder = new TextDecoder('utf-8');
+
+function decodeMsgpack(buffer) {
+    const bytes = new Uint8Array(buffer);
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let offset = 0;
+
+    const str = (length) => {
+        const value = utf8Decoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    };
+    const bin = (length) => {
+        const value = bytes.slice(offset, offset + length);
+        offset += length;
+        return value;
+    };
+    const array = (length) => {
+        const value = new Array(length);
+        for (let i = 0; i < length; i++) {
+            value[i] = read();
+        }
+        return value;
+    };
+    const map = (length) => {
+        const value = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            value[key] = read();
+        }
+        return value;
+    };
+    // 64位整数超出2^53时会损失精度，消息中不会出现这么大的数
+    const uint64 = () => view.getUint32(offset) * 4294967296 + view.getUint32(offset + 4);
+    const int64 = () => view.getInt32(offset) * 4294967296 + view.getUint32(offset + 4);
+    const next = (size, value) => {
+        offset += size;
+        return value;
+    };
+
+    function read() {
+        const type = bytes[offset++];
+        if (type <= 0x7f) return type;
+        if (type <= 0x8f) return map(type & 0x0f);
+        if (type <= 0x9f) return array(type & 0x0f);
+        if (type <= 0xbf) return str(type & 0x1f);
+        if (type >= 0xe0) return type - 0x100;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return bin(next(1, view.getUint8(offset)));
+            case 0xc5: return bin(next(2, view.getUint16(offset)));
+            case 0xc6: return bin(next(4, view.getUint32(offset)));
+            case 0xca: return next(4, view.getFloat32(offset));
+            case 0xcb: return next(8, view.getFloat64(offset));
+            case 0xcc: return next(1, view.getUint8(offset));
+            case 0xcd: return next(2, view.getUint16(offset));
+            case 0xce: return next(4, view.getUint32(offset));
+            case 0xcf: return next(8, uint64());
+            case 0xd0: return next(1, view.getInt8(offset));
+            case 0xd1: return next(2, view.getInt16(offset));
+            case 0xd2: return next(4, view.getInt32(offset));
+            case 0xd3: return next(8, int64());
+            case 0xd9: return str(next(1, view.getUint8(offset)));
+            case 0xda: return str(next(2, view.getUint16(offset)));
+            case 0xdb: return str(next(4, view.getUint32(offset)));
+            case 0xdc: return array(next(2, view.getUint16(offset)));
+            case 0xdd: return array(next(4, view.getUint32(offset)));
+            case 0xde: return map(next(2, view.getUint16(offset)));
+            case 0xdf: return map(next(4, view.getUint32(offset)));
+            default:
+                throw new Error(`不支持的MessagePack类型: 0x${type.toString(16)}`);
+        }
+    }
+
+    return read();
+}
+
+if (typeof WorkerGlobalScope !== 'undefined' && self instanceof WorkerGlobalScope) {
+    let laps = [];
+    let maxLaps = 1000;
+
+    self.onmessage = (event) => {
+        const message = event.data;
+        switch (message.type) {
+            case 'reset':
+                laps = message.laps;
+                maxLaps = message.maxLaps || maxLaps;
+                break;
+
+            case 'append':
+                laps.push(...message.laps);
+                if (laps.length > maxLaps) {
+                    laps.splice(0, laps.length - maxLaps);
+                }
+                break;
+
+            case 'relative':
+                self.postMessage({ id: message.id, html: relativeTableHtml(laps, message.fastestTime) });
+                break;
+
+            case 'decode':
+                try {
+                    self.postMessage({ id: message.id, message: decodeMsgpack(message.payload) });
+                } catch (e) {
+                    self.postMessage({ id: message.id, error: e.message });
+                }
+                break;
+
+            case 'exportTable':
+                self.postMessage({
+                    id: message.id,
+                    rows: exportTableRows(laps, message.fastestTime, message.maxRows),
+                    total: laps.length
+                });
+                break;
+        }
+    };
+}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试从server-refactor目录导入 main、config 和 services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
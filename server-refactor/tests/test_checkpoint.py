@@ -0,0 +1,92 @@
+"""检查点与日志尾部重放"""
+
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+
+from services.device_registry import DeviceRegistry
+from services.lap_log import LapLog
+
+ADDR = ('192.168.1.50', 4210)
+
+
+class Recorder:
+    """记录广播消息的WebSocket管理器替身"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_data(self, message: dict):
+        self.messages.append(message)
+
+
+def feed(processor, start_ms: int, laps: range):
+    async def run():
+        for n in laps:
+            # 圈用时在1.0-1.6秒之间变化，最快连续k圈不总是最近的几圈
+            await processor.process_measurement(10.0 + n % 5, ADDR, received_at=start_ms + n * 1000 + (n * 37) % 600)
+    asyncio.run(run())
+
+
+def live_registry(path: str):
+    log = LapLog(path, flush_interval=60)
+    log.start()
+    registry = DeviceRegistry(Recorder(), lap_log=log, checkpoint_interval=5)
+    registry.set_monitoring(True)
+    return log, registry, registry.get_or_create('dev')
+
+
+def restored_registry(path: str):
+    registry = DeviceRegistry(Recorder(), lap_log=LapLog(path))
+    assert registry.restore(max_gap=3600) == 1
+    return registry.devices['dev']
+
+
+def assert_same_state(restored, live):
+    assert restored.session_id == live.session_id
+    assert restored.lap_count == live.lap_count
+    assert restored.total_time == live.total_time
+    assert restored.last_data_time == live.last_data_time
+    assert restored.stats_index.best == live.stats_index.best
+    assert restored._get_laps_stats() == live._get_laps_stats()
+    assert restored.session_stats.summary() == live.session_stats.summary()
+    # 恢复后内存中只有检查点窗口和日志尾部，LapStore按圈号偏移(base)访问
+    assert restored.laps.first_lap > 1
+    for lap_number in range(restored.laps.first_lap, restored.lap_count + 1):
+        assert restored.laps.get(lap_number) == live.laps.get(lap_number)
+    assert restored.laps.get(restored.laps.first_lap - 1) is None
+
+
+def test_checkpoint_and_tail_replay_round_trip(tmp_path):
+    path = str(tmp_path / 'laps.db')
+    start_ms = time.time_ns() // 1_000_000 - 120_000
+    log, registry, live = live_registry(path)
+    feed(live, start_ms, range(0, 41))
+    assert registry.save_checkpoints() == 1
+    feed(live, start_ms, range(41, 48))  # 检查点之后的圈只在日志中
+    log.stop()
+
+    restored = restored_registry(path)
+    assert restored.lap_count == 47
+    assert_same_state(restored, live)
+
+
+def test_paused_device_keeps_checkpoint_alive(tmp_path):
+    """暂停中的设备没有新圈，检查点时间仍随心跳更新，重启后不会被当作空闲超时"""
+    path = str(tmp_path / 'laps.db')
+    start_ms = time.time_ns() // 1_000_000 - 120_000
+    log, registry, live = live_registry(path)
+    feed(live, start_ms, range(0, 21))
+    registry.save_checkpoints()
+    log.stop()
+    # 模拟暂停了20分钟: 检查点已超过空闲超时，设备仍在发送心跳
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("UPDATE checkpoints SET taken_at = taken_at - 1200000")
+
+    log.start()
+    registry.get_or_create('dev')  # 心跳
+    assert registry.save_checkpoints() == 0
+    log.stop()
+
+    assert_same_state(restored_registry(path), live)
@@ -0,0 +1,71 @@
+"""设备时钟同步"""
+
+import random
+
+from services.clock_sync import WRAP, ClockSync
+
+SKEW_PPM = 50.0
+
+
+class Device:
+    """模拟设备: millis()按给定漂移走时，样本经过随机网络延迟到达服务器"""
+
+    def __init__(self, start_ms: int, rng: random.Random):
+        self.start_ms = start_ms
+        self.rng = rng
+        self.offset = 1_700_000_000_000.0  # 设备时间0对应的服务器时间
+
+    def millis(self, elapsed_ms: float) -> int:
+        return int(self.start_ms + elapsed_ms) % WRAP
+
+    def received(self, elapsed_ms: float) -> float:
+        delay = 2.0 + self.rng.expovariate(1 / 8.0)  # 最小2ms，长尾抖动
+        return self.offset + (self.start_ms + elapsed_ms) * (1 + SKEW_PPM / 1e6) + delay
+
+
+def test_skew_and_offset_across_millis_wrap():
+    rng = random.Random(7)
+    device = Device(WRAP - 60_000, rng)  # 一分钟后millis()回绕
+    clock = ClockSync(window_ms=300_000)
+    for i in range(2000):
+        elapsed = i * 200.0
+        clock.add(device.millis(elapsed), device.received(elapsed))
+
+    stats = clock.stats()
+    assert stats['synced']
+    assert abs(stats['skew_ppm'] - SKEW_PPM) < 10
+    assert clock.resets == 0
+
+    # 跨回绕的两个事件: 设备时间差10秒，按服务器时钟为10秒 × (1 + 漂移)
+    before = clock.stamp(device.millis(399_000.0 - 10_000))
+    after = clock.stamp(device.millis(399_000.0))
+    assert before[0] == after[0]
+    assert abs(clock.interval(before, after) - 10_000 * (1 + SKEW_PPM / 1e6)) < 0.2
+
+    # 换算为服务器时间的误差不超过最小延迟附近
+    server = clock.to_server(after)
+    truth = device.offset + (device.start_ms + 399_000.0) * (1 + SKEW_PPM / 1e6)
+    assert abs(server - truth) < 5
+
+
+def test_reboot_starts_new_epoch():
+    rng = random.Random(11)
+    device = Device(500_000, rng)
+    clock = ClockSync(window_ms=300_000)
+    for i in range(500):
+        clock.add(device.millis(i * 200.0), device.received(i * 200.0))
+    before = clock.stamp(device.millis(499 * 200.0))
+    epoch = clock.epoch
+
+    # 设备重启: millis()从接近0重新开始，服务器时间继续前进
+    rebooted = Device(0, rng)
+    rebooted.offset = device.received(100_000.0)
+    for i in range(50):
+        clock.add(rebooted.millis(2_000 + i * 200.0), rebooted.received(2_000 + i * 200.0))
+
+    assert clock.resets == 1
+    assert clock.epoch == epoch + 1
+    after = clock.stamp(rebooted.millis(2_000 + 49 * 200.0))
+    assert clock.interval(before, after) is None
+    assert clock.to_server(before) is None
+    assert clock.synced
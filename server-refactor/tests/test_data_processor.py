@@ -0,0 +1,80 @@
+"""二进制数据包的序号检查"""
+
+import asyncio
+
+from services import wire_format
+from services.data_processor import DataProcessor
+from services.wire_format import EVENT_BLOCK
+
+ADDR = ('192.168.1.50', 4210)
+
+
+class Recorder:
+    """记录广播消息的WebSocket管理器替身"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_data(self, message: dict):
+        self.messages.append(message)
+
+
+def make_processor() -> DataProcessor:
+    processor = DataProcessor(Recorder(), device_id='sensor-1')
+    processor.set_monitoring(True)
+    return processor
+
+
+def send(processor: DataProcessor, seq: int, device_ms: int, received_at: int):
+    packet = wire_format.parse(wire_format.pack(1, seq, device_ms, [(EVENT_BLOCK, device_ms, 12000)]))
+    asyncio.run(processor.process_sensor_packet(packet, ADDR, received_at))
+
+
+def laps(processor: DataProcessor) -> int:
+    return sum(message['type'] == 'lap_data' for message in processor.websocket_manager.messages)
+
+
+def test_duplicates_and_reordering_are_dropped():
+    processor = make_processor()
+    send(processor, 10, 50_000, 1_000_000)
+    send(processor, 11, 51_000, 1_001_000)
+    send(processor, 11, 51_000, 1_001_005)  # 重复
+    send(processor, 13, 53_000, 1_003_000)
+    send(processor, 12, 52_000, 1_003_010)  # 乱序到达
+    assert laps(processor) == 2
+    assert processor.rejected_packets == 2
+    assert processor.lost_packets == 1
+    assert processor.restarts == 0
+
+
+def test_reboot_resyncs_sequence():
+    processor = make_processor()
+    for seq in range(1000):
+        send(processor, seq, 10_000 + seq * 1000, 5_000_000 + seq * 1000)
+    assert laps(processor) == 999
+
+    # 重启后序号和设备时间都从0开始
+    for seq in range(50):
+        send(processor, seq, 3_000 + seq * 1000, 7_000_000 + seq * 1000)
+    assert laps(processor) == 999 + 50
+    assert processor.restarts == 1
+    assert processor.rejected_packets == 0
+    assert processor.last_seq == 49
+
+
+def test_quick_reboot_detected_by_device_time():
+    """运行不久就重启时序号回退很小，由设备时间回退判断"""
+    processor = make_processor()
+    for seq in range(5):
+        send(processor, seq, 20_000 + seq * 1000, 1_000_000 + seq * 1000)
+    send(processor, 0, 1_500, 1_010_000)
+    assert processor.restarts == 1
+    assert laps(processor) == 5
+
+
+def test_reset_clears_sequence():
+    processor = make_processor()
+    send(processor, 500, 100_000, 1_000_000)
+    processor.reset_data()
+    assert processor.last_seq is None
+    assert processor.checkpoint()['last_seq'] is None
@@ -0,0 +1,78 @@
+"""会话导出接口"""
+
+import csv
+import io
+import json
+
+import anyio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.concurrency import iterate_in_threadpool
+
+import main
+from services.history import LapHistory
+from services.lap_log import LapLog
+
+LAPS = 2500
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = str(tmp_path / 'laps.db')
+    log = LapLog(path, flush_interval=60)
+    log.start()
+    log.append_session('s1', 'dev', 0)
+    for n in range(1, LAPS + 1):
+        log.append_lap('s1', 'dev', n, 1.0 + n / 1000, n * 1.5, n * 1000, 10.0, 1000.0, 3.0)
+    log.stop()
+
+    monkeypatch.setattr(main, 'lap_history', LapHistory(path))
+    monkeypatch.setattr(main.settings, 'export_batch_size', 50)
+    # 不进入lifespan，不启动UDP采集
+    return TestClient(main.app)
+
+
+def test_csv_export_spans_many_batches(client):
+    response = client.get('/api/sessions/s1/export?format=csv')
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][0] == 'lap_number'
+    assert [int(row[0]) for row in rows[1:]] == list(range(1, LAPS + 1))
+
+
+def test_ndjson_export_with_gzip_and_range(client):
+    response = client.get('/api/sessions/s1/export?format=ndjson&start_lap=150&end_lap=420',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    laps = [json.loads(line) for line in response.text.splitlines()]
+    assert [lap['lap_number'] for lap in laps] == list(range(150, 421))
+
+
+def test_concurrent_exports(client):
+    """StreamingResponse在线程池的任意线程中继续迭代生成器，同一事件循环中的并发导出不能共用连接"""
+    history = main.lap_history
+
+    async def export():
+        count = 0
+        async for rows in iterate_in_threadpool(history.iter_laps('s1', batch_size=50)):
+            count += len(rows)
+        return count
+
+    async def run():
+        results = []
+
+        async def collect():
+            results.append(await export())
+
+        async with anyio.create_task_group() as group:
+            for _ in range(8):
+                group.start_soon(collect)
+        return results
+
+    assert anyio.run(run) == [LAPS] * 8
+
+
+def test_export_errors(client):
+    assert client.get('/api/sessions/missing/export').status_code == 404
+    assert client.get('/api/sessions/s1/export?format=xml').status_code == 400
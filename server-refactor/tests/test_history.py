@@ -0,0 +1,38 @@
+"""历史查询接口"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.history import LapHistory
+
+
+@pytest.fixture
+def missing_db(tmp_path, monkeypatch):
+    """已启用持久化日志，但写入线程还没有创建数据库文件"""
+    path = tmp_path / 'laps.db'
+    monkeypatch.setattr(main, 'lap_history', LapHistory(str(path)))
+    # 不进入lifespan，不启动UDP采集
+    yield TestClient(main.app)
+    assert not path.exists()
+
+
+def test_missing_database_returns_empty_results(missing_db):
+    response = missing_db.get('/api/sessions')
+    assert response.status_code == 200
+    assert response.json() == {'sessions': [], 'next_cursor': None}
+
+    response = missing_db.get('/api/sessions/s1/laps')
+    assert response.status_code == 200
+    assert response.json() == {'session': 's1', 'laps': [], 'next_cursor': None}
+
+    response = missing_db.get('/api/sessions/s1/series?field=speed')
+    assert response.status_code == 200
+    assert response.json()['points'] == []
+    assert missing_db.get('/api/sessions/s1/series?field=bogus').status_code == 400
+
+    assert missing_db.get('/api/sessions/s1/export').status_code == 404
+
+
+def test_missing_database_iter_laps_is_empty(tmp_path):
+    assert list(LapHistory(str(tmp_path / 'laps.db')).iter_laps('s1')) == []
@@ -0,0 +1,34 @@
+"""圈速日志积压上限"""
+
+import sqlite3
+from contextlib import closing
+
+from services.lap_log import LapLog
+
+
+def append_laps(log: LapLog, start: int, count: int):
+    for n in range(start, start + count):
+        log.append_lap('s1', 'dev', n, 1.0, n * 1.0, n * 1000, 10.0, 1000.0, 3.0)
+
+
+def test_pending_is_bounded_while_writer_stalls(tmp_path):
+    log = LapLog(str(tmp_path / 'laps.db'), max_pending=100)
+    # 写入线程未启动，相当于磁盘卡住
+    log.append_session('s1', 'dev', 0)
+    append_laps(log, 1, 150)
+    log.append_event('s1', 'dev', 'reset')
+    log.append_checkpoint('dev', 's1', 150, {'lap_count': 150})
+    assert log.pending == 100 + 1 + 1  # 圈达到上限，会话和检查点不受限制
+    assert log.dropped == 51
+
+    # 写入恢复后继续接收新记录
+    log.start()
+    log.stop()
+    assert log.pending == 0
+    log.start()
+    append_laps(log, 200, 10)
+    log.stop()
+    assert log.dropped == 51
+    with closing(sqlite3.connect(log.path)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM laps").fetchone()[0] == 110
+        assert conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] == 1
@@ -0,0 +1,62 @@
+"""会话流式统计与statistics模块的精确结果对比"""
+
+import random
+import statistics
+
+import pytest
+
+from services.session_stats import RunningStats, SessionStats, TDigest
+
+COUNT = 5000
+
+
+def lap_times(seed: int) -> list:
+    """带长尾的圈用时: 大部分在30秒上下，少数进站/失误圈明显更慢"""
+    rng = random.Random(seed)
+    return [rng.gauss(30.0, 0.8) + (rng.expovariate(1 / 15.0) if rng.random() < 0.05 else 0.0)
+            for _ in range(COUNT)]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_tdigest_quantiles_match_statistics(seed):
+    values = lap_times(seed)
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+
+    exact = statistics.quantiles(values, n=100, method='inclusive')
+    ordered = sorted(values)
+    for percent in (50, 90, 99):
+        estimate = digest.quantile(percent / 100)
+        # 用秩误差衡量: 估计值在样本中的位置与目标分位数相差不超过0.5%
+        rank = sum(value <= estimate for value in ordered) / COUNT
+        assert abs(rank - percent / 100) <= 0.005, (percent, estimate, exact[percent - 1])
+        # 数值上落在相邻百分位之间(长尾处样本稀疏，相对误差没有意义)
+        assert exact[percent - 2] <= estimate <= (exact[percent] if percent < 99 else ordered[-1])
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_running_stats_match_statistics(seed):
+    values = lap_times(seed)
+    stats = RunningStats()
+    for lap_number, value in enumerate(values, 1):
+        stats.add(value, lap_number)
+
+    assert stats.count == COUNT
+    assert stats.mean == pytest.approx(statistics.fmean(values), rel=1e-12)
+    assert stats.m2 / stats.count == pytest.approx(statistics.pvariance(values), rel=1e-9)
+    assert stats.std == pytest.approx(statistics.pstdev(values), rel=1e-9)
+    assert (stats.min, stats.min_lap) == (min(values), values.index(min(values)) + 1)
+    assert (stats.max, stats.max_lap) == (max(values), values.index(max(values)) + 1)
+
+
+def test_session_summary_survives_state_round_trip():
+    values = lap_times(4)
+    stats = SessionStats()
+    for lap_number, value in enumerate(values, 1):
+        stats.add(lap_number, value, 3.6 * 400 / value)
+
+    restored = SessionStats()
+    restored.load_state(stats.to_state())
+    assert restored.summary() == stats.summary()
+    assert stats.summary()['p50'] == pytest.approx(statistics.median(values), rel=0.01)
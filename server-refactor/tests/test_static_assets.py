@@ -0,0 +1,43 @@
+"""静态资源缓存"""
+
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(main.__file__)))  # static目录按相对路径加载
+    main.static_assets.load()
+    # 不进入lifespan，不启动UDP采集
+    return TestClient(main.app)
+
+
+def test_fingerprinted_assets_are_immutable(client):
+    page = client.get('/')
+    assert page.headers['cache-control'] == 'no-cache'
+    app_js = re.search(r'/static/app\.[0-9a-f]+\.js', page.text).group(0)
+    response = client.get(app_js, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['cache-control']
+    assert response.headers['content-encoding'] == 'gzip'
+
+    revalidated = client.get(app_js, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['etag']})
+    assert revalidated.status_code == 304
+    assert client.get('/static/missing.js').status_code == 404
+
+
+def test_head_returns_headers_without_body(client):
+    for path in ('/', '/static/app.js'):
+        get = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        head = client.head(path, headers={'Accept-Encoding': 'gzip'})
+        assert head.status_code == 200
+        assert head.content == b''
+        assert head.headers['etag'] == get.headers['etag']
+        assert head.headers['content-type'] == get.headers['content-type']
+        assert head.headers['content-length'] == get.headers['content-length']
+    assert client.head('/static/missing.js').status_code == 404
@@ -0,0 +1,122 @@
+"""WebSocket广播、应答顺序与断线续传"""
+
+import asyncio
+import json
+
+from services.websocket_manager import ClientConnection, OutboundMessage, WebSocketManager, parse_topics
+
+
+class FakeWebSocket:
+    """记录发送内容的WebSocket替身"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        self.sent.append(json.loads(payload))
+
+    async def send_bytes(self, payload: bytes):
+        raise AssertionError("测试只使用json编码")
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def lap(device: str, number: int) -> dict:
+    return {'type': 'lap_data', 'device': device, 'session': f'{device}-s', 'lap_number': number}
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_reply_does_not_overtake_earlier_broadcasts():
+    async def run():
+        manager = WebSocketManager()
+        await manager.start()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+        for number in range(1, 8):
+            await manager.broadcast(lap('a', number))
+        await manager.send_to(websocket, {'type': 'reset_confirm'})
+        await settle()
+        await manager.stop()
+        return [message['type'] for message in websocket.sent]
+
+    assert asyncio.run(run()) == ['hello'] + ['lap_data'] * 7 + ['reset_confirm']
+
+
+def test_conflate_keeps_replies_and_other_devices():
+    """conflate只替换同一设备的同类旧消息，应答不会被丢弃"""
+    async def run():
+        client = ClientConnection(FakeWebSocket(), queue_size=4, policy='conflate')
+        seq = 0
+        for device in ('a', 'b'):
+            seq += 1
+            client.enqueue(OutboundMessage(seq, lap(device, 1)))
+        client.enqueue(OutboundMessage(None, {'type': 'reset_confirm'}))
+        for number in range(2, 10):
+            seq += 1
+            client.enqueue(OutboundMessage(seq, lap('a', number)))
+        client.enqueue(OutboundMessage(None, {'type': 'current_stats'}))
+        return [(m.message['type'], m.message.get('device'), m.message.get('lap_number')) for m in client.queue]
+
+    queued = asyncio.run(run())
+    assert ('lap_data', 'b', 1) in queued
+    assert ('lap_data', 'a', 9) in queued
+    assert ('reset_confirm', None, None) in queued
+    assert ('current_stats', None, None) in queued
+    assert sum(device == 'a' for _, device, _ in queued) == 1
+
+
+def test_filtered_client_replays_instead_of_snapshot():
+    """缺口中大部分消息被订阅条件过滤时，只要需要补发的消息放得下队列就补发"""
+    async def run():
+        manager = WebSocketManager(queue_size=16, replay_size=1024)
+        await manager.start()
+        for number in range(1, 201):
+            await manager.broadcast(lap('a' if number % 50 else 'b', number))
+        await settle()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, last_seq=0, epoch=manager.epoch,
+                              topics=parse_topics(devices='b'))
+        await settle()
+        await manager.stop()
+        return websocket.sent
+
+    sent = asyncio.run(run())
+    assert sent[0]['type'] == 'hello'
+    assert sent[0]['resume'] == 'replay'
+    assert [message['lap_number'] for message in sent[1:]] == [50, 100, 150, 200]
+
+
+def test_delta_sends_only_changed_summary_fields():
+    """增量lap_data只带summary中变化的字段，不支持增量的客户端仍收到完整摘要"""
+    def lap_with_summary(number: int) -> dict:
+        message = lap('a', number)
+        message['laps_stats'] = {'count': number, 'best': 30.0}
+        message['summary'] = {'laps': number, 'mean': 30.0, 'p50': 30.0}
+        return message
+
+    async def run():
+        manager = WebSocketManager()
+        await manager.start()
+        delta_client, full_client = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(delta_client, delta=True)
+        await manager.connect(full_client)
+        for number in (1, 2):
+            await manager.broadcast(lap_with_summary(number))
+        await settle()
+        await manager.stop()
+        return delta_client.sent[1:], full_client.sent[1:]
+
+    (first, second), full = asyncio.run(run())
+    assert first['summary'] == {'laps': 1, 'mean': 30.0, 'p50': 30.0}
+    assert 'summary' not in second
+    assert second['summary_delta'] == {'laps': 2}
+    assert second['laps_stats_delta'] == {'count': 2}
+    assert [message['summary']['laps'] for message in full] == [1, 2]
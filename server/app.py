@@ -15,9 +15,14 @@ udp_host = os.getenv('UDP_HOST', '0.0.0.0')
 udp_port = int(os.getenv('UDP_PORT', 8888))
 flask_host = os.getenv('FLASK_HOST', '0.0.0.0')
 flask_port = int(os.getenv('FLASK_PORT', 5000))
+# WebSocket批量发送: 时间窗口(毫秒)和单帧最大条数
+ws_flush_interval_ms = float(os.getenv('WS_FLUSH_INTERVAL_MS', 10))
+ws_flush_max_messages = int(os.getenv('WS_FLUSH_MAX_MESSAGES', 32))
 
 # 创建WebSocket服务器实例
-ws_server = WebSocketServer(host=ws_host, port=ws_port)
+ws_server = WebSocketServer(host=ws_host, port=ws_port,
+                            flush_interval=ws_flush_interval_ms / 1000,
+                            flush_max_messages=ws_flush_max_messages)
 
 def udp_data_callback(data):
     """UDP数据回调函数，立即转发给WebSocket"""
@@ -110,7 +110,22 @@ export class WebSocketManager {
             const cleanData = event.data.toString().trim();
             this.debugManager.addDebugInfo(`清理后的数据: "${cleanData}"`);
 
-            const jsonData = JSON.parse(cleanData);
+            const parsed = JSON.parse(cleanData);
+
+            // 服务器可能把一个时间窗口内的多条数据合并为一个数组发送
+            const packets = Array.isArray(parsed) ? parsed : [parsed];
+            packets.forEach(jsonData => this.handlePacket(jsonData));
+
+        } catch (error) {
+            this.debugManager.addDebugInfo(`❌ 解析错误: ${error.message}`);
+        }
+    }
+
+    /**
+     * 处理单条UDP数据
+     */
+    handlePacket(jsonData) {
+        try {
             this.debugManager.addDebugInfo(`解析的JSON对象: ${JSON.stringify(jsonData)}`);
 
             if (!jsonData.data) {
@@ -1,12 +1,19 @@
+import selectors
 import socket
+import struct
+import sys
 import threading
-import json
 import time
 from datetime import datetime
 
+# 内核接收时间戳(Linux)，Python 3.11及以前的socket模块没有导出该常量
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+TIMESPEC = struct.Struct('@ll')  # struct timespec: 秒, 纳秒
+
 
 class UDPServer:
-    def __init__(self, host='0.0.0.0', port=8888, callback=None):
+    def __init__(self, host='0.0.0.0', port=8888, callback=None,
+                 buffer_size=2048, pool_size=64, rcvbuf=1 << 20):
         self.host = host
         self.port = port
         self.callback = callback
@@ -14,45 +21,123 @@ class UDPServer:
         self.running = False
         self.thread = None
 
+        # 预分配的接收缓冲池，一次突发最多连续接收pool_size个数据包后再逐个处理
+        self.buffer_size = buffer_size
+        self.pool = [bytearray(buffer_size) for _ in range(pool_size)]
+        self.views = [memoryview(buffer) for buffer in self.pool]
+        self.rcvbuf = rcvbuf  # 内核接收缓冲区大小，吸收多设备同时发送的突发
+        self.kernel_timestamps = False
+
+        # 统计
+        self.packets = 0
+        self.errors = 0
+        self.truncated = 0
+        self.max_batch = 0
+
     def start(self):
         """启动UDP服务器"""
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except OSError as e:
+            print(f"设置UDP接收缓冲区失败: {e}")
+        if SO_TIMESTAMPNS is not None and hasattr(self.socket, 'recvmsg_into'):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+                self.kernel_timestamps = True
+            except OSError:
+                pass
         self.socket.bind((self.host, self.port))
+        self.socket.setblocking(False)
         self.running = True
 
         self.thread = threading.Thread(target=self._listen)
         self.thread.daemon = True
         self.thread.start()
 
-        print(f"UDP服务器启动在 {self.host}:{self.port}")
+        print(f"UDP服务器启动在 {self.host}:{self.port}"
+              f"{' (内核接收时间戳)' if self.kernel_timestamps else ''}")
 
     def stop(self):
         """停止UDP服务器"""
         self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
         if self.socket:
             self.socket.close()
         print("UDP服务器已停止")
 
+    def _receive(self, index):
+        """
+        接收一个数据包到缓冲池的第index个缓冲区
+        return: (长度, 地址, 接收时间ns)，没有数据时抛出BlockingIOError
+        """
+        if self.kernel_timestamps:
+            size, ancdata, flags, addr = self.socket.recvmsg_into(
+                [self.pool[index]], socket.CMSG_SPACE(TIMESPEC.size))
+            received_ns = None
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+                    seconds, nanoseconds = TIMESPEC.unpack_from(data)
+                    received_ns = seconds * 1_000_000_000 + nanoseconds
+            if flags & socket.MSG_TRUNC:
+                self.truncated += 1
+            return size, addr, received_ns if received_ns is not None else time.time_ns()
+
+        size, addr = self.socket.recvfrom_into(self.pool[index])
+        return size, addr, time.time_ns()
+
     def _listen(self):
-        """监听UDP数据"""
-        while self.running:
-            try:
-                data, addr = self.socket.recvfrom(1024)
-                timestamp = datetime.now().isoformat()
-
-                # 构造数据包
-                packet = {
-                    'data': data.decode('utf-8', errors='ignore'),
-                    'from': f"{addr[0]}:{addr[1]}",
-                    'timestamp': timestamp,
-                    'size': len(data)
-                }
-
-                # 如果有回调函数，立即调用
-                if self.callback:
-                    self.callback(packet)
-
-            except Exception as e:
-                if self.running:
-                    print(f"UDP接收错误: {e}")
-                break
\ No newline at end of file
+        """监听UDP数据：等待可读后连续接收直到内核队列为空或缓冲池用完，再逐个回调"""
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        batch = []
+        try:
+            while self.running:
+                if not selector.select(timeout=0.5):
+                    continue
+
+                batch.clear()
+                while len(batch) < len(self.pool):
+                    try:
+                        batch.append(self._receive(len(batch)))
+                    except BlockingIOError:
+                        break
+                    except OSError as e:
+                        # 单个数据包出错(如ICMP端口不可达)不影响后续接收
+                        self._report_error("UDP接收错误", e)
+                        break
+                if len(batch) > self.max_batch:
+                    self.max_batch = len(batch)
+
+                for index, (size, addr, received_ns) in enumerate(batch):
+                    self.packets += 1
+                    try:
+                        self._dispatch(self.views[index][:size], addr, received_ns)
+                    except Exception as e:
+                        self._report_error("UDP数据处理错误", e)
+        except Exception as e:
+            if self.running:
+                print(f"UDP接收线程异常退出: {e}")
+        finally:
+            selector.close()
+
+    def _dispatch(self, view, addr, received_ns):
+        """构造数据包并调用回调"""
+        if not self.callback:
+            return
+        seconds, nanoseconds = divmod(received_ns, 1_000_000_000)
+        packet = {
+            'data': str(view, 'utf-8', 'ignore'),
+            'from': f"{addr[0]}:{addr[1]}",
+            'timestamp': datetime.fromtimestamp(seconds).replace(microsecond=nanoseconds // 1000).isoformat(),
+            'timestamp_ns': received_ns,  # 接收时间(内核时间戳，不可用时为用户态时间)
+            'size': len(view)
+        }
+        self.callback(packet)
+
+    def _report_error(self, message, error):
+        """记录错误，持续出错时限频输出"""
+        self.errors += 1
+        if self.errors % 100 == 1:
+            print(f"{message}: {error} (累计错误: {self.errors})")
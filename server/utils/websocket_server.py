@@ -2,17 +2,28 @@ import asyncio
 import websockets
 import json
 import threading
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 
 
 class WebSocketServer:
-    def __init__(self, host='0.0.0.0', port=8080):
+    def __init__(self, host='0.0.0.0', port=8080, flush_interval=0.01, flush_max_messages=32):
         self.host = host
         self.port = port
         self.clients = set()
         self.loop = None
         self.server = None
 
+        # UDP线程写入的待发送数据，由事件循环按时间窗口或条数批量发送
+        self.flush_interval = flush_interval  # 批量发送时间窗口(秒)
+        self.flush_max_messages = flush_max_messages  # 达到该条数时立即发送
+        self.pending = deque()
+        self._flush_scheduled = False
+        self._flush_requested = False
+        self._flush_timer = None
+        self.frames_sent = 0
+        self.messages_sent = 0
+
     async def register(self, websocket):
         """注册客户端"""
         self.clients.add(websocket)
@@ -60,13 +71,40 @@ class WebSocketServer:
             await self.unregister(websocket)
 
     def send_udp_data(self, data):
-        """接收UDP数据并立即广播"""
-        if self.loop and not self.loop.is_closed():
-            # 线程安全地调度协程
-            asyncio.run_coroutine_threadsafe(
-                self.broadcast(json.dumps(data)),
-                self.loop
-            )
+        """接收UDP数据（在UDP线程中调用），放入待发送缓冲，每个时间窗口只唤醒一次事件循环"""
+        if not self.loop or self.loop.is_closed():
+            return
+        self.pending.append(data)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon_threadsafe(self._start_flush_timer)
+        elif len(self.pending) >= self.flush_max_messages and not self._flush_requested:
+            self._flush_requested = True
+            self.loop.call_soon_threadsafe(self._flush)
+
+    def _start_flush_timer(self):
+        """开始批量发送时间窗口"""
+        self._flush_timer = self.loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        """
+        把缓冲中的数据合并为一帧发给所有客户端
+        只有一条数据时发送JSON对象（与逐条发送的格式相同），多条时发送JSON数组
+        """
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        # 先清除标记再取数据，取数据期间到达的新数据会触发下一次发送
+        self._flush_scheduled = False
+        self._flush_requested = False
+
+        batch = [self.pending.popleft() for _ in range(len(self.pending))]
+        if not batch or not self.clients:
+            return
+        frame = json.dumps(batch[0] if len(batch) == 1 else batch)
+        websockets.broadcast(self.clients, frame)
+        self.frames_sent += 1
+        self.messages_sent += len(batch)
 
     async def start_server(self):
         """启动WebSocket服务器"""